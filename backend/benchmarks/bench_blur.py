@@ -0,0 +1,84 @@
+"""
+Benchmark the obscuring engine against the full resolution Gaussian blur
+
+Usage (from the backend directory):
+    python benchmarks/bench_blur.py [--repeat N]
+
+For every image size and blur severity from ImageContentFilter.blur_settings
+this prints the median time of each method and the mean absolute pixel
+difference from the reference Gaussian blur (0-255 scale).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_rendering import BLUR_METHODS, obscure_image
+
+# Same levels as ImageContentFilter.blur_settings
+BLUR_SETTINGS = {
+    "unsafe": 30,
+    "questionable": 15,
+    "potentially_concerning": 8
+}
+
+IMAGE_SIZES = [(640, 480), (1280, 720), (1920, 1080), (4032, 3024)]
+
+
+def make_test_image(width, height, seed=0):
+    """Build a photo-like test image: smooth gradients plus noise and hard edges"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        127 + 100 * np.sin(x / 37.0),
+        127 + 100 * np.cos(y / 53.0),
+        127 + 100 * np.sin((x + y) / 71.0)
+    ], axis=-1)
+    base[(x // 64 + y // 64) % 2 == 0] *= 0.6
+    base += rng.normal(0, 20, base.shape)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+
+def time_method(image, radius, method, repeat):
+    """Return (median seconds, result image) for one method"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = obscure_image(image, radius, method=method)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    header = f"{'size':>11} {'level':>22} {'method':>11} {'ms':>9} {'speedup':>8} {'mean diff':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for width, height in IMAGE_SIZES:
+        image = make_test_image(width, height)
+        for level, radius in BLUR_SETTINGS.items():
+            reference_time, reference = time_method(image, radius, "gaussian", args.repeat)
+            reference_pixels = np.asarray(reference, dtype=np.int16)
+
+            for method in BLUR_METHODS:
+                if method == "gaussian":
+                    elapsed, diff = reference_time, 0.0
+                else:
+                    elapsed, result = time_method(image, radius, method, args.repeat)
+                    diff = float(np.abs(np.asarray(result, dtype=np.int16) - reference_pixels).mean())
+                print(f"{width}x{height:<6} {level:>22} {method:>11} {elapsed * 1000:9.1f} "
+                      f"{reference_time / elapsed:7.1f}x {diff:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark per-span Fernet encryption against one envelope per request
+
+Usage (from the backend directory):
+    python benchmarks/bench_envelope.py [--repeat N]
+
+For growing numbers of redacted spans, prints the time to encrypt them one
+Fernet token each (ENCRYPTION_MODE=item) and in one envelope
+(ENCRYPTION_MODE=envelope), the size of the encrypted data as JSON, and the
+time to decrypt a single span from the envelope.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envelope_encryption import open_spans, seal_spans
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is reported)")
+    args = parser.parse_args()
+    rng = random.Random(0)
+    cipher = Fernet(Fernet.generate_key())
+
+    header = f"{'spans':>6} {'item ms':>9} {'envelope ms':>12} {'item bytes':>11} {'envelope bytes':>15} {'open 1 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for count in [1, 10, 100, 1000]:
+        # Mix of short PII items and flagged words with a few sentences
+        spans = [
+            "".join(rng.choices(string.ascii_letters + string.digits, k=rng.choice([8, 12, 16, 60])))
+            for _ in range(count)
+        ]
+        item_time, tokens = best_of(lambda: [cipher.encrypt(span.encode()).decode() for span in spans], args.repeat)
+        envelope_time, envelope = best_of(lambda: seal_spans(spans, cipher), args.repeat)
+        open_time, opened = best_of(lambda: open_spans(envelope, cipher, [count - 1]), args.repeat)
+        assert opened[count - 1] == spans[-1]
+        print(f"{count:6d} {item_time * 1000:9.2f} {envelope_time * 1000:12.2f} "
+              f"{len(json.dumps(tokens)):11d} {len(json.dumps(envelope)):15d} {open_time * 1000:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
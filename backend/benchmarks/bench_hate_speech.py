@@ -0,0 +1,105 @@
+"""
+Fuzz and benchmark the hate speech phrase matcher against the old regexes
+
+Usage (from the backend directory):
+    python benchmarks/bench_hate_speech.py [--fuzz N] [--seed S] [--budget SECONDS]
+
+First, random sentences over the phrase vocabulary are checked against the
+old backtracking patterns: both must agree on whether a sentence is hate
+speech. Then adversarial inputs (long unpunctuated runs of quantifiers and
+group nouns that never complete a phrase) of growing length are timed with
+both. The matcher's time per 1000 tokens stays flat; the old patterns grow
+polynomially and are no longer run once one input takes over --budget.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hate_speech import TOKEN_CLASSES, PhraseMatcher
+
+# The regexes the phrase matcher replaced
+OLD_PATTERNS = [re.compile(pattern) for pattern in [
+    r'\b(?:kill|eliminate|destroy|murder|slaughter|genocide)\s+(?:all|every|each)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
+    r'\b(?:death|die|eliminate|exterminate)\s+to\s+(?:all|every)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
+    r'\b(?:all|every|those)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\s+(?:are|is)\s+(?:animals|vermin|cockroaches|rats|trash|garbage)\b',
+    r'\b(?:we|they|people|everyone)\s+should\s+(?:kill|eliminate|eradicate|remove|cleanse)\s+(?:all|every|the|those)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
+    r'\b(?:hate|despise|loathe)\s+(?:all|every|those|these)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
+    r'\b(?:all|every|each)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\s+(?:should|must|need to)\s+(?:be|get)\s+(?:banned|deported|removed|eliminated|killed)\b',
+]]
+
+VOCABULARY = sorted(set().union(*TOKEN_CLASSES.values()) | {
+    "to", "should", "must", "need", "be", "get", "are", "is", "the", "those", "these",
+    "quiet", "neighbours", "today", "and", ",", "."
+})
+
+# Inputs that keep many partial matches alive without completing any
+ADVERSARIAL = {
+    "quantifier runs": "all people all people ",
+    "open gaps": "kill all hate those ",
+    "near misses": "all every those people are ",
+}
+
+SIZES = [250, 500, 1000, 2000, 4000, 8000, 16000]
+
+
+def old_search(text):
+    lowered = text.lower()
+    return any(pattern.search(lowered) for pattern in OLD_PATTERNS)
+
+
+def fuzz(matcher, count, rng):
+    """Return the sentences where the matcher and the old patterns disagree"""
+    disagreements = []
+    for _ in range(count):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(1, 12))]
+        sentence = " ".join(words).replace(" ,", ",").replace(" .", ".")
+        if (matcher.search(sentence) is not None) != old_search(sentence):
+            disagreements.append(sentence)
+    return disagreements
+
+
+def timed(function, text):
+    start = time.perf_counter()
+    function(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=20000, help="random sentences compared with the old patterns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds after which the old patterns are skipped")
+    args = parser.parse_args()
+
+    matcher = PhraseMatcher()
+    disagreements = fuzz(matcher, args.fuzz, random.Random(args.seed))
+    print(f"fuzz: {args.fuzz} sentences, {len(disagreements)} disagreements with the old patterns")
+    for sentence in disagreements[:10]:
+        print(f"  {sentence!r}")
+
+    header = f"{'input':>16} {'tokens':>7} {'matcher ms':>11} {'ms/1k tokens':>13} {'old regex ms':>13}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for name, unit in ADVERSARIAL.items():
+        old_skipped = False
+        for size in SIZES:
+            words = unit.split()
+            text = " ".join(words[i % len(words)] for i in range(size))
+            elapsed = timed(lambda text: list(matcher.finditer(text)), text)
+            if old_skipped:
+                old = "skipped"
+            else:
+                old_elapsed = timed(old_search, text)
+                old = f"{old_elapsed * 1000:.1f}"
+                old_skipped = old_elapsed > args.budget
+            print(f"{name:>16} {size:7d} {elapsed * 1000:11.1f} {elapsed * 1e6 / size:13.2f} {old:>13}")
+
+
+if __name__ == "__main__":
+    main()
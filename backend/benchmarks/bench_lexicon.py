@@ -0,0 +1,115 @@
+"""
+Benchmark the exact and fuzzy profanity lexicons
+
+Usage (from the backend directory):
+    python benchmarks/bench_lexicon.py [--words N] [--repeat N]
+
+Prints the throughput of normalization, the exact Lexicon and the fuzzy
+lexicon on generated comments with a few misspelled slurs, then the cost of
+one fuzzy lookup as the lexicon grows, next to a linear scan of the lexicon
+with the same distance function. The deletion index stays flat; the scan
+grows with the lexicon.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_lexicon import FuzzyLexicon, edit_limit, obfuscation_distance, parse_edit_limits
+from text_normalization import Lexicon, load_word_lists, normalize
+
+LEXICON_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profanity_words.json")
+CATEGORIES = ["sexual_vulgar", "abusive_insults", "obfuscated_variants"]
+LIMITS = parse_edit_limits("6:1,9:2")
+
+FILLER = ("the quick brown fox jumps over lazy dog today people said that this was really "
+          "good and then everyone went home after watching the match together").split()
+
+
+def misspell(word, rng):
+    """Apply one insertion, deletion or transposition"""
+    position = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(["insert", "delete", "swap"])
+    if kind == "insert":
+        return word[:position] + word[position] + word[position:]
+    if kind == "delete":
+        return word[:position] + word[position + 1:]
+    return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+
+
+def make_text(words, lexicon_words, rng):
+    tokens = [rng.choice(FILLER) for _ in range(words)]
+    long_words = [word for word in lexicon_words if len(word) >= 6 and word.isalpha()]
+    for index in rng.sample(range(words), max(1, words // 50)):
+        tokens[index] = misspell(rng.choice(long_words), rng)
+    return " ".join(tokens)
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def linear_lookup(words, token):
+    for word in words:
+        limit = edit_limit(LIMITS, len(word))
+        if limit and word[0] == token[0] and obfuscation_distance(token, word, limit) <= limit:
+            return word
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=20000, help="words in the generated text")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is reported)")
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    exact = Lexicon(word for words in load_word_lists(LEXICON_FILE, CATEGORIES).values() for word in words)
+    fuzzy = FuzzyLexicon(exact.words, LIMITS)
+    text = make_text(args.words, exact.words, rng)
+    megabytes = len(text.encode()) / 1e6
+
+    normalize_time, normalized = best_of(lambda: normalize(text), args.repeat)
+    exact_time, exact_spans = best_of(lambda: set(exact.finditer(normalized)), args.repeat)
+    fuzzy_time, fuzzy_hits = best_of(lambda: list(fuzzy.finditer(normalized, exclude=exact_spans)), args.repeat)
+
+    print(f"text: {args.words} words, {megabytes:.2f} MB, {len(exact.words)} lexicon words")
+    header = f"{'stage':>10} {'ms':>8} {'MB/s':>8} {'matches':>8}"
+    print(header)
+    print("-" * len(header))
+    print(f"{'normalize':>10} {normalize_time * 1000:8.1f} {megabytes / normalize_time:8.1f} {'':>8}")
+    print(f"{'exact':>10} {exact_time * 1000:8.1f} {megabytes / exact_time:8.1f} {len(exact_spans):8d}")
+    print(f"{'fuzzy':>10} {fuzzy_time * 1000:8.1f} {megabytes / fuzzy_time:8.1f} {len(fuzzy_hits):8d}")
+
+    print()
+    header = f"{'lexicon':>8} {'index us/lookup':>16} {'linear us/lookup':>17}"
+    print(header)
+    print("-" * len(header))
+    tokens = [misspell(rng.choice([w for w in exact.words if len(w) >= 6 and w.isalpha()]), rng) for _ in range(200)]
+    tokens += [rng.choice(FILLER) for _ in range(800)]
+    for size in [100, 1000, 10000, 100000]:
+        words = list(exact.words) + [
+            rng.choice(string.ascii_lowercase) + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 11)))
+            for _ in range(size - len(exact.words))
+        ]
+        index = FuzzyLexicon(words, LIMITS)
+        index_time, _ = best_of(lambda: [index.lookup(token) for token in tokens], args.repeat)
+        if size <= 10000:
+            linear_time, _ = best_of(lambda: [linear_lookup(words, token) for token in tokens], 1)
+            linear = f"{linear_time * 1e6 / len(tokens):17.1f}"
+        else:
+            linear = f"{'skipped':>17}"
+        print(f"{size:8d} {index_time * 1e6 / len(tokens):16.1f} {linear}")
+
+
+if __name__ == "__main__":
+    main()
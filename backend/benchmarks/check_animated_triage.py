@@ -0,0 +1,71 @@
+"""
+Check that local triage never skips Vision for animations with content
+after a blank first frame
+
+Usage (from the backend directory):
+    python benchmarks/check_animated_triage.py
+
+Builds GIFs whose first frame is black or transparent and whose later
+frames have content (at normal and at thumbnail size), and GIFs that are
+blank throughout, then prints the triage decision for each and exits
+non-zero if any decision is wrong.
+"""
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_frames import FrameSampler
+from image_triage import ImageTriage
+
+
+def make_gif(size, first, later, frames=12):
+    """GIF with a first frame of one kind and later frames of another"""
+    rng = np.random.default_rng(0)
+
+    def frame(kind):
+        if kind == "black":
+            return Image.new("RGB", (size, size), (0, 0, 0))
+        if kind == "transparent":
+            return Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        if kind == "skin":
+            # Skin tones with some shading
+            shading = rng.integers(-12, 12, (size, size, 1))
+            return Image.fromarray(np.clip(np.array([224, 172, 140]) + shading, 0, 255).astype(np.uint8))
+        return Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+
+    images = [frame(first)] + [frame(later) for _ in range(frames - 1)]
+    output = io.BytesIO()
+    images[0].save(output, "GIF", save_all=True, append_images=images[1:], duration=50, loop=0, disposal=2)
+    return output.getvalue()
+
+
+def main():
+    triage = ImageTriage()
+    sampler = FrameSampler()
+    cases = [
+        # (description, gif, whether triage may skip Vision)
+        ("black first frame, noisy frames after", make_gif(120, "black", "noise"), False),
+        ("transparent first frame, noisy frames after", make_gif(120, "transparent", "noise"), False),
+        ("tiny, black first frame, skin-toned frames after", make_gif(32, "black", "skin"), False),
+        ("black throughout", make_gif(120, "black", "black"), True),
+    ]
+    failures = 0
+    for description, content, may_skip in cases:
+        first_frame = triage.triage(content)
+        frames = sampler.sample(Image.open(io.BytesIO(content)))
+        decision = triage.triage_frames(frames)
+        ok = (decision is not None) == may_skip
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':>4}  {description}: first frame "
+              f"{first_frame['reason'] if first_frame else 'vision'}, sampled frames "
+              f"{decision['reason'] if decision else 'vision'} ({len(frames)} frames)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
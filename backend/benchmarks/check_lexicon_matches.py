@@ -0,0 +1,57 @@
+"""
+Check what the local profanity detection flags on known sentences
+
+Usage (from the backend directory):
+    python benchmarks/check_lexicon_matches.py
+
+Runs detect_hate_speech_profanity over ordinary sentences that look like
+lexicon words after normalization (numbers read as leetspeak) or are a
+letter away from one (country names), and over obfuscated and misspelled
+profanity, prints the outcome of each and exits non-zero if
+any ordinary sentence is flagged or any profanity is missed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_content_filteration import detect_hate_speech_profanity
+
+# Sentences that must not be flagged
+ORDINARY = [
+    "Flight 455 departs at 9.",
+    "Room A55 is on the second floor.",
+    "Call 4455 or 44455 for the front desk.",
+    "The order number is 4555-1337.",
+    "China is a big country.",
+    "Niger borders Nigeria.",
+    "That is haram for them.",
+    "Meri kamna puri ho gayi.",
+    "The chudail in the story lives in a tree.",
+]
+
+# Sentences that must be flagged
+PROFANE = [
+    "you are a sh1t",
+    "what an a55hole",
+    "b1tch please",
+    "5h1t happens",
+    "you are a chutya",
+    "what a bastrad",
+    "fukcing idiot",
+]
+
+
+def main():
+    failures = 0
+    for sentences, expected in ((ORDINARY, False), (PROFANE, True)):
+        for sentence in sentences:
+            results = detect_hate_speech_profanity(sentence)
+            ok = results["profanity"] == expected
+            failures += not ok
+            print(f"{'ok' if ok else 'FAIL':>4}  {sentence!r}: flagged {results['flagged_words']}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Check that local triage only skips Vision for solid placeholders, not for
+large pages with a little text
+
+Usage (from the backend directory):
+    python benchmarks/check_solid_triage.py
+
+Builds large white pages with a single line of PII text (PNG and JPEG)
+and solid placeholders, then prints the triage decision for each and exits
+non-zero if any decision is wrong.
+"""
+import io
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_triage import ImageTriage
+
+PII_LINE = "Aadhaar 1234 5678 9012  Phone +91 98765 43210  Email ravi.kumar@example.com"
+
+
+def make_image(size, image_format, color=(255, 255, 255), text_size=None):
+    """Solid image, with one line of black text when text_size is given"""
+    image = Image.new("RGB", size, color)
+    if text_size:
+        font = ImageFont.load_default(size=text_size)
+        ImageDraw.Draw(image).text((100, size[1] // 2), PII_LINE, fill=(0, 0, 0), font=font)
+    output = io.BytesIO()
+    image.save(output, image_format)
+    return output.getvalue()
+
+
+def main():
+    triage = ImageTriage()
+    cases = [
+        # (description, image, whether triage may skip Vision)
+        ("3000x2000 PNG, one 24px line of PII", make_image((3000, 2000), "PNG", text_size=24), False),
+        ("3000x2000 JPEG, one 24px line of PII", make_image((3000, 2000), "JPEG", text_size=24), False),
+        ("4000x3000 PNG, one 14px line of PII", make_image((4000, 3000), "PNG", text_size=14), False),
+        ("3000x2000 white PNG", make_image((3000, 2000), "PNG"), True),
+        ("1200x800 grey JPEG", make_image((1200, 800), "JPEG", color=(128, 128, 128)), True),
+    ]
+    failures = 0
+    for description, content, may_skip in cases:
+        start = time.perf_counter()
+        decision = triage.triage(content)
+        elapsed = time.perf_counter() - start
+        ok = (decision is not None) == may_skip
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':>4}  {description} ({len(content)} bytes): "
+              f"{decision['reason'] if decision else 'vision'} in {elapsed * 1000:.1f} ms")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
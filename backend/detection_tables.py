@@ -0,0 +1,240 @@
+"""
+Precompiled detection tables for the local text filter
+
+    python detection_tables.py build [--output PATH]
+
+builds the phrase matcher, the profanity lexicons with their fuzzy indexes
+and the PII patterns from the sources in text_content_filteration.py and
+profanity_words.json, and writes them to a versioned artifact. Workers
+started with DETECTION_ARTIFACT pointing at it load it instead of building
+the tables, and load it again when a new one replaces it.
+
+The tables are pickled, and unpickling runs code named by the file: the
+artifact and the directory it is in must be as trusted as the code itself.
+"""
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import struct
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Bump when the classes pickled in the artifact change, so artifacts built by
+# older code are rebuilt instead of loaded
+ARTIFACT_FORMAT = 6
+
+_MAGIC = b"SOCIODT\0"
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+class DetectionTables:
+    """Everything the local text detection compiles before it can run"""
+
+    def __init__(self, hate_speech_matcher, profanity_lexicons, fuzzy_profanity, pii_regexes):
+        """
+        Args:
+            hate_speech_matcher (PhraseMatcher): Hate speech phrases
+            profanity_lexicons (dict): script -> Lexicon
+            fuzzy_profanity (dict): script -> FuzzyLexicon
+            pii_regexes (dict): category -> list of compiled patterns
+        """
+        self.hate_speech_matcher = hate_speech_matcher
+        self.profanity_lexicons = profanity_lexicons
+        self.fuzzy_profanity = fuzzy_profanity
+        self.pii_regexes = pii_regexes
+        # Set from the artifact header, or "built" for tables built in process
+        self.version = "built"
+
+
+def save_artifact(tables, path):
+    """
+    Write tables to an artifact atomically, so loading workers never see a
+    partial file
+
+    Returns:
+        str: The version of the artifact (a digest of its contents)
+    """
+    payload = pickle.dumps(tables, protocol=pickle.HIGHEST_PROTOCOL)
+    digest = hashlib.sha256(payload).hexdigest()
+    header = json.dumps({
+        "format": ARTIFACT_FORMAT,
+        "version": digest[:16],
+        "sha256": digest,
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": "%d.%d" % sys.version_info[:2],
+    }).encode()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(_MAGIC + _HEADER_LENGTH.pack(len(header)) + header + payload)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return json.loads(header)["version"]
+
+
+def load_artifact(path):
+    """
+    Load tables from an artifact
+
+    The payload is only unpickled once its SHA-256 matches the header, so a
+    truncated or partly copied file is rejected rather than loaded. This
+    catches accidents, not tampering: whoever can write the artifact can
+    also write a matching header.
+
+    Raises:
+        ValueError: If the file is not an artifact of this ARTIFACT_FORMAT or
+            its payload does not match its digest
+
+    Returns:
+        DetectionTables: The tables, with the version of the artifact
+    """
+    with open(path, "rb") as artifact_file:
+        data = artifact_file.read()
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError(f"{path} is not a detection tables artifact")
+    offset = len(_MAGIC) + _HEADER_LENGTH.size
+    (header_length,) = _HEADER_LENGTH.unpack_from(data, len(_MAGIC))
+    header = json.loads(data[offset:offset + header_length])
+    if header.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} has format {header.get('format')}, expected {ARTIFACT_FORMAT}")
+    with memoryview(data)[offset + header_length:] as payload:
+        if hashlib.sha256(payload).hexdigest() != header.get("sha256"):
+            raise ValueError(f"{path} does not match its digest")
+        tables = pickle.loads(payload)
+    tables.version = header["version"]
+    return tables
+
+
+class TablesSource:
+    """
+    The current detection tables: loaded from an artifact when one is
+    configured (and reloaded when it is replaced), built in process otherwise
+    """
+
+    def __init__(self, build, artifact_path=None, check_seconds=5.0):
+        """
+        Args:
+            build (callable): Builds DetectionTables from the sources
+            artifact_path (str): Artifact to load and watch, or None to build
+            check_seconds (float): Minimum time between checks of the artifact
+        """
+        self._build = build
+        self.artifact_path = artifact_path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._stat = None
+        self._checked = time.monotonic()
+        self._tables = self._load() if artifact_path else None
+        if self._tables is None:
+            self._tables = build()
+
+    @classmethod
+    def from_env(cls, build):
+        """Source configured by DETECTION_ARTIFACT / DETECTION_ARTIFACT_CHECK_SECONDS"""
+        return cls(
+            build,
+            os.getenv("DETECTION_ARTIFACT") or None,
+            float(os.getenv("DETECTION_ARTIFACT_CHECK_SECONDS", 5))
+        )
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.artifact_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _load(self):
+        """Load and verify the artifact; None (and the error logged) if it cannot be"""
+        self._stat = self._file_stat()
+        if self._stat is None:
+            logger.warning(f"Detection artifact {self.artifact_path} not found, building the tables")
+            return None
+        start = time.perf_counter()
+        try:
+            tables = load_artifact(self.artifact_path)
+        except Exception as e:
+            logger.error(f"Could not load detection artifact {self.artifact_path}: {e}")
+            return None
+        logger.info(
+            f"Loaded detection artifact {self.artifact_path} version {tables.version} "
+            f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return tables
+
+    def get(self):
+        """
+        Returns:
+            DetectionTables: The current tables, reloaded first if the
+                artifact was replaced since the last check
+        """
+        if self.artifact_path and time.monotonic() - self._checked >= self.check_seconds:
+            # One thread checks and reloads; the others keep the current tables
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._checked = time.monotonic()
+                    if self._file_stat() not in (None, self._stat):
+                        tables = self._load()
+                        if tables is not None:
+                            self._tables = tables
+                finally:
+                    self._lock.release()
+        return self._tables
+
+
+def _time_fresh_load(path):
+    """Seconds to load an artifact in a new interpreter, with no regex cached"""
+    code = (
+        "import sys, time\n"
+        "from detection_tables import load_artifact\n"
+        "start = time.perf_counter()\n"
+        "load_artifact(sys.argv[1])\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code, os.path.abspath(path)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_command = subcommands.add_parser("build", help="build the tables and write the artifact")
+    build_command.add_argument(
+        "--output", default=os.getenv("DETECTION_ARTIFACT") or "detection_tables.bin",
+        help="artifact path (default: DETECTION_ARTIFACT or detection_tables.bin)"
+    )
+    args = parser.parse_args()
+
+    from text_content_filteration import build_detection_tables
+    # Importing the module built the tables once already: clear the regex
+    # cache so both timings compile their patterns, as a new worker would
+    re.purge()
+    start = time.perf_counter()
+    tables = build_detection_tables()
+    built = time.perf_counter() - start
+    version = save_artifact(tables, args.output)
+    loaded = _time_fresh_load(args.output)
+    print(f"Wrote {args.output} version {version} ({os.path.getsize(args.output)} bytes): "
+          f"built in {built * 1000:.1f} ms, loads in {loaded * 1000:.1f} ms in a fresh process")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,208 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Request, Response, g, request, jsonify, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import base64
 from io import BytesIO
-from PIL import Image
 import json
 import traceback
-from text_content_filteration import detect_content, process_text
-from image_filteration import ImageContentFilter
+from metrics import registry, render_prometheus, stage_timer
+from subsystems import Subsystem, SubsystemUnavailable
+from request_profiling import PROFILE_TOKEN, RequestProfile, profile_ring, profiling_authorized
+from sampling_profiler import StackSampler
+from image_limits import (
+    MAX_IMAGE_BYTES, MAX_REQUEST_BYTES, PAYLOAD_REJECTIONS, PayloadTooLarge,
+    max_base64_length, probe_image, read_limited, reject
+)
 from flask_cors import CORS
 
-app = Flask(__name__)
-# Enable CORS for all routes and all origins
-CORS(app)
+class LimitedRequest(Request):
+    # Largest non-file form field kept in memory: the base64 image_data field
+    # plus room for a data URL prefix
+    max_form_memory_size = max_base64_length(MAX_IMAGE_BYTES) + 1024
 
-# Initialize the image content filter
-image_filter = ImageContentFilter()
+api = Blueprint('api', __name__)
 
-@app.route('/health', methods=['GET'])
+def _load_text_filter():
+    import text_content_filteration
+    return text_content_filteration
+
+def _create_image_filter():
+    from image_filteration import ImageContentFilter
+    return ImageContentFilter()
+
+# Text and image filtering are initialized independently on first use, in
+# the worker process: missing Vision credentials only take the image
+# endpoints down, the Vision client is never shared across a fork, and
+# FILTER_SUBSYSTEMS can restrict a server to one workload
+text_subsystem = Subsystem('text', _load_text_filter)
+image_subsystem = Subsystem('image', _create_image_filter)
+SUBSYSTEMS = (text_subsystem, image_subsystem)
+
+PAYLOAD_BYTES = registry.histogram(
+    'filter_payload_bytes',
+    'Size of the text or decoded image submitted for filtering',
+    ('endpoint',),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+ERRORS = registry.counter(
+    'filter_errors_total',
+    'Requests that failed, by endpoint and error type',
+    ('endpoint', 'type')
+)
+
+def _count_error(e):
+    ERRORS.inc(endpoint=request.endpoint or 'unknown', type=type(e).__name__)
+
+# Errors answered by the error handlers rather than the endpoints' generic 500
+_HANDLED_ERRORS = (PayloadTooLarge, RequestEntityTooLarge, SubsystemUnavailable)
+
+def get_image_filter():
+    """Return the image content filter, creating it on first use"""
+    return image_subsystem.get()
+
+def warm_up():
+    """
+    Import the enabled filters and build their compiled patterns and policies
+
+    Called in the gunicorn master when the app is preloaded (see
+    gunicorn.conf.py) so that forked workers share the result copy-on-write.
+    Network clients are not created here.
+    """
+    if text_subsystem.enabled:
+        text_subsystem.get()
+    if image_subsystem.enabled:
+        import image_filteration
+        from image_policy import default_policy
+        default_policy()
+
+def create_app():
+    """Create the filtration server app"""
+    app = Flask(__name__)
+    app.request_class = LimitedRequest
+    # Bodies over this are rejected with a 413 while being streamed in
+    app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+    # Enable CORS for all routes and all origins
+    CORS(app)
+    app.register_blueprint(api)
+    return app
+
+# Samples the stacks of every worker thread (see GET /debug/profile)
+sampler = StackSampler.from_env()
+
+# Endpoints that can be profiled per request
+PROFILED_ENDPOINTS = {'api.filter_text', 'api.filter_image', 'api.render_image'}
+
+# Output formats supported by the render endpoint
+RENDER_MIMETYPES = {
+    'jpeg': 'image/jpeg',
+    'png': 'image/png'
+}
+
+@api.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """Request body or form field over the byte budget"""
+    PAYLOAD_REJECTIONS.inc(reason='request_bytes')
+    _count_error(e)
+    return jsonify({'error': 'Request too large'}), 413
+
+@api.app_errorhandler(PayloadTooLarge)
+def payload_too_large(e):
+    """Image over the byte or pixel budget"""
+    _count_error(e)
+    return jsonify({'error': str(e)}), 413
+
+@api.app_errorhandler(SubsystemUnavailable)
+def subsystem_unavailable(e):
+    """Text or image filtering is disabled here or could not be initialized"""
+    _count_error(e)
+    return jsonify({'error': str(e), 'subsystem': e.name}), 503
+
+@api.before_app_request
+def start_request_profile():
+    """
+    Profile a filter request that asks for it (X-Profile header or profile
+    query parameter: "timings", or "cprofile" to also keep a cProfile dump)
+    """
+    # Started here rather than at import so that it runs in every forked worker
+    if sampler:
+        sampler.ensure_started()
+    if not PROFILE_TOKEN or request.endpoint not in PROFILED_ENDPOINTS:
+        return None
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode:
+        return None
+    if not profiling_authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'error': 'Invalid or missing X-Profile-Token'}), 403
+    g.request_profile = RequestProfile(capture=(mode == 'cprofile'))
+    g.request_profile.start()
+    return None
+
+@api.after_app_request
+def attach_request_profile(response):
+    """Return the stage breakdown in Server-Timing and the dump name in X-Profile-Id"""
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop()
+        response.headers['Server-Timing'] = profile.server_timing()
+        if profile.profiler:
+            response.headers['X-Profile-Id'] = profile_ring().save(profile.profiler, request.endpoint)
+    return response
+
+@api.teardown_app_request
+def stop_request_profile(exc):
+    # Requests that failed without a response never reach attach_request_profile
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop()
+
+@api.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """
+    Health check endpoint with the readiness of each subsystem
+
+    Subsystems start on first use; pass init=1 to initialize the enabled
+    ones now (e.g. from a readiness probe).
+    """
+    if request.args.get('init') == '1':
+        for subsystem in SUBSYSTEMS:
+            if subsystem.enabled:
+                try:
+                    subsystem.get()
+                except SubsystemUnavailable:
+                    pass
+
+    subsystems = {subsystem.name: subsystem.status() for subsystem in SUBSYSTEMS}
+    failed = any(status['state'] == 'failed' for status in subsystems.values())
     return jsonify({
-        'status': 'ok',
-        'message': 'Python filtration server is running'
+        'status': 'degraded' if failed else 'ok',
+        'message': 'Python filtration server is running',
+        'subsystems': subsystems
     })
 
-@app.route('/filter/text', methods=['POST'])
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Counters and per-stage latency histograms in the Prometheus text format"""
+    return Response(render_prometheus(registry), mimetype='text/plain; version=0.0.4')
+
+@api.route('/filter/text', methods=['POST'])
 def filter_text():
     """Text content filtering endpoint"""
     try:
-        data = request.json
+        with stage_timer('request_parse'):
+            data = request.json
         if not data or 'text' not in data:
             return jsonify({'error': 'No text provided'}), 400
         
         text = data['text']
+        PAYLOAD_BYTES.observe(len(text.encode('utf-8')), endpoint=request.endpoint)
         action = data.get('action', 'filter')  # Default action is to filter
+        text_filter = text_subsystem.get()
         
         # Detect problematic content
-        detection_results = detect_content(text)
+        detection_results = text_filter.detect_content(text)
         
         # Process the text based on detection results
-        processed_text = process_text(text, detection_results, action)
+        processed_text = text_filter.process_text(text, detection_results, action)
         
         return jsonify({
             'original_text': text,
@@ -48,60 +211,170 @@ def filter_text():
             'action': action
         })
     
+    except _HANDLED_ERRORS:
+        raise
     except Exception as e:
+        _count_error(e)
         print(f"Error in text filtering: {str(e)}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/filter/image', methods=['POST'])
+def _read_image_payload():
+    """Return the raw bytes of the uploaded or base64 encoded image, or None if absent"""
+    with stage_timer('request_parse'):
+        data = _parse_image_payload()
+    if data is not None:
+        PAYLOAD_BYTES.observe(len(data), endpoint=request.endpoint)
+    return data
+
+def _parse_image_payload():
+    # Handle file upload
+    if 'image' in request.files:
+        stream = request.files['image'].stream
+        return read_limited(iter(lambda: stream.read(64 * 1024), b''))
+
+    # Handle base64 encoded image
+    if 'image_data' in request.form:
+        image_data = request.form['image_data']
+        # Remove data URL prefix if present
+        if ',' in image_data:
+            image_data = image_data.split(',', 1)[1]
+        if len(image_data) > max_base64_length(MAX_IMAGE_BYTES):
+            reject('image_bytes', f'Image exceeds the {MAX_IMAGE_BYTES} byte limit')
+
+        # Decode base64 to binary
+        return base64.b64decode(image_data)
+
+    return None
+
+@api.route('/filter/image', methods=['POST'])
 def filter_image():
-    """Image content filtering endpoint"""
+    """Image content filtering endpoint (verdict only, nothing is rendered)"""
     try:
-        if 'image' not in request.files and 'image_data' not in request.form:
+        binary_data = _read_image_payload()
+        if binary_data is None:
             return jsonify({'error': 'No image provided'}), 400
-        
-        # Handle file upload
-        if 'image' in request.files:
-            image_file = request.files['image']
-            image = Image.open(image_file)
-            
-            # Save to a temporary file for processing
-            temp_path = 'temp_image.jpg'
-            image.save(temp_path)
-            
-            # Analyze the image
-            results = image_filter.analyze_image(image_path=temp_path, show_results=False)
-            
-            # Clean up the temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        
-        # Handle base64 encoded image
-        elif 'image_data' in request.form:
-            image_data = request.form['image_data']
-            # Remove data URL prefix if present
-            if ',' in image_data:
-                image_data = image_data.split(',', 1)[1]
-            
-            # Decode base64 to binary
-            binary_data = base64.b64decode(image_data)
-            image = Image.open(BytesIO(binary_data))
-            
-            # Analyze the image
-            results = image_filter.analyze_image(image_data=binary_data, show_results=False)
-        
+        # Header-only check of the pixel budgets before anything is decoded
+        probe_image(binary_data)
+        image_filter = get_image_filter()
+        policy = request.values.get('policy')
+        if policy is not None and policy not in image_filter.policies:
+            return jsonify({'error': f'Unknown image policy: {policy}'}), 400
+
+        # Analyze the image
+        results = image_filter.analyze_image(image_data=binary_data, show_results=False, export_comparison=False, policy=policy)
+
         return jsonify(results)
     
+    except _HANDLED_ERRORS:
+        raise
     except Exception as e:
+        _count_error(e)
         print(f"Error in image filtering: {str(e)}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@api.route('/filter/image/render', methods=['POST'])
+def render_image():
+    """Analyze an image and stream back the processed image or a side-by-side comparison"""
+    try:
+        binary_data = _read_image_payload()
+        if binary_data is None:
+            return jsonify({'error': 'No image provided'}), 400
+        # Header-only check of the pixel budgets before anything is decoded
+        probe_image(binary_data)
+        image_filter = get_image_filter()
+
+        view = request.values.get('view', 'processed')
+        obscure = request.values.get('obscure')
+        image_format = request.values.get('format', 'jpeg').lower()
+        if view not in ('processed', 'comparison'):
+            return jsonify({'error': f'Unknown view: {view}'}), 400
+        if image_format not in RENDER_MIMETYPES:
+            return jsonify({'error': f'Unsupported format: {image_format}'}), 400
+        if obscure not in (None, 'full', 'regions', 'auto'):
+            return jsonify({'error': f'Unknown obscure mode: {obscure}'}), 400
+        policy = request.values.get('policy')
+        if policy is not None and policy not in image_filter.policies:
+            return jsonify({'error': f'Unknown image policy: {policy}'}), 400
+
+        if image_filter.render_store:
+            # Popular images are analyzed and rendered once per policy and render mode
+            stored = image_filter.render_stored(binary_data, view=view, obscure=obscure, image_format=image_format, policy=policy)
+            return _send_stored_render(stored)
+
+        results = image_filter.analyze_image(image_data=binary_data, show_results=False, export_comparison=False, policy=policy)
+        # Decoding, obscuring and encoding run in the render pool when enabled
+        rendered = image_filter.render_encoded(binary_data, results, view=view, obscure=obscure, image_format=image_format)
+
+        response = send_file(BytesIO(rendered), mimetype=RENDER_MIMETYPES[image_format])
+        response.headers['X-Overall-Safety'] = results['overall_safety']
+        response.headers['X-Suggested-Action'] = results['suggested_action']
+        return response
+
+    except _HANDLED_ERRORS:
+        raise
+    except Exception as e:
+        _count_error(e)
+        print(f"Error in image rendering: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/renders/<key>', methods=['GET'])
+def get_render(key):
+    """Serve a stored render by its key (also its strong ETag)"""
+    image_filter = get_image_filter()
+    stored = image_filter.render_store.get(key) if image_filter.render_store else None
+    if stored is None:
+        return jsonify({'error': 'Render not found'}), 404
+    return _send_stored_render(stored)
+
+@api.route('/debug/profile', methods=['GET'])
+def get_sampled_profile():
+    """
+    Collapsed stacks sampled over the last `seconds` (default 60), optionally
+    only those containing `match`, ready for flamegraph.pl or speedscope
+    """
+    if not profiling_authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'error': 'Invalid or missing X-Profile-Token'}), 403
+    if not sampler:
+        return jsonify({'error': 'The sampling profiler is disabled (SAMPLING_PROFILER=0)'}), 404
+    seconds = min(request.args.get('seconds', 60, type=int), sampler.retention)
+    return Response(sampler.collapsed(seconds, match=request.args.get('match')), mimetype='text/plain')
+
+@api.route('/debug/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Download a cProfile dump named in an X-Profile-Id header"""
+    if not profiling_authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'error': 'Invalid or missing X-Profile-Token'}), 403
+    path = profile_ring().path(name)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
+def _send_stored_render(stored):
+    """Stream a stored render; renders never change under a key, so they are cacheable forever"""
+    response = send_file(
+        stored.path,
+        mimetype=RENDER_MIMETYPES[stored.meta['format']],
+        etag=stored.key,
+        conditional=True,
+        max_age=365 * 24 * 3600
+    )
+    response.cache_control.immutable = True
+    response.headers['X-Overall-Safety'] = stored.meta['overall_safety']
+    response.headers['X-Suggested-Action'] = stored.meta['suggested_action']
+    response.headers['X-Render-Key'] = stored.key
+    return response
+
 # Load environment variables from .env file if it exists
 if os.path.exists('.env'):
     from dotenv import load_dotenv
     load_dotenv()
 
+# Module level app for `gunicorn flask_server:app`
+app = create_app()
+
 # For Render deployment
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', os.environ.get('PYTHON_PORT', 5000)))
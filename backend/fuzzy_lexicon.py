@@ -0,0 +1,168 @@
+import os
+import re
+from itertools import combinations
+
+# Canonical words the fuzzy lexicon looks up
+_TOKEN = re.compile(r"[^\W\d_]+")
+
+# Dropping a letter from a shorter word too often leaves another real word
+# ("chinal" -> "china", "nigger" -> "niger", "harami" -> "haram"), so tokens
+# shorter than a lexicon word only match words of at least this length
+MIN_LENGTH_FOR_DELETIONS = 8
+
+
+def parse_edit_limits(setting):
+    """
+    Parse a "min_length:edits,..." setting (e.g. "6:1,9:2": words of 6 to 8
+    letters may be one edit away, words of 9 or more two; shorter words only
+    match exactly)
+
+    Returns:
+        list: (min_length, edits) pairs, longest first
+    """
+    limits = []
+    for part in setting.split(","):
+        if part.strip():
+            length, edits = part.split(":")
+            limits.append((int(length), int(edits)))
+    return sorted(limits, reverse=True)
+
+
+def edit_limit(limits, length):
+    """Edits allowed for a word of this length"""
+    for min_length, edits in limits:
+        if length >= min_length:
+            return edits
+    return 0
+
+
+def obfuscation_distance(a, b, limit):
+    """
+    Edit distance where insertions, deletions and adjacent transpositions
+    cost 1 and substituting a letter costs 2 (a deletion plus an insertion)
+
+    Substitutions are what turn profanity into ordinary words ("bigger",
+    "regard"), while stretched, squeezed and swapped letters are how it is
+    disguised, so only the latter are cheap.
+
+    Returns:
+        int: The distance, or limit + 1 once it is known to exceed limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            if a[i - 1] == b[j - 1]:
+                cost = previous[j - 1]
+            else:
+                cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + 2)
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    cost = min(cost, previous2[j - 2] + 1)
+            current[j] = cost
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _deletes(word, count):
+    """Every string obtained by deleting up to count characters from word"""
+    results = {word}
+    for deleted in range(1, min(count, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), deleted):
+            skip = set(positions)
+            results.add("".join(char for index, char in enumerate(word) if index not in skip))
+    return results
+
+
+class FuzzyLexicon:
+    """
+    Lexicon lookup that tolerates a few edits, through a deletion index
+
+    As in SymSpell, every word is indexed under the strings obtained by
+    deleting up to its edit limit of characters, and a token is looked up
+    under its own deletions: a word within the limit always shares one of
+    them. The cost of a lookup depends on the token's length, not on the
+    size of the lexicon; candidates are confirmed with obfuscation_distance.
+    Words keep their first letter (edits there make too many real words),
+    letters can only be missing from words of MIN_LENGTH_FOR_DELETIONS or
+    more, and multi-word entries only match exactly.
+    """
+
+    def __init__(self, words, limits, exceptions=()):
+        """
+        Args:
+            words (iterable): Canonical words (see text_normalization.normalize)
+            limits (list): Result of parse_edit_limits
+            exceptions (iterable): Canonical ordinary words and names that are
+                never matched ("china", "niger")
+        """
+        self.limits = limits
+        self.exceptions = frozenset(exceptions)
+        self.max_edits = max((edits for _, edits in limits), default=0)
+        self._index = {}
+        self._longest = 0
+        for word in words:
+            edits = edit_limit(limits, len(word))
+            if edits == 0 or not word.isalpha():
+                continue
+            self._longest = max(self._longest, len(word))
+            for deletion in _deletes(word, edits):
+                self._index.setdefault(deletion, set()).add(word)
+        self._shortest = min((min_length for min_length, edits in limits if edits), default=0)
+
+    @classmethod
+    def from_env(cls, words, exceptions=()):
+        """Fuzzy lexicon limited by FUZZY_MAX_EDITS, or None when it is empty"""
+        limits = parse_edit_limits(os.getenv("FUZZY_MAX_EDITS", "6:1,9:2"))
+        lexicon = cls(words, limits, exceptions)
+        return lexicon if lexicon._index else None
+
+    def lookup(self, token):
+        """
+        Returns:
+            str: The closest lexicon word within its edit limit, or None
+        """
+        if token in self.exceptions:
+            return None
+        if not self._shortest - self.max_edits <= len(token) <= self._longest + self.max_edits:
+            return None
+        candidates = set()
+        for deletion in _deletes(token, self.max_edits):
+            candidates.update(self._index.get(deletion, ()))
+
+        best, best_distance = None, None
+        for word in candidates:
+            if word[0] != token[0] or len(token) < len(word) < MIN_LENGTH_FOR_DELETIONS:
+                continue
+            limit = edit_limit(self.limits, len(word))
+            distance = obfuscation_distance(token, word, limit)
+            if distance <= limit and (best is None or (distance, word) < (best_distance, best)):
+                best, best_distance = word, distance
+        return best
+
+    def finditer(self, normalized, exclude=()):
+        """
+        Yield the tokens of a normalized text that are near a lexicon word
+
+        Args:
+            normalized (NormalizedText): Result of text_normalization.normalize
+            exclude (set): Original (start, end) spans already matched exactly
+
+        Yields:
+            tuple: (word, start, end) with the span in the original text
+        """
+        # Texts repeat their words; look each distinct token up once
+        found = {}
+        for token in _TOKEN.finditer(normalized.canonical):
+            word = token.group(0)
+            if word not in found:
+                found[word] = self.lookup(word)
+            if found[word] is None:
+                continue
+            span = normalized.original_span(token.start(), token.end())
+            if span not in exclude:
+                yield (found[word],) + span
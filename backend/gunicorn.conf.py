@@ -0,0 +1,19 @@
+import os
+
+# Gunicorn settings for the filtration server (picked up automatically by
+# `gunicorn flask_server:app` when started from this directory)
+
+# Load the app once in the master and fork the workers from it: imports,
+# compiled patterns, policies and lexicons are then shared copy-on-write
+# instead of being rebuilt by every worker. Set GUNICORN_PRELOAD=0 to load
+# the app in each worker instead.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+
+
+def on_starting(server):
+    # Runs in the master after the preloaded app was imported
+    if server.cfg.preload_app:
+        import flask_server
+        flask_server.warm_up()
@@ -0,0 +1,138 @@
+import re
+
+# Words that make up the hate speech phrases, by class
+TOKEN_CLASSES = {
+    "violent_verb": {"kill", "eliminate", "destroy", "murder", "slaughter", "genocide"},
+    "death_call": {"death", "die", "eliminate", "exterminate"},
+    "purge_verb": {"kill", "eliminate", "eradicate", "remove", "cleanse"},
+    "hate_verb": {"hate", "despise", "loathe"},
+    "quantifier": {"all", "every", "each"},
+    "group_noun": {"people", "group", "community", "race", "ethnicity"},
+    "group_subject": {"we", "they", "people", "everyone"},
+    "dehumanizing_term": {"animals", "vermin", "cockroaches", "rats", "trash", "garbage"},
+    "exclusion_outcome": {"banned", "deported", "removed", "eliminated", "killed"},
+}
+
+# Phrases as sequences of token classes, literal words ("a|b" for
+# alternatives) and "*" for any number of other words in between
+HATE_SPEECH_PHRASES = {
+    "elimination": [
+        "violent_verb quantifier * group_noun",
+        "death_call to all|every * group_noun",
+        "group_subject should purge_verb all|every|the|those * group_noun",
+    ],
+    "dehumanization": [
+        "all|every|those * group_noun are|is dehumanizing_term",
+    ],
+    "hate": [
+        "hate_verb all|every|those|these * group_noun",
+    ],
+    "discrimination": [
+        "quantifier * group_noun should|must be|get exclusion_outcome",
+        "quantifier * group_noun need to be|get exclusion_outcome",
+    ],
+}
+
+# Words, and runs of anything else that isn't whitespace. Punctuation and
+# line breaks end phrases: words only chain across spaces.
+_TOKEN = re.compile(r"(\w+)|[^\w\s]+|\n")
+
+_GAP = None
+
+
+def _compile_phrase(phrase):
+    elements = []
+    for part in phrase.split():
+        if part == "*":
+            elements.append(_GAP)
+        elif part in TOKEN_CLASSES:
+            elements.append(frozenset(TOKEN_CLASSES[part]))
+        else:
+            elements.append(frozenset(part.split("|")))
+    return tuple(elements)
+
+
+class PhraseMatcher:
+    """
+    Token-level phrase matcher that runs in linear time
+
+    The text is tokenized once and every phrase is simulated as a small
+    automaton over its tokens: the set of partial matches alive after a
+    token is bounded by the total length of the phrases, so the cost per
+    token is constant however the input is crafted. The "*" gaps are
+    self-loops rather than backtracking regex groups such as (?:\\w+\\s+)*.
+    """
+
+    def __init__(self, phrases=HATE_SPEECH_PHRASES):
+        """
+        Args:
+            phrases (dict): Category -> list of phrase definitions
+        """
+        self.phrases = []
+        # First word -> phrases that start with it
+        self._starts = {}
+        for category, definitions in phrases.items():
+            for definition in definitions:
+                elements = _compile_phrase(definition)
+                if not elements or elements[0] is _GAP or elements[-1] is _GAP:
+                    raise ValueError(f"Phrase must start and end with a word: {definition!r}")
+                for word in elements[0]:
+                    self._starts.setdefault(word, []).append(len(self.phrases))
+                self.phrases.append((category, elements))
+
+    def _closure(self, states, phrase_index, position, start):
+        """Add a state, and the states reachable from it by skipping empty gaps"""
+        elements = self.phrases[phrase_index][1]
+        while True:
+            key = (phrase_index, position)
+            if key in states and states[key] <= start:
+                return
+            states[key] = start
+            if position == len(elements) or elements[position] is not _GAP:
+                return
+            position += 1
+
+    def finditer(self, text):
+        """
+        Yield every phrase match
+
+        Phrases never span punctuation or line breaks, so sentence boundaries
+        also end them.
+
+        Yields:
+            tuple: (category, start offset, end offset) in text
+        """
+        # (phrase index, position of the next element) -> start offset of the
+        # earliest partial match in that state
+        active = {}
+        for token in _TOKEN.finditer(text):
+            word = token.group(1)
+            if word is None:
+                active = {}
+                continue
+            word = word.lower()
+
+            advanced = {}
+            for (index, position), start in active.items():
+                element = self.phrases[index][1][position]
+                if element is _GAP:
+                    # The gap swallows this word
+                    self._closure(advanced, index, position, start)
+                elif word in element:
+                    self._closure(advanced, index, position + 1, start)
+            for index in self._starts.get(word, ()):
+                self._closure(advanced, index, 1, token.start())
+
+            active = {}
+            for (index, position), start in advanced.items():
+                if position == len(self.phrases[index][1]):
+                    yield self.phrases[index][0], start, token.end()
+                else:
+                    active[(index, position)] = start
+
+    def search(self, text):
+        """
+        Returns:
+            tuple: The first (category, start, end) match, or None
+        """
+        return next(self.finditer(text), None)
@@ -1,21 +1,29 @@
 import os
 import io
 import base64
-import re
 from dotenv import load_dotenv
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image
 import requests
-import matplotlib.pyplot as plt
 from google.cloud import vision
-import numpy as np
-from IPython.display import display, HTML
 import logging
 import json
 import datetime
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from image_rendering import DEFAULT_BLUR_METHOD, compose_side_by_side, create_processed_image, encode_image, render, render_encoded
+from render_pool import RenderPool, render_pool_size
+from render_store import RenderStore, render_key
+from image_limits import MAX_IMAGE_BYTES, PayloadTooLarge, check_image_pixels, read_limited
+from metrics import FALLBACKS, stage_timer
+from image_policy import CompiledImagePolicy, compile_policy, default_policy, load_policies
+from image_triage import ImageTriage, triaged_results
+from image_frames import FrameSampler, SAFETY_ORDER, is_animated
+from image_tiling import ImageTiler, merge_tile_responses
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(_name_)
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -25,106 +33,113 @@ class ImageContentFilter:
         """Initialize the content filter with Google Cloud Vision API"""
         # Load Google Cloud credentials from .env
         self.api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-        self.confidence_thresholds = {
-            "adult": 0.7,
-            "violence": 0.6,
-            "racy": 0.7,
-            "medical": 0.8,
-            "spoof": 0.8,  # Useful for potential deepfakes
-            "text_offense": 0.7,
-            "hate_symbols": 0.6,  # Lower threshold for hate symbols
-            "personal_info": 0.7,
-            "deepfake": 0.7,
-            "spam": 0.7
-        }
-        
+
         # Enhanced blur settings
         self.blur_settings = {
             "unsafe": 30,
             "questionable": 15,
             "potentially_concerning": 8
         }
-        
-        # Check if API key is available
-        if not self.api_key:
-            raise ValueError("Google Cloud API key not found in .env file. Please add GOOGLE_CLOUD_API_KEY=your_key_here to your .env file.")
 
+        # Blur engine used for processed images (see image_rendering.BLUR_METHODS)
+        self.blur_method = DEFAULT_BLUR_METHOD
+
+        # How processed images are obscured: "full" blurs the whole frame,
+        # "regions" only the PII, hate symbol and concerning object boxes,
+        # "auto" uses regions whenever every flag can be localized
+        self.obscure_mode = os.getenv("IMAGE_OBSCURE_MODE", "auto")
+
+        # Optional process pool that renders API images off the request thread
+        render_processes = render_pool_size()
+        self.render_pool = RenderPool(render_processes) if render_processes else None
+
+        # Content-addressed store so each image is rendered once per policy and render mode
+        self.render_store = RenderStore.from_env()
+
+        # The IMAGE_PROPERTIES feature (dominant colors) is only requested for
+        # the "unusual color distribution" deepfake indicator; IMAGE_COLOR_CHECK=0
+        # drops both
+        self.color_distribution_check = os.getenv("IMAGE_COLOR_CHECK", "1") != "0"
+        
         # Initialize Google Cloud Vision client
         try:
-            # First try to use the environment variable
-            credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-            if credentials_path and os.path.exists(credentials_path):
-                self.client = vision.ImageAnnotatorClient.from_service_account_json(credentials_path)
-                logger.info(f"Using Google Cloud credentials from environment variable: {credentials_path}")
-            else:
-                # Fallback to a local path relative to the project
-                local_credentials_path = os.path.join(os.path.dirname(_file_), "google_credentials.json")
-                if os.path.exists(local_credentials_path):
-                    self.client = vision.ImageAnnotatorClient.from_service_account_json(local_credentials_path)
-                    logger.info(f"Using Google Cloud credentials from local file: {local_credentials_path}")
-                else:
-                    # Last resort - try the hardcoded path but with a warning
-                    fallback_path = "C:/Users/Antriksh Sharma/Documents/project capstone/my-project-92814-457204-c90e6bf83130.json"
-                    if os.path.exists(fallback_path):
-                        self.client = vision.ImageAnnotatorClient.from_service_account_json(fallback_path)
-                        logger.warning(f"Using fallback Google Cloud credentials: {fallback_path}")
-                    else:
-                        raise FileNotFoundError(f"No valid Google Cloud credentials found. Please set GOOGLE_APPLICATION_CREDENTIALS environment variable.")
+            self.client = self._create_vision_client()
         except Exception as e:
             logger.error(f"Error initializing Google Cloud Vision client: {str(e)}")
             raise
         
-        # Offensive terms for text analysis
-        self.offensive_terms = [
-            "hate", "kill", "attack", "racist", "nazi", "violence", 
-            "offensive", "explicit", "suicide", "abuse", "kill", "murder",
-            "slur", "profanity", "obscene"
-        ]
-        
-        # NEW: Dictionary of known hate symbols to detect
-        self.hate_symbols = {
-            "swastika": ["swastika", "nazi symbol"],
-            "confederate flag": ["confederate flag", "rebel flag"],
-            "white power": ["white power", "white pride"],
-            "kkk": ["kkk", "ku klux klan"],
-            "ss bolts": ["ss bolts", "nazi ss"],
-            "iron cross": ["iron cross"],
-            "celtic cross": ["celtic cross"],
-            "othala rune": ["othala rune"],
-            "sonnenrad": ["black sun", "sonnenrad"],
-            "blood drop cross": ["blood drop cross"],
-            "fascist symbols": ["fascist", "fascism"]
-        }
-        
-        # NEW: Pattern for detecting personal information
-        self.pii_patterns = {
-            "credit_card": r"(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|3(?:0[0-5]|[68][0-9])[0-9]{11}|6(?:011|5[0-9]{2})[0-9]{12}|(?:2131|1800|35\d{3})\d{11})",
-            "ssn": r"\b(?!000|666|9\d{2})([0-8]\d{2}|7([0-6]\d|7[012]))([-])?(?!00)\d\d\3(?!0000)\d{4}\b",
-            "bank_account": r"\b[0-9]{8,17}\b",
-            "routing_number": r"\b[0-9]{9}\b",
-            "email": r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
-            "phone": r"\b(?:\+\d{1,3}[- ]?)?\(?\d{3}\)?[- ]?\d{3}[- ]?\d{4}\b"
-        }
-        
-        # NEW: Spam and scam indicators
-        self.spam_indicators = [
-            "urgent", "act now", "limited time", "congratulations", "won", "lottery", 
-            "prize", "free money", "million dollars", "click here", "verify your account",
-            "bank transfer", "inheritance", "nigerian prince", "urgently", "warning", 
-            "security alert", "suspended", "verify identity", "account locked", 
-            "unusual activity", "claim your", "wire transfer", "send money"
-        ]
-        
-        # NEW: Deepfake indicators (labels that might suggest a deepfake)
-        self.deepfake_indicators = [
-            "artificial", "generated", "synthetic", "manipulated", "fake", "unnatural",
-            "distorted", "warped", "ai generated", "computer generated", "gans", 
-            "generative", "unreal", "edited", "modified"
-        ]
+        # Image policies: what gets flagged and how severe it is. The default
+        # policy can be complemented with per-tenant policies loaded from
+        # IMAGE_POLICY_DIR or registered at runtime.
+        self.policy = default_policy()
+        self.policies = {self.policy.name: self.policy}
+        policy_dir = os.getenv("IMAGE_POLICY_DIR")
+        if policy_dir and os.path.isdir(policy_dir):
+            self.policies.update(load_policies(policy_dir))
+
+        # Cheap local gate that answers obviously safe images without Vision
+        self.triage = ImageTriage()
+
+        # Animated images: sampled frames are annotated in batches of
+        # frame_batch_size (Vision accepts at most 16 per request)
+        self.frame_sampler = FrameSampler()
+        self.frame_batch_size = min(16, max(1, int(os.getenv("IMAGE_FRAME_BATCH", 4))))
+
+        # Very large or very tall images are annotated as overlapping tiles
+        self.tiler = ImageTiler()
         
         logger.info("Content filter initialized successfully")
 
-    def analyze_image(self, image_path=None, image_url=None, image_data=None, show_results=True, export_comparison=True):
+    def _create_vision_client(self):
+        """
+        Create the Vision client from the first credentials available
+
+        1. The service account file named by GOOGLE_APPLICATION_CREDENTIALS
+        2. google_credentials.json next to this module
+        3. The API key in GOOGLE_CLOUD_API_KEY
+        """
+        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if credentials_path and os.path.exists(credentials_path):
+            logger.info(f"Using Google Cloud credentials from environment variable: {credentials_path}")
+            return vision.ImageAnnotatorClient.from_service_account_json(credentials_path)
+
+        local_credentials_path = os.path.join(os.path.dirname(__file__), "google_credentials.json")
+        if os.path.exists(local_credentials_path):
+            logger.info(f"Using Google Cloud credentials from local file: {local_credentials_path}")
+            return vision.ImageAnnotatorClient.from_service_account_json(local_credentials_path)
+
+        if self.api_key:
+            logger.info("Using Google Cloud API key from GOOGLE_CLOUD_API_KEY")
+            return vision.ImageAnnotatorClient(client_options={"api_key": self.api_key})
+
+        raise FileNotFoundError("No valid Google Cloud credentials found. Please set GOOGLE_APPLICATION_CREDENTIALS or GOOGLE_CLOUD_API_KEY.")
+
+    def register_policy(self, policy):
+        """
+        Register (or replace) an image policy
+
+        Args:
+            policy (dict or CompiledImagePolicy): Policy settings; missing keys come from the default policy
+
+        Returns:
+            CompiledImagePolicy: The registered policy
+        """
+        if not isinstance(policy, CompiledImagePolicy):
+            policy = compile_policy(policy)
+        self.policies[policy.name] = policy
+        return policy
+
+    def get_policy(self, policy=None):
+        """Resolve a policy name (or compiled policy) to a compiled policy, defaulting to self.policy"""
+        if policy is None:
+            return self.policy
+        if isinstance(policy, CompiledImagePolicy):
+            return policy
+        if policy not in self.policies:
+            raise ValueError(f"Unknown image policy: {policy}")
+        return self.policies[policy]
+
+    def analyze_image(self, image_path=None, image_url=None, image_data=None, show_results=True, export_comparison=True, policy=None):
         """
         Analyze an image for content filtering using Google Cloud Vision API
     
@@ -134,11 +149,14 @@ class ImageContentFilter:
             image_data (bytes): Raw image data
             show_results (bool): Whether to display visual results
             export_comparison (bool): Whether to export side-by-side comparison
+            policy (str or CompiledImagePolicy): Policy to evaluate with (name of a registered policy)
         
         Returns:
             dict: Analysis results
         """
         try:
+            policy = self.get_policy(policy)
+
             # Load the image based on the provided input
             if image_path:
                 try:
@@ -174,9 +192,10 @@ class ImageContentFilter:
                         headers = {
                             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
                         }
-                        response = requests.get(image_url, timeout=10, headers=headers)
+                        response = requests.get(image_url, timeout=10, headers=headers, stream=True)
                         response.raise_for_status()  # Raise exception for bad HTTP responses
-                        content = response.content
+                        # Stop downloading as soon as the byte budget is exceeded
+                        content = read_limited(response.iter_content(64 * 1024), MAX_IMAGE_BYTES)
                         
                         # Check if the content is actually an image
                         content_type = response.headers.get('Content-Type', '')
@@ -191,173 +210,304 @@ class ImageContentFilter:
                         source_filename = os.path.basename(image_url.split('?')[0])  # Remove query parameters
                         if not source_filename:
                             source_filename = "downloaded_image"
+                except PayloadTooLarge:
+                    raise
                 except requests.exceptions.RequestException as e:
                     logger.error(f"Error downloading image from URL: {str(e)}")
                     raise ValueError(f"Error downloading image from URL: {str(e)}")
                 except Exception as e:
                     logger.error(f"Error processing image from URL: {str(e)}")
                     raise ValueError(f"Error processing image from URL: {str(e)}")
-            
+
+            elif image_data:
+                try:
+                    content = image_data
+                    image = vision.Image(content=content)
+                    display_image = Image.open(io.BytesIO(content))
+                    source = "Uploaded image data"
+                    source_filename = "uploaded_image"
+                except Exception as e:
+                    logger.error(f"Error processing image data: {str(e)}")
+                    raise ValueError(f"Error processing image data: {str(e)}")
+
             else:
                 raise ValueError("No image provided. Please provide either image_path, image_url, or image_data.")
-        
-            # Create a comprehensive feature list
-            features = [
-                vision.Feature(type_=vision.Feature.Type.SAFE_SEARCH_DETECTION),
-                vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION, max_results=20),  # Increased from 10 to 20
-                vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION),
-                vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION, max_results=20),  # Increased from 10 to 20
-                vision.Feature(type_=vision.Feature.Type.FACE_DETECTION),  # NEW: Added face detection for deepfake analysis
-                vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES)  # NEW: Added for image properties analysis
-            ]
-        
-            # Perform image annotation
-            request = vision.AnnotateImageRequest(image=image, features=features)
-            response = self.client.annotate_image(request=request)
-        
-            # Check if the API returned an error
-            if response.error.message:
-                raise ValueError(f"Google Vision API error: {response.error.message}")
-        
-            # Process the response
-            results = self._process_response(response, display_image, source)
-        
-            # Create processed image
-            processed_image = self._create_processed_image(display_image, results)
-            
-            # Display results if requested
-            if show_results:
-                self._display_results(results, display_image, processed_image)
-            
-            # Export side-by-side comparison if requested
-            if export_comparison:
-                export_path = self._export_side_by_side(display_image, processed_image, results, source_filename)
-                results["export_path"] = export_path
-        
+
+            # Pixel budgets, from the header only (decoding is lazy)
+            check_image_pixels(display_image)
+
+            # Spacer GIFs, tiny thumbnails, solid placeholders and flat icons
+            # never need a Vision round trip. Animations are triaged on the
+            # frames that would be sent to Vision, not just the first one.
+            frames = self.frame_sampler.sample(display_image) if is_animated(display_image) else None
+            with stage_timer("triage"):
+                triage = self.triage.triage(content) if frames is None else self.triage.triage_frames(frames)
+            if triage:
+                logger.info(f"Image locally triaged as {triage['reason']}, skipping Vision")
+                return triaged_results(source, f"{display_image.width}x{display_image.height}", triage)
+        
+            if frames is not None:
+                # Vision only looks at one frame of an animation; analyze a
+                # sample of frames and continue with the worst one
+                results, display_image = self._analyze_frames(display_image, source, policy=policy, frames=frames)
+            elif self.tiler.should_tile(display_image):
+                # Long screenshots lose their text when Vision downsamples
+                # them; annotate overlapping tiles and merge the results
+                response, tile_count = self._annotate_tiles(display_image)
+                results = self._process_response(response, display_image, source, policy=policy)
+                results["tiles"] = tile_count
+            else:
+                # Perform image annotation
+                request = vision.AnnotateImageRequest(image=image, features=self._vision_features())
+                with stage_timer("vision_rpc"):
+                    response = self.client.annotate_image(request=request)
+
+                # Check if the API returned an error
+                if response.error.message:
+                    raise ValueError(f"Google Vision API error: {response.error.message}")
+
+                # Process the response
+                results = self._process_response(response, display_image, source, policy=policy)
+
+            # Rendering is only done when something actually consumes the
+            # processed image; API callers get the verdict and use
+            # render_image() on demand.
+            if show_results or export_comparison:
+                processed_image = self._create_processed_image(display_image, results)
+
+                # Display results if requested
+                if show_results:
+                    self._display_results(results, display_image, processed_image)
+
+                # Export side-by-side comparison if requested
+                if export_comparison:
+                    if self.render_store:
+                        # Comparisons go to the render store instead of timestamped files in the CWD
+                        key = render_key(content, policy, "comparison", self.obscure_mode, "jpeg", self.blur_method, self.blur_settings)
+                        stored = self.render_store.get(key) or self.render_store.put(
+                            key,
+                            encode_image(self._compose_side_by_side(display_image, processed_image, results), "jpeg"),
+                            self._render_meta(results, "jpeg")
+                        )
+                        export_path = stored.path
+                    else:
+                        export_path = self._export_side_by_side(display_image, processed_image, results, source_filename)
+                    results["export_path"] = export_path
+
             return results
         
         except Exception as e:
             logger.exception(f"Error in image analysis: {str(e)}")
             raise
-    
-    def _create_processed_image(self, image, results):
+
+    def _vision_features(self):
+        """Vision features requested for every image"""
+        # Create a comprehensive feature list
+        features = [
+            vision.Feature(type_=vision.Feature.Type.SAFE_SEARCH_DETECTION),
+            vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION, max_results=20),  # Increased from 10 to 20
+            vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION),
+            vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION, max_results=20),  # Increased from 10 to 20
+            vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)  # NEW: Added face detection for deepfake analysis
+        ]
+        if self.color_distribution_check:
+            features.append(vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES))
+        return features
+
+    def _annotate_batch(self, images):
+        """
+        Annotate several images with a single Vision batch request
+
+        Args:
+            images (list): PIL images
+
+        Returns:
+            list: AnnotateImageResponse per image, in order
+        """
+        requests = []
+        for image in images:
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, "JPEG", quality=90)
+            requests.append(vision.AnnotateImageRequest(image=vision.Image(content=buffer.getvalue()), features=self._vision_features()))
+        with stage_timer("vision_rpc"):
+            return list(self.client.batch_annotate_images(requests=requests).responses)
+
+    def _annotate_tiles(self, image):
+        """
+        Annotate a large image as overlapping tiles, several batch requests in parallel
+
+        Returns:
+            tuple: (merged AnnotateImageResponse in whole-image coordinates, number of tiles)
+        """
+        tiles = self.tiler.plan(image.width, image.height)
+        crops = [image.crop(tile.box) for tile in tiles]
+        batch_size = self.tiler.batch_size
+        batches = [crops[start:start + batch_size] for start in range(0, len(crops), batch_size)]
+
+        with ThreadPoolExecutor(max_workers=min(self.tiler.workers, len(batches))) as executor:
+            # Each batch runs in a copy of the request's context so that a
+            # profiled request also records the Vision calls of its tiles
+            futures = [executor.submit(contextvars.copy_context().run, self._annotate_batch, batch) for batch in batches]
+            responses = [response for future in futures for response in future.result()]
+
+        logger.info(f"Annotated {image.width}x{image.height} image as {len(tiles)} tiles")
+        return merge_tile_responses(tiles, responses, image.width, image.height), len(tiles)
+
+    def _analyze_frames(self, image, source, policy=None, frames=None):
+        """
+        Analyze a sample of the frames of an animated image
+
+        Frames are annotated in batches, in playback order, and analysis stops
+        at the first unsafe frame.
+
+        Args:
+            image (PIL.Image.Image): Animated image
+            source (str): Description of the image source
+            policy (str or CompiledImagePolicy): Policy to evaluate with
+            frames (list): Frames already picked by the frame sampler
+
+        Returns:
+            tuple: (results of the most severe frame with a "frames" summary, that frame)
+        """
+        if frames is None:
+            frames = self.frame_sampler.sample(image)
+        per_frame = []
+        worst = None
+        stopped_early = False
+
+        for start in range(0, len(frames), self.frame_batch_size):
+            batch = frames[start:start + self.frame_batch_size]
+            responses = self._annotate_batch([frame for _, frame in batch])
+            for (index, frame), response in zip(batch, responses):
+                if response.error.message:
+                    raise ValueError(f"Google Vision API error on frame {index}: {response.error.message}")
+
+                results = self._process_response(response, frame, source, policy=policy)
+                per_frame.append({
+                    "index": index,
+                    "overall_safety": results["overall_safety"],
+                    "content_flags": results["content_flags"]
+                })
+                if worst is None or SAFETY_ORDER.index(results["overall_safety"]) > SAFETY_ORDER.index(worst[0]["overall_safety"]):
+                    worst = (results, index, frame)
+                if results["overall_safety"] == "unsafe":
+                    stopped_early = True
+                    break
+            if stopped_early:
+                break
+
+        results, worst_index, worst_frame = worst
+        results["frames"] = {
+            "total": image.n_frames,
+            "sampled": len(frames),
+            "analyzed": len(per_frame),
+            "stopped_early": stopped_early,
+            "worst_frame": worst_index,
+            "per_frame": per_frame
+        }
+        logger.info(f"Analyzed {len(per_frame)} of {image.n_frames} frames, worst frame {worst_index} is {results['overall_safety']}")
+        return results, worst_frame
+
+    @stage_timer("render")
+    def render_image(self, image, results, view="processed", obscure=None):
+        """
+        Render the processed image (or a side-by-side comparison) for existing analysis results
+
+        Args:
+            image (PIL.Image.Image): The original image that was analyzed
+            results (dict): Results returned by analyze_image
+            view (str): "processed" for the obscured image, "comparison" for original and processed side by side
+            obscure (str): "full", "regions" or "auto"; defaults to self.obscure_mode
+
+        Returns:
+            PIL.Image.Image: The rendered image
+        """
+        return render(image, results, self.blur_settings, view=view, obscure=obscure or self.obscure_mode, method=self.blur_method)
+
+    def render_stored(self, data, view="processed", obscure=None, image_format="jpeg", policy=None):
+        """
+        Analyze and render an image through the render store
+
+        A stored render for the same image, policy version and render mode is
+        returned as is; otherwise the image is analyzed, rendered and stored.
+
+        Args:
+            data (bytes): The encoded image
+            view (str): "processed" or "comparison" (see render_image)
+            obscure (str): "full", "regions" or "auto"; defaults to self.obscure_mode
+            image_format (str): "jpeg" or "png"
+            policy (str or CompiledImagePolicy): Policy to evaluate with
+
+        Returns:
+            StoredRender: The render, with the verdict in its meta
+        """
+        policy = self.get_policy(policy)
+        obscure = obscure or self.obscure_mode
+        key = render_key(data, policy, view, obscure, image_format, self.blur_method, self.blur_settings)
+        stored = self.render_store.get(key)
+        if stored:
+            return stored
+
+        results = self.analyze_image(image_data=data, show_results=False, export_comparison=False, policy=policy)
+        rendered = self.render_encoded(data, results, view=view, obscure=obscure, image_format=image_format)
+        return self.render_store.put(key, rendered, self._render_meta(results, image_format))
+
+    @staticmethod
+    def _render_meta(results, image_format):
+        """Metadata stored alongside a render"""
+        return {
+            "format": image_format,
+            "overall_safety": results["overall_safety"],
+            "suggested_action": results["suggested_action"]
+        }
+
+    @stage_timer("render")
+    def render_encoded(self, data, results, view="processed", obscure=None, image_format="jpeg"):
+        """
+        Render an encoded image for existing analysis results, in the render pool when enabled
+
+        Args:
+            data (bytes): The encoded image that was analyzed
+            results (dict): Results returned by analyze_image
+            view (str): "processed" or "comparison" (see render_image)
+            obscure (str): "full", "regions" or "auto"; defaults to self.obscure_mode
+            image_format (str): "jpeg" or "png"
+
+        Returns:
+            bytes: The encoded rendered image
+        """
+        obscure = obscure or self.obscure_mode
+        if self.render_pool:
+            try:
+                return self.render_pool.render(data, results, self.blur_settings, view=view, obscure=obscure, method=self.blur_method, image_format=image_format)
+            except BrokenProcessPool:
+                FALLBACKS.inc(kind="render_pool_to_local")
+                logger.warning("Render pool process died, rendering in the request thread")
+        return render_encoded(data, results, self.blur_settings, view=view, obscure=obscure, method=self.blur_method, image_format=image_format)
+
+    @stage_timer("render")
+    def _create_processed_image(self, image, results, obscure=None):
         """Create a processed image based on the analysis results"""
-        processed_image = image.copy()
-        
-        # Apply visual indicator based on safety score
-        if results["overall_safety"] == "unsafe":
-            # Apply strong blur for unsafe content
-            processed_image = processed_image.filter(ImageFilter.GaussianBlur(radius=self.blur_settings["unsafe"]))
-        elif results["overall_safety"] == "questionable":
-            # Apply medium blur for questionable content
-            processed_image = processed_image.filter(ImageFilter.GaussianBlur(radius=self.blur_settings["questionable"]))
-        elif results["overall_safety"] == "potentially_concerning":
-            # Apply light blur for minor concerns
-            processed_image = processed_image.filter(ImageFilter.GaussianBlur(radius=self.blur_settings["potentially_concerning"]))
-    
-        # Convert to RGBA if not already (needed for drawing)
-        if processed_image.mode != 'RGBA':
-            processed_image = processed_image.convert('RGBA')
-    
-        draw = ImageDraw.Draw(processed_image)
-    
-        # Draw detected objects with bounding boxes
-        for obj in results["detected_objects"]:
-            name = obj["name"]
-            vertices = obj["bounding_box"]
-            x_coords = [v["x"] * image.width for v in vertices]
-            y_coords = [v["y"] * image.height for v in vertices]
-        
-            # Draw rectangle
-            is_concerning = any(f"concerning_object:{name}" in flag for flag in results["content_flags"])
-            color = (255, 0, 0, 180) if is_concerning else (0, 255, 0, 180)
-        
-            # Convert to list of tuples for drawing
-            xy = list(zip(x_coords, y_coords))
-            draw.polygon(xy, outline=color)
-        
-            # Add label at top of bounding box
-            draw.text((min(x_coords), min(y_coords) - 10), name, fill=color)
-            
-        # NEW: If PII was detected, highlight the areas
-        if "personal_info" in results["content_flags"] and "pii_locations" in results.get("detailed_analysis", {}):
-            for pii_loc in results["detailed_analysis"]["pii_locations"]:
-                vertices = pii_loc["bounding_box"]
-                x_coords = [v["x"] * image.width for v in vertices]
-                y_coords = [v["y"] * image.height for v in vertices]
-                
-                # Draw rectangle with red color
-                xy = list(zip(x_coords, y_coords))
-                draw.polygon(xy, outline=(255, 0, 0, 255), width=3)
-                
-                # Add "PII DETECTED" label
-                draw.text((min(x_coords), min(y_coords) - 15), "PII DETECTED", fill=(255, 0, 0, 255))
-                
-        # NEW: If hate symbols were detected, highlight them
-        if "hate_symbols" in results["content_flags"] and "hate_symbol_locations" in results.get("detailed_analysis", {}):
-            for symbol_loc in results["detailed_analysis"]["hate_symbol_locations"]:
-                vertices = symbol_loc["bounding_box"]
-                x_coords = [v["x"] * image.width for v in vertices]
-                y_coords = [v["y"] * image.height for v in vertices]
-                
-                # Draw rectangle with purple color
-                xy = list(zip(x_coords, y_coords))
-                draw.polygon(xy, outline=(128, 0, 128, 255), width=3)
-                
-                # Add "HATE SYMBOL" label
-                draw.text((min(x_coords), min(y_coords) - 15), "HATE SYMBOL", fill=(128, 0, 128, 255))
-            
-        return processed_image
-    
+        return create_processed_image(image, results, self.blur_settings, obscure=obscure or self.obscure_mode, method=self.blur_method)
+
+    def _compose_side_by_side(self, original_image, processed_image, results):
+        """Compose original and processed images side by side with the verdict drawn on top"""
+        return compose_side_by_side(original_image, processed_image, results)
+
     def _export_side_by_side(self, original_image, processed_image, results, source_filename):
         """Export original and processed images side by side"""
         try:
-            # Ensure both images have the same mode
-            if original_image.mode != processed_image.mode:
-                original_image = original_image.convert('RGBA')
-                processed_image = processed_image.convert('RGBA')
-            
-            # Get dimensions
-            width, height = original_image.size
-            
-            # Create a new image with double width
-            combined_image = Image.new(original_image.mode, (width * 2, height))
-            
-            # Paste original image on the left
-            combined_image.paste(original_image, (0, 0))
-            
-            # Paste processed image on the right
-            combined_image.paste(processed_image, (width, 0))
-            
-            # Add a dividing line
-            draw = ImageDraw.Draw(combined_image)
-            draw.line([(width, 0), (width, height)], fill=(255, 0, 0, 255), width=2)
-            
-            # Add safety label
-            safety_text = results["overall_safety"].upper().replace("_", " ")
-            action_text = results["suggested_action"].upper()
-            
-            # Try to load a font (fallback to default if not available)
-            try:
-                font = ImageFont.truetype("arial.ttf", 20)
-            except IOError:
-                font = ImageFont.load_default()
-            
-            # Add safety info text to the right side
-            text_position = (width + 10, 10)
-            text_color = (255, 0, 0, 255) if results["overall_safety"] == "unsafe" else (255, 165, 0, 255)
-            draw.text(text_position, f"STATUS: {safety_text}", fill=text_color, font=font)
-            draw.text((width + 10, 40), f"ACTION: {action_text}", fill=text_color, font=font)
-            
+            combined_image = self._compose_side_by_side(original_image, processed_image, results)
+
             # Generate output filename
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             base_name = os.path.splitext(source_filename)[0]
             output_filename = f"{base_name}analyzed{timestamp}.jpg"
-            
+
             # Convert to RGB for JPG export
             if combined_image.mode == 'RGBA':
                 combined_image = combined_image.convert('RGB')
-                
+
             # Save the combined image
             combined_image.save(output_filename, 'JPEG', quality=95)
             logger.info(f"Exported side-by-side comparison to {output_filename}")
@@ -368,261 +518,11 @@ class ImageContentFilter:
             logger.exception(f"Error exporting side-by-side comparison: {str(e)}")
             return None
         
-    def _process_response(self, response, display_image, source):
+    @stage_timer("process_response")
+    def _process_response(self, response, display_image, source, policy=None):
         """Process the Google Cloud Vision API response"""
-        results = {
-            "source": source,
-            "image_size": f"{display_image.width}x{display_image.height}",
-            "safe_search": {},
-            "labels": [],
-            "text_content": "",
-            "detected_objects": [],
-            "content_flags": [],
-            "overall_safety": "safe",
-            "detailed_analysis": {}
-        }
-    
-        # Process Safe Search
-        safe_search = response.safe_search_annotation
-    
-        # Convert likelihood enum to score
-        likelihood_scores = {
-            vision.Likelihood.UNKNOWN: 0.0,
-            vision.Likelihood.VERY_UNLIKELY: 0.1,
-            vision.Likelihood.UNLIKELY: 0.3,
-            vision.Likelihood.POSSIBLE: 0.5,
-            vision.Likelihood.LIKELY: 0.7,
-            vision.Likelihood.VERY_LIKELY: 0.9
-        }
-    
-        # Get likelihood name properly
-        def get_likelihood_name(likelihood_value):
-            for name, value in vision.Likelihood._dict_.items():
-                if isinstance(value, int) and value == likelihood_value:
-                    return name
-            return "UNKNOWN"  # Fallback
-    
-        # Process each safe search category
-        safe_search_results = {
-            "adult": {"score": likelihood_scores[safe_search.adult], "likelihood": get_likelihood_name(safe_search.adult)},
-            "violence": {"score": likelihood_scores[safe_search.violence], "likelihood": get_likelihood_name(safe_search.violence)},
-            "racy": {"score": likelihood_scores[safe_search.racy], "likelihood": get_likelihood_name(safe_search.racy)},
-            "medical": {"score": likelihood_scores[safe_search.medical], "likelihood": get_likelihood_name(safe_search.medical)},
-            "spoof": {"score": likelihood_scores[safe_search.spoof], "likelihood": get_likelihood_name(safe_search.spoof)}
-        }
-        results["safe_search"] = safe_search_results
-    
-        # Flag content based on thresholds
-        for category, data in safe_search_results.items():
-            if data["score"] >= self.confidence_thresholds.get(category, 0.7):
-                results["content_flags"].append(category)
-    
-        # Process Labels
-        labels = []
-        for label in response.label_annotations:
-            labels.append({
-                "description": label.description,
-                "score": label.score,
-                "topicality": label.topicality
-            })
-        results["labels"] = labels
-    
-        # Look for potentially concerning labels
-        concerning_keywords = [
-            "weapon", "gun", "knife", "blood", "drug", "alcohol", "cigarette", 
-            "smoking", "death", "corpse", "nazi", "hate", "explicit", "nude", 
-            "naked", "underwear"
-        ]
-    
-        for label in labels:
-            if any(keyword in label["description"].lower() for keyword in concerning_keywords) and label["score"] > 0.7:
-                results["content_flags"].append(f"concerning_label:{label['description']}")
-    
-        # Process Text
-        if response.text_annotations:
-            full_text = response.text_annotations[0].description
-            results["text_content"] = full_text
-        
-            # Check for offensive content in text
-            text_lower = full_text.lower()
-            offensive_words_found = [word for word in self.offensive_terms if word in text_lower]
-        
-            if offensive_words_found:
-                results["content_flags"].append("offensive_text")
-                results["detailed_analysis"]["offensive_text"] = offensive_words_found
-                
-            # NEW: Check for hate symbols mentioned in text
-            hate_symbols_found = []
-            for symbol, keywords in self.hate_symbols.items():
-                if any(keyword.lower() in text_lower for keyword in keywords):
-                    hate_symbols_found.append(symbol)
-            
-            if hate_symbols_found:
-                results["content_flags"].append("hate_symbols")
-                results["detailed_analysis"]["hate_symbols_text"] = hate_symbols_found
-                
-            # NEW: Check for personal information in text
-            pii_found = {}
-            pii_locations = []
-            
-            # Process each text annotation (words/phrases with location)
-            for text_annot in response.text_annotations[1:]:  # Skip the first one which is the full text
-                text_content = text_annot.description
-                
-                # Check for PII patterns
-                for pii_type, pattern in self.pii_patterns.items():
-                    if re.search(pattern, text_content):
-                        if pii_type not in pii_found:
-                            pii_found[pii_type] = []
-                        
-                        # Don't store the actual PII, just note that it was found
-                        pii_found[pii_type].append("PII DETECTED")
-                        
-                        # Store the bounding box for highlighting
-                        vertices = [
-                            {"x": vertex.x, "y": vertex.y} 
-                            for vertex in text_annot.bounding_poly.vertices
-                        ]
-                        pii_locations.append({
-                            "type": pii_type,
-                            "bounding_box": vertices
-                        })
-            
-            if pii_found:
-                results["content_flags"].append("personal_info")
-                results["detailed_analysis"]["personal_info"] = pii_found
-                results["detailed_analysis"]["pii_locations"] = pii_locations
-                
-            # NEW: Check for spam/scam indicators
-            spam_indicators_found = [indicator for indicator in self.spam_indicators 
-                                    if indicator.lower() in text_lower]
-            
-            if len(spam_indicators_found) >= 2:  # If at least 2 indicators are found
-                results["content_flags"].append("spam_message")
-                results["detailed_analysis"]["spam_indicators"] = spam_indicators_found
-    
-        # Process Objects
-        objects = []
-        for obj in response.localized_object_annotations:
-            objects.append({
-                "name": obj.name,
-                "score": obj.score,
-                "bounding_box": [
-                    {
-                        "x": vertex.x,
-                        "y": vertex.y
-                    } for vertex in obj.bounding_poly.normalized_vertices
-                ]
-            })
-        results["detected_objects"] = objects
-    
-        # Check for potentially concerning objects
-        concerning_objects = ["Weapon", "Gun", "Knife", "Alcohol", "Cigarette", "Drug"]
-        for obj in objects:
-            if obj["name"] in concerning_objects and obj["score"] > 0.7:
-                results["content_flags"].append(f"concerning_object:{obj['name']}")
-        
-        # NEW: Analyze faces for potential deepfake indicators
-        if response.face_annotations:
-            faces = response.face_annotations
-            face_analysis = []
-            
-            deepfake_score = 0
-            for i, face in enumerate(faces):
-                face_data = {
-                    "detection_confidence": face.detection_confidence,
-                    "joy_likelihood": get_likelihood_name(face.joy_likelihood),
-                    "sorrow_likelihood": get_likelihood_name(face.sorrow_likelihood),
-                    "anger_likelihood": get_likelihood_name(face.anger_likelihood),
-                    "surprise_likelihood": get_likelihood_name(face.surprise_likelihood),
-                    "blurred_likelihood": get_likelihood_name(face.blurred_likelihood),
-                    "headwear_likelihood": get_likelihood_name(face.headwear_likelihood)
-                }
-                
-                # Check for inconsistencies that might indicate a deepfake
-                # High detection confidence but high blur is suspicious
-                if face.detection_confidence > 0.8 and likelihood_scores[face.blurred_likelihood] > 0.5:
-                    deepfake_score += 0.2
-                
-                # Extreme emotion likelihood combinations can be suspicious
-                if (likelihood_scores[face.joy_likelihood] > 0.7 and 
-                    likelihood_scores[face.sorrow_likelihood] > 0.7):
-                    deepfake_score += 0.3  # Contradictory emotions
-                
-                face_analysis.append(face_data)
-            
-            results["detailed_analysis"]["face_analysis"] = face_analysis
-            
-            # Check for unusual face attributes that might indicate manipulation
-            if deepfake_score > 0.3:
-                results["content_flags"].append("potential_deepfake")
-                results["detailed_analysis"]["deepfake_score"] = deepfake_score
-        
-        # NEW: Check image labels for deepfake indicators
-        deepfake_indicators_found = []
-        for label in labels:
-            if any(indicator in label["description"].lower() for indicator in self.deepfake_indicators) and label["score"] > 0.6:
-                deepfake_indicators_found.append(label["description"])
-        
-        if deepfake_indicators_found:
-            if "potential_deepfake" not in results["content_flags"]:
-                results["content_flags"].append("potential_deepfake")
-            results["detailed_analysis"]["deepfake_indicators"] = deepfake_indicators_found
-            
-        # NEW: Check for image manipulation using image properties
-        if response.image_properties_annotation:
-            colors = response.image_properties_annotation.dominant_colors.colors
-            
-            # Analyze color distribution for potential manipulation signs
-            if len(colors) > 0:
-                # Unusual color patterns can indicate manipulation
-                color_scores = [color.score for color in colors]
-                color_distribution_score = np.std(color_scores) if len(color_scores) > 1 else 0
-                
-                if color_distribution_score > 0.4:  # High variance in color distribution
-                    if "potential_deepfake" not in results["content_flags"]:
-                        results["content_flags"].append("potential_deepfake")
-                    if "deepfake_indicators" not in results["detailed_analysis"]:
-                        results["detailed_analysis"]["deepfake_indicators"] = []
-                    results["detailed_analysis"]["deepfake_indicators"].append("unusual color distribution")
-            
-        # NEW: Check for hate symbols in objects and labels
-        hate_symbol_locations = []
-        for obj in objects:
-            obj_name_lower = obj["name"].lower()
-            for symbol, keywords in self.hate_symbols.items():
-                if any(keyword.lower() in obj_name_lower for keyword in keywords):
-                    if "hate_symbols" not in results["content_flags"]:
-                        results["content_flags"].append("hate_symbols")
-                    
-                    # Store location for highlighting
-                    hate_symbol_locations.append({
-                        "symbol": symbol,
-                        "bounding_box": obj["bounding_box"]
-                    })
-        
-        if hate_symbol_locations:
-            results["detailed_analysis"]["hate_symbol_locations"] = hate_symbol_locations
-    
-        # Determine overall safety
-        if results["content_flags"]:
-            # Check severity - Most severe concerns first
-            if ("adult" in results["content_flags"] or 
-                "violence" in results["content_flags"] or 
-                "personal_info" in results["content_flags"]):
-                results["overall_safety"] = "unsafe"
-            elif ("racy" in results["content_flags"] or 
-                 "concerning_object:Weapon" in results["content_flags"] or
-                 "hate_symbols" in results["content_flags"] or
-                 "potential_deepfake" in results["content_flags"]):
-                results["overall_safety"] = "questionable"
-            elif len(results["content_flags"]) > 2:  # Multiple minor flags
-                results["overall_safety"] = "questionable"
-            else:
-                results["overall_safety"] = "potentially_concerning"
-    
+        results = self.get_policy(policy).evaluate(response, display_image, source)
         results["suggested_action"] = self._get_recommended_action(results)
-    
         return results
     
     def _get_recommended_action(self, results):
@@ -638,6 +538,10 @@ class ImageContentFilter:
     
     def _display_results(self, results, original_image, processed_image):
         """Display the results in the notebook with blurring for unsafe content"""
+        # Notebook-only dependencies, imported here so the server never loads them
+        import matplotlib.pyplot as plt
+        from IPython.display import display, HTML
+
         # Calculate scaled dimensions for display (max height 500)
         max_height = 500
         aspect_ratio = original_image.width / original_image.height
@@ -973,5 +877,5 @@ def analyze_image_interactive():
         logger.exception("Fatal error in content filter")
         
 # Run the interactive function
-if _name_ == "_main_":
+if __name__ == "__main__":
     analyze_image_interactive()
\ No newline at end of file
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+# Overall safety levels from least to most severe
+SAFETY_ORDER = ("safe", "potentially_concerning", "questionable", "unsafe")
+
+# Frames whose dHash differs in at most this many bits (of 64) are treated
+# as the same picture
+_DUPLICATE_DISTANCE = 6
+# A jump of more than this many bits from the previous frame is a scene change
+_SCENE_CHANGE_DISTANCE = 16
+
+
+def is_animated(image):
+    """Whether a PIL image has more than one frame (animated GIF/WebP/PNG)"""
+    return getattr(image, "is_animated", False) and getattr(image, "n_frames", 1) > 1
+
+
+def dhash(image):
+    """64-bit difference hash of an image"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class FrameSampler:
+    """
+    Pick the frames of an animated image worth sending to Vision
+
+    Every frame is hashed on a tiny thumbnail. The first frame, every frame
+    on a fixed stride and every scene change are candidates; candidates that
+    are near duplicates of an already sampled frame are dropped.
+    """
+
+    def __init__(self):
+        self.max_frames = int(os.getenv("IMAGE_MAX_FRAMES", 8))
+        self.stride = int(os.getenv("IMAGE_FRAME_STRIDE", 10))
+
+    def sample(self, image):
+        """
+        Args:
+            image (PIL.Image.Image): Animated image
+
+        Returns:
+            list: [(frame index, RGB frame)] in playback order, at most max_frames
+        """
+        # Spread the stride over long animations so it still reaches the end
+        stride = max(self.stride, -(-image.n_frames // self.max_frames))
+        sampled = []
+        hashes = []
+        previous = None
+        for index in range(image.n_frames):
+            image.seek(index)
+            frame = image.convert("RGB")
+            frame_hash = dhash(frame)
+
+            scene_change = previous is not None and hamming(frame_hash, previous) > _SCENE_CHANGE_DISTANCE
+            previous = frame_hash
+            if index and index % stride and not scene_change:
+                continue
+            if any(hamming(frame_hash, kept) <= _DUPLICATE_DISTANCE for kept in hashes):
+                continue
+
+            sampled.append((index, frame))
+            hashes.append(frame_hash)
+            if len(sampled) >= self.max_frames:
+                break
+
+        image.seek(0)
+        return sampled
@@ -0,0 +1,88 @@
+import io
+import os
+
+from PIL import Image
+
+from metrics import registry
+
+# Largest request body the server accepts (multipart upload or base64 form field)
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", 8 * 1024 * 1024))
+# Largest encoded image, after base64 decoding
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 5 * 1024 * 1024))
+# Largest decoded frame, in pixels
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))
+# Largest total of decoded pixels over every frame of an animation
+MAX_ANIMATION_PIXELS = int(os.getenv("MAX_ANIMATION_PIXELS", 200_000_000))
+
+PAYLOAD_REJECTIONS = registry.counter(
+    "payload_rejections_total",
+    "Requests and images rejected for exceeding a size budget",
+    ("reason",)
+)
+
+
+class PayloadTooLarge(ValueError):
+    """An input exceeds one of the byte or pixel budgets"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def reject(reason, message):
+    """Count a rejection and raise PayloadTooLarge"""
+    PAYLOAD_REJECTIONS.inc(reason=reason)
+    raise PayloadTooLarge(reason, message)
+
+
+def max_base64_length(size):
+    """Length of the base64 encoding of size bytes"""
+    return 4 * -(-size // 3)
+
+
+def read_limited(chunks, limit=MAX_IMAGE_BYTES):
+    """
+    Join byte chunks, giving up as soon as more than limit bytes arrive
+
+    Args:
+        chunks (iterable): Byte chunks (e.g. a file stream or a streamed download)
+        limit (int): Byte budget
+
+    Returns:
+        bytes: The joined data
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > limit:
+            reject("image_bytes", f"Image exceeds the {limit} byte limit")
+    return bytes(buffer)
+
+
+def check_image_pixels(image):
+    """
+    Enforce the pixel budgets on an opened (not yet decoded) image
+
+    Only the header is read: PIL knows the size and frame count of an image
+    without decoding its pixel data.
+    """
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        reject("image_pixels", f"Image is {width}x{height}, the limit is {MAX_IMAGE_PIXELS} pixels")
+    frames = getattr(image, "n_frames", 1)
+    if width * height * frames > MAX_ANIMATION_PIXELS:
+        reject("animation_pixels", f"Animation has {frames} frames of {width}x{height}, the limit is {MAX_ANIMATION_PIXELS} pixels")
+
+
+def probe_image(data):
+    """Enforce the byte and pixel budgets on encoded image data before anything decodes it"""
+    if len(data) > MAX_IMAGE_BYTES:
+        reject("image_bytes", f"Image is {len(data)} bytes, the limit is {MAX_IMAGE_BYTES}")
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        reject("image_pixels", str(e))
+    except Exception:
+        # Not something PIL can read; analysis reports the actual error
+        return
+    check_image_pixels(image)
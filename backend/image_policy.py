@@ -0,0 +1,401 @@
+import os
+import json
+import logging
+
+import numpy as np
+from google.cloud import vision
+
+from keyword_automaton import KeywordAutomaton
+from ocr_scanner import OcrTextScanner
+
+logger = logging.getLogger(__name__)
+
+# =================================================================
+# Likelihood lookup tables (indexed by the integer enum value)
+# =================================================================
+
+_LIKELIHOOD_SCORE_BY_NAME = {
+    "UNKNOWN": 0.0,
+    "VERY_UNLIKELY": 0.1,
+    "UNLIKELY": 0.3,
+    "POSSIBLE": 0.5,
+    "LIKELY": 0.7,
+    "VERY_LIKELY": 0.9
+}
+
+LIKELIHOOD_NAMES = tuple(member.name for member in sorted(vision.Likelihood, key=int))
+LIKELIHOOD_SCORES = tuple(_LIKELIHOOD_SCORE_BY_NAME.get(name, 0.0) for name in LIKELIHOOD_NAMES)
+
+SAFE_SEARCH_CATEGORIES = ("adult", "violence", "racy", "medical", "spoof")
+
+FACE_LIKELIHOODS = ("joy", "sorrow", "anger", "surprise", "blurred", "headwear")
+
+
+def likelihood_name(value):
+    """Name of a Vision likelihood value"""
+    value = int(value)
+    return LIKELIHOOD_NAMES[value] if 0 <= value < len(LIKELIHOOD_NAMES) else "UNKNOWN"
+
+
+def likelihood_score(value):
+    """Score of a Vision likelihood value"""
+    value = int(value)
+    return LIKELIHOOD_SCORES[value] if 0 <= value < len(LIKELIHOOD_SCORES) else 0.0
+
+
+# =================================================================
+# Default policy
+# =================================================================
+
+DEFAULT_IMAGE_POLICY = {
+    "name": "default",
+    "version": "1",
+
+    # Safe search scores at or above these values raise a flag
+    "confidence_thresholds": {
+        "adult": 0.7,
+        "violence": 0.6,
+        "racy": 0.7,
+        "medical": 0.8,
+        "spoof": 0.8,  # Useful for potential deepfakes
+        "text_offense": 0.7,
+        "hate_symbols": 0.6,  # Lower threshold for hate symbols
+        "personal_info": 0.7,
+        "deepfake": 0.7,
+        "spam": 0.7
+    },
+
+    # Labels containing any of these words (scored above the threshold) are flagged
+    "concerning_keywords": [
+        "weapon", "gun", "knife", "blood", "drug", "alcohol", "cigarette",
+        "smoking", "death", "corpse", "nazi", "hate", "explicit", "nude",
+        "naked", "underwear"
+    ],
+    "concerning_label_score": 0.7,
+
+    # Localized objects with exactly these names are flagged
+    "concerning_objects": ["Weapon", "Gun", "Knife", "Alcohol", "Cigarette", "Drug"],
+    "concerning_object_score": 0.7,
+
+    # Offensive terms for text analysis
+    "offensive_terms": [
+        "hate", "kill", "attack", "racist", "nazi", "violence",
+        "offensive", "explicit", "suicide", "abuse", "kill", "murder",
+        "slur", "profanity", "obscene"
+    ],
+
+    # Known hate symbols, matched in OCR text and object names
+    "hate_symbols": {
+        "swastika": ["swastika", "nazi symbol"],
+        "confederate flag": ["confederate flag", "rebel flag"],
+        "white power": ["white power", "white pride"],
+        "kkk": ["kkk", "ku klux klan"],
+        "ss bolts": ["ss bolts", "nazi ss"],
+        "iron cross": ["iron cross"],
+        "celtic cross": ["celtic cross"],
+        "othala rune": ["othala rune"],
+        "sonnenrad": ["black sun", "sonnenrad"],
+        "blood drop cross": ["blood drop cross"],
+        "fascist symbols": ["fascist", "fascism"]
+    },
+
+    # Personal information in OCR text. Each pattern is scanned on its own,
+    # so one value can match several of them (a phone number is also digits
+    # of a bank account)
+    "pii_patterns": {
+        "email": r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
+        "credit_card": r"(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|3(?:0[0-5]|[68][0-9])[0-9]{11}|6(?:011|5[0-9]{2})[0-9]{12}|(?:2131|1800|35\d{3})\d{11})",
+        "ssn": r"\b(?!000|666|9\d{2})(?:[0-8]\d{2}|7(?:[0-6]\d|7[012]))(?P<ssn_sep>[-])?(?!00)\d\d(?P=ssn_sep)(?!0000)\d{4}\b",
+        "phone": r"(?:\+91[- ]?|\b)[6-9]\d{4}[- ]?\d{5}\b|(?:\+\d{1,3}[- ]?)?(?:\(\d{3}\)|\b\d{3})[- ]?\d{3}[- ]?\d{4}\b",
+        "routing_number": r"\b[0-9]{9}\b",
+        "bank_account": r"\b[0-9]{8,17}\b"
+    },
+
+    # Spam and scam indicators; a message needs this many to be flagged
+    "spam_indicators": [
+        "urgent", "act now", "limited time", "congratulations", "won", "lottery",
+        "prize", "free money", "million dollars", "click here", "verify your account",
+        "bank transfer", "inheritance", "nigerian prince", "urgently", "warning",
+        "security alert", "suspended", "verify identity", "account locked",
+        "unusual activity", "claim your", "wire transfer", "send money"
+    ],
+    "spam_min_indicators": 2,
+
+    # Labels that might suggest a deepfake
+    "deepfake_indicators": [
+        "artificial", "generated", "synthetic", "manipulated", "fake", "unnatural",
+        "distorted", "warped", "ai generated", "computer generated", "gans",
+        "generative", "unreal", "edited", "modified"
+    ],
+    "deepfake_label_score": 0.6,
+    "deepfake_face_score": 0.3,
+    "color_distribution_threshold": 0.4,
+
+    # Overall safety: any of the unsafe flags makes the image unsafe, any of
+    # the questionable flags (or more than multiple_flag_count flags)
+    # questionable, and anything else potentially concerning
+    "unsafe_flags": ["adult", "violence", "personal_info"],
+    "questionable_flags": ["racy", "concerning_object:Weapon", "hate_symbols", "potential_deepfake"],
+    "multiple_flag_count": 2
+}
+
+
+# =================================================================
+# Compiled policy
+# =================================================================
+
+class CompiledImagePolicy:
+    """An image policy with its lookup tables and automata built ahead of time"""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.name = policy["name"]
+        self.version = str(policy["version"])
+
+        # Safe search: lowest likelihood value that reaches each threshold, so
+        # the per-response check is a single integer comparison
+        thresholds = policy["confidence_thresholds"]
+        self._safe_search_trip = {}
+        for category in SAFE_SEARCH_CATEGORIES:
+            threshold = thresholds.get(category, 0.7)
+            trip = [value for value, score in enumerate(LIKELIHOOD_SCORES) if score >= threshold]
+            self._safe_search_trip[category] = trip[0] if trip else len(LIKELIHOOD_SCORES)
+
+        # Labels are checked for concerning keywords and deepfake indicators at once
+        self._label_automaton = KeywordAutomaton(
+            [(keyword, "concerning") for keyword in policy["concerning_keywords"]] +
+            [(indicator, "deepfake") for indicator in policy["deepfake_indicators"]]
+        )
+        self._concerning_label_score = policy["concerning_label_score"]
+        self._deepfake_label_score = policy["deepfake_label_score"]
+
+        self._concerning_objects = frozenset(policy["concerning_objects"])
+        self._concerning_object_score = policy["concerning_object_score"]
+        self._object_automaton = KeywordAutomaton(
+            (keyword, symbol)
+            for symbol, keywords in policy["hate_symbols"].items()
+            for keyword in keywords
+        )
+
+        # OCR text: PII and keyword categories scanned together
+        keyword_categories = {"offensive_text": policy["offensive_terms"], "spam": policy["spam_indicators"]}
+        for symbol, keywords in policy["hate_symbols"].items():
+            keyword_categories[f"hate_symbol:{symbol}"] = keywords
+        self.text_scanner = OcrTextScanner(policy["pii_patterns"], keyword_categories)
+        self._hate_symbol_categories = [(symbol, f"hate_symbol:{symbol}") for symbol in policy["hate_symbols"]]
+        self._spam_min_indicators = policy["spam_min_indicators"]
+
+        self._deepfake_face_score = policy["deepfake_face_score"]
+        self._color_distribution_threshold = policy["color_distribution_threshold"]
+
+        self._unsafe_flags = frozenset(policy["unsafe_flags"])
+        self._questionable_flags = frozenset(policy["questionable_flags"])
+        self._multiple_flag_count = policy["multiple_flag_count"]
+
+    def evaluate(self, response, display_image, source):
+        """
+        Evaluate a Vision response against the policy
+
+        Args:
+            response: Vision AnnotateImageResponse
+            display_image (PIL.Image.Image): The analyzed image
+            source (str): Description of where the image came from
+
+        Returns:
+            dict: Analysis results (without the suggested action)
+        """
+        results = {
+            "source": source,
+            "image_size": f"{display_image.width}x{display_image.height}",
+            "safe_search": {},
+            "labels": [],
+            "text_content": "",
+            "detected_objects": [],
+            "content_flags": [],
+            "overall_safety": "safe",
+            "detailed_analysis": {}
+        }
+        detailed_analysis = results["detailed_analysis"]
+        # Flags are accumulated in an insertion ordered dict used as a set
+        flags = {}
+
+        # Process Safe Search
+        safe_search = response.safe_search_annotation
+        for category in SAFE_SEARCH_CATEGORIES:
+            value = int(getattr(safe_search, category))
+            results["safe_search"][category] = {"score": likelihood_score(value), "likelihood": likelihood_name(value)}
+            if value >= self._safe_search_trip[category]:
+                flags[category] = True
+
+        # Process Labels (concerning keywords and deepfake indicators together)
+        deepfake_indicators_found = []
+        for label in response.label_annotations:
+            description = label.description
+            results["labels"].append({
+                "description": description,
+                "score": label.score,
+                "topicality": label.topicality
+            })
+            tags = self._label_automaton.find(description)
+            if not tags:
+                continue
+            if "concerning" in tags and label.score > self._concerning_label_score:
+                flags[f"concerning_label:{description}"] = True
+            if "deepfake" in tags and label.score > self._deepfake_label_score:
+                deepfake_indicators_found.append(description)
+
+        # Process Text
+        if response.text_annotations:
+            full_text = response.text_annotations[0].description
+            results["text_content"] = full_text
+
+            # One scan of the OCR words finds offensive terms, hate symbol
+            # mentions, spam indicators and PII together
+            scan = self.text_scanner.scan(response.text_annotations[1:], display_image.width, display_image.height, full_text=full_text)
+
+            offensive_words_found = scan.keywords.get("offensive_text")
+            if offensive_words_found:
+                flags["offensive_text"] = True
+                detailed_analysis["offensive_text"] = offensive_words_found
+
+            hate_symbols_found = [symbol for symbol, category in self._hate_symbol_categories if category in scan.keywords]
+            if hate_symbols_found:
+                flags["hate_symbols"] = True
+                detailed_analysis["hate_symbols_text"] = hate_symbols_found
+
+            if scan.pii_hits:
+                pii_found = {}
+                for pii_type in scan.pii_hits:
+                    # Don't store the actual PII, just note that it was found
+                    pii_found.setdefault(pii_type, []).append("PII DETECTED")
+                flags["personal_info"] = True
+                detailed_analysis["personal_info"] = pii_found
+                detailed_analysis["pii_locations"] = scan.pii_locations
+
+            spam_indicators_found = scan.keywords.get("spam", [])
+            if len(spam_indicators_found) >= self._spam_min_indicators:
+                flags["spam_message"] = True
+                detailed_analysis["spam_indicators"] = spam_indicators_found
+
+        # Process Objects (concerning objects and hate symbols together)
+        hate_symbol_locations = []
+        for obj in response.localized_object_annotations:
+            name = obj.name
+            bounding_box = [{"x": vertex.x, "y": vertex.y} for vertex in obj.bounding_poly.normalized_vertices]
+            results["detected_objects"].append({
+                "name": name,
+                "score": obj.score,
+                "bounding_box": bounding_box
+            })
+            if name in self._concerning_objects and obj.score > self._concerning_object_score:
+                flags[f"concerning_object:{name}"] = True
+            for symbol in self._object_automaton.find(name):
+                hate_symbol_locations.append({"symbol": symbol, "bounding_box": bounding_box})
+
+        # Analyze faces for potential deepfake indicators
+        if response.face_annotations:
+            face_analysis = []
+            deepfake_score = 0
+            for face in response.face_annotations:
+                face_data = {"detection_confidence": face.detection_confidence}
+                for attribute in FACE_LIKELIHOODS:
+                    face_data[f"{attribute}_likelihood"] = likelihood_name(getattr(face, f"{attribute}_likelihood"))
+                face_analysis.append(face_data)
+
+                # High detection confidence but high blur is suspicious
+                if face.detection_confidence > 0.8 and likelihood_score(face.blurred_likelihood) > 0.5:
+                    deepfake_score += 0.2
+                # Contradictory emotions
+                if likelihood_score(face.joy_likelihood) > 0.7 and likelihood_score(face.sorrow_likelihood) > 0.7:
+                    deepfake_score += 0.3
+
+            detailed_analysis["face_analysis"] = face_analysis
+            if deepfake_score > self._deepfake_face_score:
+                flags["potential_deepfake"] = True
+                detailed_analysis["deepfake_score"] = deepfake_score
+
+        if deepfake_indicators_found:
+            flags["potential_deepfake"] = True
+            detailed_analysis["deepfake_indicators"] = deepfake_indicators_found
+
+        # Check for image manipulation using the dominant color distribution,
+        # when Vision was asked for it (IMAGE_COLOR_CHECK). The threshold is
+        # for Vision's color scores: local pixel fractions mostly measure how
+        # flat an image is and would flag logos, charts and screenshots.
+        if response.image_properties_annotation:
+            color_scores = [color.score for color in response.image_properties_annotation.dominant_colors.colors]
+        else:
+            color_scores = []
+        if len(color_scores) > 1 and np.std(color_scores) > self._color_distribution_threshold:
+            flags["potential_deepfake"] = True
+            detailed_analysis.setdefault("deepfake_indicators", []).append("unusual color distribution")
+
+        if hate_symbol_locations:
+            flags["hate_symbols"] = True
+            detailed_analysis["hate_symbol_locations"] = hate_symbol_locations
+
+        # Determine overall safety - most severe concerns first
+        if flags:
+            if not self._unsafe_flags.isdisjoint(flags):
+                results["overall_safety"] = "unsafe"
+            elif not self._questionable_flags.isdisjoint(flags) or len(flags) > self._multiple_flag_count:
+                results["overall_safety"] = "questionable"
+            else:
+                results["overall_safety"] = "potentially_concerning"
+
+        results["content_flags"] = list(flags)
+        return results
+
+
+def compile_policy(policy=None, base=None):
+    """
+    Compile a declarative image policy
+
+    Args:
+        policy (dict): Policy settings; missing keys are taken from base
+        base (dict): Policy to inherit from, DEFAULT_IMAGE_POLICY by default
+
+    Returns:
+        CompiledImagePolicy: The compiled policy
+    """
+    merged = dict(base or DEFAULT_IMAGE_POLICY)
+    merged.update(policy or {})
+    return CompiledImagePolicy(merged)
+
+
+_default_policy = None
+
+
+def default_policy():
+    """
+    The compiled DEFAULT_IMAGE_POLICY, built once per process
+
+    Building it before server workers fork (see warm_up in flask_server)
+    lets them share it.
+    """
+    global _default_policy
+    if _default_policy is None:
+        _default_policy = compile_policy()
+    return _default_policy
+
+
+def load_policies(directory):
+    """
+    Compile every *.json policy in a directory
+
+    Returns:
+        dict: {policy name: CompiledImagePolicy}; the name defaults to the file name
+    """
+    policies = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                policy = json.load(f)
+            policy.setdefault("name", os.path.splitext(filename)[0])
+            policies[policy["name"]] = compile_policy(policy)
+            logger.info(f"Loaded image policy {policy['name']} (version {policy.get('version', '?')})")
+        except Exception as e:
+            logger.error(f"Error loading image policy {filename}: {str(e)}")
+    return policies
@@ -0,0 +1,335 @@
+import os
+import io
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from image_frames import is_animated
+
+# Supported obscuring methods:
+#   gaussian   - full resolution Gaussian blur (reference, slowest)
+#   downsample - shrink, blur with a small radius, scale back up
+#   pixelate   - shrink and scale back up with nearest neighbour
+BLUR_METHODS = ("gaussian", "downsample", "pixelate")
+
+DEFAULT_BLUR_METHOD = os.getenv("IMAGE_BLUR_METHOD", "downsample")
+
+# Radius (in pixels of the reduced image) the downsample method blurs with.
+# Keeping it small is what makes the method cheap: the work done by a large
+# radius at full resolution is instead done by the reduction itself.
+_REDUCED_BLUR_RADIUS = 2
+
+
+def _blurrable(image):
+    """Return the image in a mode PIL can filter and resample"""
+    if image.mode in ("RGB", "RGBA", "L", "LA"):
+        return image
+    if image.mode == "P" and "transparency" in image.info:
+        return image.convert("RGBA")
+    if image.mode in ("PA", "RGBa", "La"):
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def _reduction_factor(image, radius, target_radius):
+    """Pick an integer reduction factor so that radius / factor ~= target_radius"""
+    factor = max(1, int(radius // target_radius))
+    # Never reduce an image below a couple of pixels per side
+    return max(1, min(factor, image.width // 2 or 1, image.height // 2 or 1))
+
+
+def _downsample_blur(image, radius):
+    """Approximate GaussianBlur(radius) by blurring a reduced copy and scaling it back up"""
+    factor = _reduction_factor(image, radius, _REDUCED_BLUR_RADIUS)
+    if factor == 1:
+        return image.filter(ImageFilter.GaussianBlur(radius=radius))
+
+    small = image.reduce(factor)
+    small = small.filter(ImageFilter.GaussianBlur(radius=radius / factor))
+    return small.resize(image.size, Image.BILINEAR)
+
+
+def _pixelate(image, radius):
+    """Obscure the image with square blocks roughly the size of the blur radius"""
+    factor = _reduction_factor(image, radius, 1)
+    if factor == 1:
+        return image.copy()
+
+    small = image.reduce(factor)
+    return small.resize(image.size, Image.NEAREST)
+
+
+def obscure_image(image, radius, method=DEFAULT_BLUR_METHOD):
+    """
+    Obscure an image with a blur of roughly the given radius
+
+    Args:
+        image (PIL.Image.Image): Image to obscure (left unmodified)
+        radius (int): Gaussian blur radius the result should look like
+        method (str): One of BLUR_METHODS
+
+    Returns:
+        PIL.Image.Image: A new, obscured image of the same size
+    """
+    if method not in BLUR_METHODS:
+        raise ValueError(f"Unknown blur method: {method}")
+
+    image = _blurrable(image)
+    if radius <= 0:
+        return image.copy()
+
+    if method == "gaussian":
+        return image.filter(ImageFilter.GaussianBlur(radius=radius))
+    elif method == "pixelate":
+        return _pixelate(image, radius)
+    else:
+        return _downsample_blur(image, radius)
+
+
+def box_to_pixels(vertices, width, height, padding=0):
+    """
+    Convert a normalized bounding polygon to a pixel box clamped to the image
+
+    Returns:
+        tuple: (left, top, right, bottom), or None if the box is empty
+    """
+    xs = [v["x"] * width for v in vertices]
+    ys = [v["y"] * height for v in vertices]
+    if not xs or not ys:
+        return None
+
+    left = max(0, int(min(xs)) - padding)
+    top = max(0, int(min(ys)) - padding)
+    right = min(width, int(round(max(xs))) + padding)
+    bottom = min(height, int(round(max(ys))) + padding)
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right, bottom
+
+
+def obscure_regions(image, boxes, radius, method=DEFAULT_BLUR_METHOD, padding=4):
+    """
+    Obscure only the given regions of an image, leaving the rest untouched
+
+    Each region is cropped into its own tile, obscured and pasted back, so
+    the cost scales with the area of the regions rather than the frame.
+
+    Args:
+        image (PIL.Image.Image): Image to obscure (left unmodified)
+        boxes (list): Normalized bounding polygons (lists of {"x", "y"} vertices)
+        radius (int): Blur radius applied to every region
+        method (str): One of BLUR_METHODS
+        padding (int): Extra pixels obscured around each region
+
+    Returns:
+        PIL.Image.Image: A new image with the regions obscured
+    """
+    result = _blurrable(image).copy()
+    for vertices in boxes:
+        region = box_to_pixels(vertices, result.width, result.height, padding)
+        if region is None:
+            continue
+        tile = result.crop(region)
+        result.paste(obscure_image(tile, radius, method=method), region[:2])
+    return result
+
+
+def localized_regions(results):
+    """
+    Collect the boxes of the localizable content flags
+
+    Returns:
+        tuple: (normalized bounding polygons, whether every flag was localized)
+    """
+    detailed_analysis = results.get("detailed_analysis", {})
+    regions = []
+    complete = True
+    for flag in results["content_flags"]:
+        if flag == "personal_info" and detailed_analysis.get("pii_locations"):
+            regions.extend(loc["bounding_box"] for loc in detailed_analysis["pii_locations"])
+        elif flag == "hate_symbols" and detailed_analysis.get("hate_symbol_locations"):
+            regions.extend(loc["bounding_box"] for loc in detailed_analysis["hate_symbol_locations"])
+        elif flag.startswith("concerning_object:"):
+            name = flag.split(":", 1)[1]
+            regions.extend(obj["bounding_box"] for obj in results["detected_objects"] if obj["name"] == name)
+        else:
+            # Whole-frame concern (safe search, labels, text, deepfake...)
+            complete = False
+    return regions, complete
+
+
+def create_processed_image(image, results, blur_settings, obscure="auto", method=DEFAULT_BLUR_METHOD):
+    """
+    Create a processed image based on the analysis results
+
+    Args:
+        image (PIL.Image.Image): The original image that was analyzed
+        results (dict): Analysis results
+        blur_settings (dict): Blur radius per overall safety level
+        obscure (str): "full", "regions" or "auto"
+        method (str): One of BLUR_METHODS
+
+    Returns:
+        PIL.Image.Image: The processed RGBA image
+    """
+    if obscure not in ("full", "regions", "auto"):
+        raise ValueError(f"Unknown obscure mode: {obscure}")
+
+    # Apply visual indicator based on safety score: strong blur for unsafe,
+    # medium for questionable and light for potentially concerning content
+    blur_radius = blur_settings.get(results["overall_safety"])
+    regions = None
+    if blur_radius and obscure != "full":
+        regions, complete = localized_regions(results)
+        if obscure == "auto" and not complete:
+            regions = None
+
+    if regions:
+        # Only the flagged regions are obscured, always with the strongest blur
+        processed_image = obscure_regions(image, regions, blur_settings["unsafe"], method=method)
+    elif blur_radius:
+        processed_image = obscure_image(image, blur_radius, method=method)
+    else:
+        processed_image = image.copy()
+
+    # Convert to RGBA if not already (needed for drawing)
+    if processed_image.mode != 'RGBA':
+        processed_image = processed_image.convert('RGBA')
+
+    draw = ImageDraw.Draw(processed_image)
+
+    # Draw detected objects with bounding boxes
+    for obj in results["detected_objects"]:
+        name = obj["name"]
+        vertices = obj["bounding_box"]
+        x_coords = [v["x"] * image.width for v in vertices]
+        y_coords = [v["y"] * image.height for v in vertices]
+
+        # Draw rectangle
+        is_concerning = any(f"concerning_object:{name}" in flag for flag in results["content_flags"])
+        color = (255, 0, 0, 180) if is_concerning else (0, 255, 0, 180)
+
+        # Convert to list of tuples for drawing
+        xy = list(zip(x_coords, y_coords))
+        draw.polygon(xy, outline=color)
+
+        # Add label at top of bounding box
+        draw.text((min(x_coords), min(y_coords) - 10), name, fill=color)
+        
+    # NEW: If PII was detected, highlight the areas
+    if "personal_info" in results["content_flags"] and "pii_locations" in results.get("detailed_analysis", {}):
+        for pii_loc in results["detailed_analysis"]["pii_locations"]:
+            vertices = pii_loc["bounding_box"]
+            x_coords = [v["x"] * image.width for v in vertices]
+            y_coords = [v["y"] * image.height for v in vertices]
+            
+            # Draw rectangle with red color
+            xy = list(zip(x_coords, y_coords))
+            draw.polygon(xy, outline=(255, 0, 0, 255), width=3)
+            
+            # Add "PII DETECTED" label
+            draw.text((min(x_coords), min(y_coords) - 15), "PII DETECTED", fill=(255, 0, 0, 255))
+            
+    # NEW: If hate symbols were detected, highlight them
+    if "hate_symbols" in results["content_flags"] and "hate_symbol_locations" in results.get("detailed_analysis", {}):
+        for symbol_loc in results["detailed_analysis"]["hate_symbol_locations"]:
+            vertices = symbol_loc["bounding_box"]
+            x_coords = [v["x"] * image.width for v in vertices]
+            y_coords = [v["y"] * image.height for v in vertices]
+            
+            # Draw rectangle with purple color
+            xy = list(zip(x_coords, y_coords))
+            draw.polygon(xy, outline=(128, 0, 128, 255), width=3)
+            
+            # Add "HATE SYMBOL" label
+            draw.text((min(x_coords), min(y_coords) - 15), "HATE SYMBOL", fill=(128, 0, 128, 255))
+        
+    return processed_image
+
+
+def compose_side_by_side(original_image, processed_image, results):
+    """Compose original and processed images side by side with the verdict drawn on top"""
+    # Ensure both images have the same mode
+    if original_image.mode != processed_image.mode:
+        original_image = original_image.convert('RGBA')
+        processed_image = processed_image.convert('RGBA')
+
+    # Get dimensions
+    width, height = original_image.size
+
+    # Create a new image with double width
+    combined_image = Image.new(original_image.mode, (width * 2, height))
+
+    # Paste original image on the left
+    combined_image.paste(original_image, (0, 0))
+
+    # Paste processed image on the right
+    combined_image.paste(processed_image, (width, 0))
+
+    # Add a dividing line
+    draw = ImageDraw.Draw(combined_image)
+    draw.line([(width, 0), (width, height)], fill=(255, 0, 0, 255), width=2)
+
+    # Add safety label
+    safety_text = results["overall_safety"].upper().replace("_", " ")
+    action_text = results["suggested_action"].upper()
+
+    # Try to load a font (fallback to default if not available)
+    try:
+        font = ImageFont.truetype("arial.ttf", 20)
+    except IOError:
+        font = ImageFont.load_default()
+
+    # Add safety info text to the right side
+    text_position = (width + 10, 10)
+    text_color = (255, 0, 0, 255) if results["overall_safety"] == "unsafe" else (255, 165, 0, 255)
+    draw.text(text_position, f"STATUS: {safety_text}", fill=text_color, font=font)
+    draw.text((width + 10, 40), f"ACTION: {action_text}", fill=text_color, font=font)
+
+    return combined_image
+
+
+def render(image, results, blur_settings, view="processed", obscure="auto", method=DEFAULT_BLUR_METHOD):
+    """
+    Render the processed image (or a side-by-side comparison) for analysis results
+
+    Args:
+        image (PIL.Image.Image): The original image that was analyzed
+        results (dict): Analysis results
+        blur_settings (dict): Blur radius per overall safety level
+        view (str): "processed" for the obscured image, "comparison" for original and processed side by side
+        obscure (str): "full", "regions" or "auto"
+        method (str): One of BLUR_METHODS
+
+    Returns:
+        PIL.Image.Image: The rendered image
+    """
+    if view not in ("processed", "comparison"):
+        raise ValueError(f"Unknown render view: {view}")
+
+    # Animated images are rendered from the frame the verdict came from
+    frames = results.get("frames")
+    if frames and is_animated(image):
+        image.seek(frames["worst_frame"])
+        image = image.convert("RGB")
+
+    processed_image = create_processed_image(image, results, blur_settings, obscure=obscure, method=method)
+    if view == "comparison":
+        return compose_side_by_side(image, processed_image, results)
+    return processed_image
+
+
+def encode_image(image, image_format="jpeg"):
+    """Encode a rendered image as JPEG or PNG bytes"""
+    output = io.BytesIO()
+    if image_format == "jpeg":
+        image.convert("RGB").save(output, "JPEG", quality=85)
+    elif image_format == "png":
+        image.save(output, "PNG")
+    else:
+        raise ValueError(f"Unsupported format: {image_format}")
+    return output.getvalue()
+
+
+def render_encoded(data, results, blur_settings, view="processed", obscure="auto", method=DEFAULT_BLUR_METHOD, image_format="jpeg"):
+    """Decode an encoded image, render it and encode the result (see render)"""
+    rendered = render(Image.open(io.BytesIO(data)), results, blur_settings, view=view, obscure=obscure, method=method)
+    return encode_image(rendered, image_format)
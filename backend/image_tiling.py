@@ -0,0 +1,185 @@
+import os
+import math
+
+from google.cloud import vision
+
+from image_policy import SAFE_SEARCH_CATEGORIES
+
+
+def _plan_axis(size, tile, overlap):
+    """
+    Split one axis into overlapping segments
+
+    Returns:
+        list: [((start, end), (core_start, core_end))]. The cores partition the
+            axis at the middle of every overlap, so each point is owned by
+            exactly one tile.
+    """
+    if size <= tile:
+        return [((0, size), (0, size))]
+
+    count = math.ceil((size - overlap) / (tile - overlap))
+    starts = [round(i * (size - tile) / (count - 1)) for i in range(count)]
+    segments = [(start, start + tile) for start in starts]
+    cuts = [(segments[i + 1][0] + segments[i][1]) / 2 for i in range(count - 1)]
+    bounds = [0] + cuts + [size]
+    return [(segments[i], (bounds[i], bounds[i + 1])) for i in range(count)]
+
+
+class Tile:
+    """A crop of a large image and the part of it this tile is authoritative for"""
+
+    def __init__(self, box, core):
+        self.left, self.top, self.right, self.bottom = box
+        self.core = core
+
+    @property
+    def box(self):
+        return (self.left, self.top, self.right, self.bottom)
+
+    def owns(self, x, y):
+        """Whether an image pixel position falls in this tile's core"""
+        left, top, right, bottom = self.core
+        return left <= x < right and top <= y < bottom
+
+
+class ImageTiler:
+    """
+    Split very large or very tall images into overlapping tiles
+
+    Long screenshots and infographics lose their text when Vision downsamples
+    them, so they are annotated as overlapping tiles whose results are merged
+    back into one response in whole-image coordinates.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("IMAGE_TILING", "1") != "0"
+        # Images whose longest side exceeds this are tiled
+        self.threshold = int(os.getenv("IMAGE_TILE_THRESHOLD", 4000))
+        self.tile_size = int(os.getenv("IMAGE_TILE_SIZE", 1600))
+        # Must exceed the height of a line of text so every word is whole in its owning tile
+        self.overlap = int(os.getenv("IMAGE_TILE_OVERLAP", 128))
+        self.max_tiles = int(os.getenv("IMAGE_MAX_TILES", 48))
+        # Tiles per Vision batch request, and batch requests in flight at once
+        self.batch_size = min(16, max(1, int(os.getenv("IMAGE_TILE_BATCH", 8))))
+        self.workers = max(1, int(os.getenv("IMAGE_TILE_WORKERS", 4)))
+
+    def should_tile(self, image):
+        return self.enabled and max(image.width, image.height) > self.threshold
+
+    def plan(self, width, height):
+        """
+        Returns:
+            list: Tiles in reading order (top to bottom, left to right)
+        """
+        tile_size = self.tile_size
+        while True:
+            rows = _plan_axis(height, tile_size, self.overlap)
+            columns = _plan_axis(width, tile_size, self.overlap)
+            if len(rows) * len(columns) <= self.max_tiles:
+                break
+            # Too many tiles: use bigger ones and let Vision downsample them a little
+            tile_size = int(tile_size * 1.25)
+
+        return [
+            Tile((x0, y0, x1, y1), (cx0, cy0, cx1, cy1))
+            for (y0, y1), (cy0, cy1) in rows
+            for (x0, x1), (cx0, cx1) in columns
+        ]
+
+
+def _offset_poly(poly, tile):
+    return vision.BoundingPoly(vertices=[vision.Vertex(x=vertex.x + tile.left, y=vertex.y + tile.top) for vertex in poly.vertices])
+
+
+def _poly_center(poly):
+    xs = [vertex.x for vertex in poly.vertices]
+    ys = [vertex.y for vertex in poly.vertices]
+    return (sum(xs) / len(xs), sum(ys) / len(ys)) if xs else (0, 0)
+
+
+def merge_tile_responses(tiles, responses, width, height):
+    """
+    Merge per-tile Vision responses into one response for the whole image
+
+    Safe search takes the most likely value of every category, labels the
+    best score per description. Words, objects and faces are mapped to image
+    coordinates and kept only from the tile whose core contains their center,
+    which removes the duplicates seen in the overlaps.
+
+    Args:
+        tiles (list): Tiles returned by ImageTiler.plan
+        responses (list): AnnotateImageResponse per tile, in the same order
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+
+    Returns:
+        vision.AnnotateImageResponse: Response in whole-image coordinates
+    """
+    merged = vision.AnnotateImageResponse()
+    labels = {}
+    lines = []
+    words = []
+
+    for tile, response in zip(tiles, responses):
+        if response.error.message:
+            raise ValueError(f"Google Vision API error on tile {tile.box}: {response.error.message}")
+
+        for category in SAFE_SEARCH_CATEGORIES:
+            value = getattr(response.safe_search_annotation, category)
+            if int(value) > int(getattr(merged.safe_search_annotation, category)):
+                setattr(merged.safe_search_annotation, category, value)
+
+        for label in response.label_annotations:
+            best = labels.get(label.description)
+            if best is None or label.score > best.score:
+                labels[label.description] = label
+
+        tile_words = []
+        for word in response.text_annotations[1:]:
+            poly = _offset_poly(word.bounding_poly, tile)
+            if tile.owns(*_poly_center(poly)):
+                tile_words.append(vision.EntityAnnotation(description=word.description, bounding_poly=poly))
+        if tile_words:
+            words.extend(tile_words)
+            lines.append(" ".join(word.description for word in tile_words))
+
+        tile_width = tile.right - tile.left
+        tile_height = tile.bottom - tile.top
+        for obj in response.localized_object_annotations:
+            vertices = [
+                vision.NormalizedVertex(x=(tile.left + vertex.x * tile_width) / width, y=(tile.top + vertex.y * tile_height) / height)
+                for vertex in obj.bounding_poly.normalized_vertices
+            ]
+            if not vertices:
+                continue
+            center_x = sum(vertex.x for vertex in vertices) / len(vertices) * width
+            center_y = sum(vertex.y for vertex in vertices) / len(vertices) * height
+            if tile.owns(center_x, center_y):
+                merged.localized_object_annotations.append(vision.LocalizedObjectAnnotation(
+                    name=obj.name,
+                    score=obj.score,
+                    bounding_poly=vision.BoundingPoly(normalized_vertices=vertices)
+                ))
+
+        for face in response.face_annotations:
+            poly = _offset_poly(face.bounding_poly, tile)
+            if tile.owns(*_poly_center(poly)):
+                face = vision.FaceAnnotation(face)
+                face.bounding_poly = poly
+                merged.face_annotations.append(face)
+
+        if not merged.image_properties_annotation and response.image_properties_annotation:
+            merged.image_properties_annotation = response.image_properties_annotation
+
+    merged.label_annotations.extend(sorted(labels.values(), key=lambda label: label.score, reverse=True))
+    if words:
+        full_text = vision.EntityAnnotation(
+            description="\n".join(lines),
+            bounding_poly=vision.BoundingPoly(vertices=[
+                vision.Vertex(x=0, y=0), vision.Vertex(x=width, y=0),
+                vision.Vertex(x=width, y=height), vision.Vertex(x=0, y=height)
+            ])
+        )
+        merged.text_annotations.extend([full_text] + words)
+    return merged
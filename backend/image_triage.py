@@ -0,0 +1,243 @@
+import io
+import os
+import time
+import logging
+
+import numpy as np
+from PIL import Image
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Side of the thumbnail triage statistics are computed on
+_TRIAGE_THUMBNAIL = 64
+
+# Side of the thumbnail solid placeholders are confirmed on: a 64px
+# thumbnail averages a line of small text on a large page away
+_DETAIL_THUMBNAIL = 256
+
+# Solid placeholders compress extremely well; larger images with more
+# encoded bytes per pixel than this are not even decoded
+_PLACEHOLDER_BYTES_PER_PIXEL = 0.05
+
+TRIAGE_DECISIONS = registry.counter(
+    "image_triage_decisions_total",
+    "Local triage outcomes; reason is the gate that short-circuited the image or 'vision'",
+    ("reason",)
+)
+TRIAGE_SECONDS = registry.histogram(
+    "image_triage_seconds",
+    "Time spent in the local triage stage",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+TRIAGE_MAX_SIDE = registry.histogram(
+    "image_triage_max_side_pixels",
+    "Longest side of images seen by triage",
+    buckets=(1, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+)
+TRIAGE_LUMA_STD = registry.histogram(
+    "image_triage_luma_std",
+    "Luminance standard deviation of triage thumbnails",
+    buckets=(0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+TRIAGE_ENTROPY = registry.histogram(
+    "image_triage_entropy_bits",
+    "Luminance histogram entropy of triage thumbnails",
+    buckets=(0.25, 0.5, 1, 1.5, 2, 3, 4, 5, 6)
+)
+TRIAGE_SKIN_RATIO = registry.histogram(
+    "image_triage_skin_ratio",
+    "Fraction of skin-toned pixels in triage thumbnails",
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75)
+)
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+class ImageTriage:
+    """
+    Cheap local pre-classification ahead of the Vision call
+
+    Obviously safe inputs (spacer GIFs, tiny thumbnails, solid placeholders
+    and flat icons) are recognised from the image header and a small
+    thumbnail and never reach Vision. Anything with a noticeable share of
+    skin-toned pixels is always sent on.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("IMAGE_TRIAGE", "1") != "0"
+        # Images whose longest side is below this are too small to matter
+        self.min_side = int(os.getenv("IMAGE_TRIAGE_MIN_SIDE", 64))
+        # Thumbnails with a luminance std below this are solid placeholders,
+        # if the luminance range of the detail thumbnail is at most max_luma_range
+        self.min_luma_std = _env_float("IMAGE_TRIAGE_MIN_LUMA_STD", 2.0)
+        self.max_luma_range = _env_float("IMAGE_TRIAGE_MAX_LUMA_RANGE", 16.0)
+        # Images up to icon_max_side with entropy below this are flat icons
+        self.icon_max_side = int(os.getenv("IMAGE_TRIAGE_ICON_MAX_SIDE", 128))
+        self.icon_max_entropy = _env_float("IMAGE_TRIAGE_ICON_MAX_ENTROPY", 2.0)
+        # Never short-circuit images with more skin-toned pixels than this
+        self.max_skin_ratio = _env_float("IMAGE_TRIAGE_MAX_SKIN_RATIO", 0.2)
+
+    def triage(self, content):
+        """
+        Decide whether an image can skip Vision
+
+        Args:
+            content (bytes): Encoded image
+
+        Returns:
+            dict: Triage details if the image is obviously safe, None if it needs Vision
+        """
+        return self._decide(self._classify, content)
+
+    def triage_frames(self, frames):
+        """
+        Decide whether an animated image can skip Vision
+
+        Only the first frame is in the encoded header, so the frames Vision
+        would see are triaged instead, and the animation only skips Vision
+        when every one of them passes.
+
+        Args:
+            frames (list): [(frame index, RGB frame)] from FrameSampler.sample
+
+        Returns:
+            dict: Triage details if every frame is obviously safe, None if it needs Vision
+        """
+        return self._decide(self._classify_frames, frames)
+
+    def _decide(self, classify, image):
+        """Run a classifier, recording the outcome"""
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        try:
+            reason, features = classify(image)
+        except Exception as e:
+            # Anything we cannot probe cheaply goes to Vision
+            logger.debug(f"Triage could not inspect image: {str(e)}")
+            reason, features = None, {}
+        TRIAGE_SECONDS.observe(time.perf_counter() - start)
+        TRIAGE_DECISIONS.inc(reason=reason or "vision")
+
+        if reason is None:
+            return None
+        return {"verdict": "locally_triaged", "reason": reason, "features": features}
+
+    def _classify(self, content):
+        """Return (short-circuit reason or None, features)"""
+        # Header-only probe: PIL reads the size without decoding pixel data
+        image = Image.open(io.BytesIO(content))
+        width, height = image.size
+        max_side = max(width, height)
+        TRIAGE_MAX_SIDE.observe(max_side)
+        features = {"width": width, "height": height}
+
+        # Only bother decoding images that could pass one of the gates
+        if max_side >= self.min_side and max_side > self.icon_max_side:
+            # Large images can only pass as solid placeholders
+            if len(content) > width * height * _PLACEHOLDER_BYTES_PER_PIXEL:
+                return None, features
+            image.draft("RGB", (_DETAIL_THUMBNAIL, _DETAIL_THUMBNAIL))
+        return self._classify_pixels(image, max_side, features)
+
+    def _classify_frames(self, frames):
+        """Return (reason of the first frame if every frame passes, else None; features)"""
+        width, height = frames[0][1].size
+        TRIAGE_MAX_SIDE.observe(max(width, height))
+        features = {"width": width, "height": height, "frames": []}
+        reason = None
+        for index, frame in frames:
+            # Copied: the frames still go to Vision if one fails
+            frame_reason, frame_features = self._classify_pixels(frame.copy(), max(frame.size), {})
+            features["frames"].append({"index": index, "reason": frame_reason, **frame_features})
+            if frame_reason is None:
+                return None, features
+            reason = reason or frame_reason
+        return reason, features
+
+    def _classify_pixels(self, image, max_side, features):
+        """Return (short-circuit reason or None, features) from a thumbnail of the image"""
+        could_be_tiny = max_side < self.min_side
+
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        image.thumbnail((_DETAIL_THUMBNAIL, _DETAIL_THUMBNAIL), Image.BILINEAR, reducing_gap=2.0)
+        pixels, opaque = self._thumbnail_pixels(image.copy(), _TRIAGE_THUMBNAIL)
+        if not len(pixels):
+            # Fully transparent (e.g. spacer GIF)
+            return "transparent", features
+
+        luma = pixels @ np.array([0.299, 0.587, 0.114])
+        luma_std = float(luma.std())
+        histogram = np.bincount(luma.astype(np.int32) >> 2, minlength=64) / len(luma)
+        histogram = histogram[histogram > 0]
+        entropy = float(-(histogram * np.log2(histogram)).sum())
+        skin_ratio = self._skin_ratio(pixels)
+
+        TRIAGE_LUMA_STD.observe(luma_std)
+        TRIAGE_ENTROPY.observe(entropy)
+        TRIAGE_SKIN_RATIO.observe(skin_ratio)
+        features.update({
+            "luma_std": round(luma_std, 3),
+            "entropy_bits": round(entropy, 3),
+            "skin_ratio": round(skin_ratio, 3),
+            "opaque_ratio": round(opaque, 3)
+        })
+
+        if skin_ratio > self.max_skin_ratio:
+            return None, features
+        if could_be_tiny:
+            return "tiny", features
+        if luma_std < self.min_luma_std:
+            # Confirmed on the detail thumbnail, where thin text keeps its contrast
+            detail, _ = self._thumbnail_pixels(image, _DETAIL_THUMBNAIL)
+            detail_luma = detail @ np.array([0.299, 0.587, 0.114])
+            luma_range = float(detail_luma.max() - detail_luma.min())
+            features["luma_range"] = round(luma_range, 3)
+            if luma_range <= self.max_luma_range:
+                return "solid_color", features
+            return None, features
+        if max_side <= self.icon_max_side and entropy < self.icon_max_entropy:
+            return "flat_icon", features
+        return None, features
+
+    @staticmethod
+    def _thumbnail_pixels(image, side):
+        """Return (opaque RGB pixels of a thumbnail as float array (n, 3), opaque fraction)"""
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        image.thumbnail((side, side), Image.BILINEAR, reducing_gap=2.0)
+        rgba = np.asarray(image.convert("RGBA"), dtype=np.float64).reshape(-1, 4)
+        opaque = rgba[:, 3] > 16
+        return rgba[opaque, :3], float(opaque.mean()) if len(opaque) else 0.0
+
+    @staticmethod
+    def _skin_ratio(pixels):
+        """Fraction of pixels inside the classic YCbCr skin-tone box"""
+        r, g, b = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+        cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+        cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+        skin = (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)
+        return float(skin.mean())
+
+
+def triaged_results(source, image_size, triage):
+    """Analysis results for an image that was short-circuited by triage"""
+    return {
+        "source": source,
+        "image_size": image_size,
+        "safe_search": {},
+        "labels": [],
+        "text_content": "",
+        "detected_objects": [],
+        "content_flags": [],
+        "overall_safety": "safe",
+        "detailed_analysis": {},
+        "suggested_action": "allow",
+        "triage": triage
+    }
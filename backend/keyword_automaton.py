@@ -0,0 +1,62 @@
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed keyword set
+
+    Reports the tags of every keyword occurring anywhere in a string
+    (substring semantics, overlaps included) in a single pass, so lookup
+    cost depends on the length of the string rather than on the number of
+    keywords.
+    """
+
+    def __init__(self, tagged_keywords):
+        """
+        Args:
+            tagged_keywords (iterable): (keyword, tag) pairs; keywords are lowercased
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        outputs = [set()]
+        for keyword, tag in tagged_keywords:
+            state = 0
+            for char in keyword.lower():
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(tag)
+
+        # Breadth-first construction of failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                outputs[next_state] |= outputs[self._fail[next_state]]
+
+        self._output = [frozenset(tags) for tags in outputs]
+
+    def find(self, text):
+        """Return the set of tags of all keywords occurring in text (case-insensitive)"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
@@ -0,0 +1,118 @@
+import re
+from bisect import bisect_right
+
+from keyword_automaton import KeywordAutomaton
+
+
+class OcrScanResult:
+    """Hits found by OcrTextScanner.scan"""
+
+    def __init__(self, text):
+        self.text = text
+        # PII type of every hit, in text order
+        self.pii_hits = []
+        # [{"type": pii_type, "bounding_box": normalized vertices}]
+        self.pii_locations = []
+        # {category: [keyword, ...]} in the order the category lists them
+        self.keywords = {}
+
+
+class OcrTextScanner:
+    """
+    Scan OCR output for PII and keyword categories
+
+    The OCR words are joined once into a single string with a word -> offset
+    table. Every keyword is found in one pass of a KeywordAutomaton, and each
+    PII pattern runs over the string on its own, so hits that overlap (a
+    keyword inside another, or a number matching several PII patterns) are
+    all reported. PII hits are mapped back to the union of the bounding
+    boxes of the words they span, so values split across several OCR words
+    (e.g. "+91 98765 43210") are still found.
+    """
+
+    def __init__(self, pii_patterns, keyword_categories):
+        """
+        Args:
+            pii_patterns (dict): {pii_type: regex}
+            keyword_categories (dict): {category: [keyword, ...]}. Keywords are
+                matched case-insensitively anywhere in the text.
+        """
+        self._pii_patterns = [(pii_type, re.compile(pattern)) for pii_type, pattern in pii_patterns.items()]
+
+        # (category, keyword) tags, in the order the categories list them
+        self._keyword_order = {}
+        for category, keywords in keyword_categories.items():
+            for keyword in keywords:
+                self._keyword_order.setdefault((category, keyword), len(self._keyword_order))
+        self._keywords = KeywordAutomaton((keyword, (category, keyword)) for category, keyword in self._keyword_order)
+
+    def scan(self, word_annotations, image_width, image_height, full_text=None):
+        """
+        Scan OCR word annotations
+
+        Args:
+            word_annotations (list): Vision text annotations for individual words
+                (response.text_annotations[1:])
+            image_width (int): Width of the analyzed image in pixels
+            image_height (int): Height of the analyzed image in pixels
+            full_text (str): Text to scan when there are no word annotations
+
+        Returns:
+            OcrScanResult: PII locations and keyword hits
+        """
+        words = [annotation.description for annotation in word_annotations]
+        if words:
+            # Word -> offset table for the joined text
+            starts = []
+            offset = 0
+            for word in words:
+                starts.append(offset)
+                offset += len(word) + 1
+            text = " ".join(words)
+        else:
+            starts = []
+            text = full_text or ""
+
+        result = OcrScanResult(text)
+        for category, keyword in sorted(self._keywords.find(text), key=self._keyword_order.__getitem__):
+            result.keywords.setdefault(category, []).append(keyword)
+
+        matches = [
+            (match.start(), match.end(), pii_type)
+            for pii_type, pattern in self._pii_patterns
+            for match in pattern.finditer(text)
+        ]
+        # Text order; a value matching several patterns keeps the pattern order
+        matches.sort(key=lambda match: match[0])
+        for start, end, pii_type in matches:
+            result.pii_hits.append(pii_type)
+            if not starts:
+                continue
+            first = bisect_right(starts, start) - 1
+            last = bisect_right(starts, end - 1) - 1
+            box = self._union_box(word_annotations[first:last + 1], image_width, image_height)
+            if box:
+                result.pii_locations.append({"type": pii_type, "bounding_box": box})
+
+        return result
+
+    @staticmethod
+    def _union_box(annotations, image_width, image_height):
+        """Normalized rectangle covering the bounding polygons of the given words"""
+        xs = []
+        ys = []
+        for annotation in annotations:
+            for vertex in annotation.bounding_poly.vertices:
+                xs.append(vertex.x)
+                ys.append(vertex.y)
+        if not xs:
+            return []
+
+        left, right = min(xs) / image_width, max(xs) / image_width
+        top, bottom = min(ys) / image_height, max(ys) / image_height
+        return [
+            {"x": left, "y": top},
+            {"x": right, "y": top},
+            {"x": right, "y": bottom},
+            {"x": left, "y": bottom}
+        ]
@@ -0,0 +1,87 @@
+import re
+
+# Digit runs (with a decimal point or comma right after them), runs of ASCII
+# uppercase letters, "@" and "+": everything the PII patterns are built from.
+# Text without any of them (most UI strings) is scanned in one failed search.
+_CHARACTER_RUNS = re.compile(
+    r"(?P<digits>\d+)(?:(?P<decimal>\.(?=\d))|(?P<comma>,))?|(?P<upper>[A-Z]+)|(?P<at>@)|(?P<plus>\+)"
+)
+
+
+class CharacterProfile:
+    """Counts of the character classes PII patterns need, from one scan of a text"""
+
+    __slots__ = ("digits", "longest_digits", "decimals", "digit_commas", "longest_upper", "at", "plus")
+
+    def __init__(self):
+        self.digits = 0
+        self.longest_digits = 0
+        self.decimals = 0         # "12.5"
+        self.digit_commas = 0     # "12,"
+        self.longest_upper = 0
+        self.at = False
+        self.plus = False
+
+
+def profile_characters(text):
+    """
+    Profile the character classes of a text in one scan
+
+    Returns:
+        CharacterProfile: Digit count and longest run, decimal points and
+            commas after digits, longest uppercase run, "@" and "+"
+    """
+    profile = CharacterProfile()
+    for run in _CHARACTER_RUNS.finditer(text):
+        kind = run.lastgroup
+        if kind == "upper":
+            profile.longest_upper = max(profile.longest_upper, run.end() - run.start())
+        elif kind == "at":
+            profile.at = True
+        elif kind == "plus":
+            profile.plus = True
+        else:
+            length = run.end("digits") - run.start("digits")
+            profile.digits += length
+            profile.longest_digits = max(profile.longest_digits, length)
+            if kind == "decimal":
+                profile.decimals += 1
+            elif kind == "comma":
+                profile.digit_commas += 1
+    return profile
+
+
+# What a text needs for any pattern of a category to match, derived from the
+# patterns in text_content_filteration.PII_PATTERNS: a category whose
+# requirement fails cannot match and its scanner is skipped. Keep them loose
+# (necessary, not sufficient) and in sync when a pattern changes.
+CATEGORY_REQUIREMENTS = {
+    # 10 digits in runs of 5 or more, or "+" and a run of 6
+    "phone_numbers": lambda p: p.longest_digits >= 5 and (p.digits >= 10 or (p.plus and p.longest_digits >= 6)),
+    "emails": lambda p: p.at,
+    # 12 digits in groups of 4, or "XXXX XXXX 1234"
+    "aadhaar": lambda p: p.longest_digits >= 4 and (p.digits >= 12 or p.longest_upper >= 4),
+    "pan": lambda p: p.longest_upper >= 5 and p.longest_digits >= 4,
+    "account_numbers": lambda p: p.longest_digits >= 11,
+    "ifsc_codes": lambda p: p.longest_upper >= 4 and p.digits >= 1,
+    "swift_codes": lambda p: p.longest_upper >= 6,
+    "credit_cards": lambda p: p.digits >= 13 and p.longest_digits >= 4,
+    "passport_numbers": lambda p: p.longest_upper >= 1 and p.longest_digits >= 7,
+    "ssn": lambda p: p.digits >= 9 and p.longest_digits >= 4,
+    "gps_coordinates": lambda p: p.decimals >= 2 and p.digit_commas >= 1,
+    "nhs_numbers": lambda p: p.digits >= 10 and p.longest_digits >= 4,
+}
+
+
+def possible_categories(text):
+    """
+    Categories whose patterns can match the text
+
+    Returns:
+        set: Category names of CATEGORY_REQUIREMENTS
+    """
+    profile = profile_characters(text)
+    if not (profile.digits or profile.at or profile.longest_upper >= 6):
+        # Every category but emails and SWIFT codes needs digits
+        return set()
+    return {category for category, requirement in CATEGORY_REQUIREMENTS.items() if requirement(profile)}
@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import image_rendering
+
+logger = logging.getLogger(__name__)
+
+
+def render_pool_size():
+    """
+    Number of render processes from IMAGE_RENDER_PROCESSES
+
+    "0" (default) disables the pool, "auto" shares the cores between the
+    server's worker processes (WEB_CONCURRENCY, as used by gunicorn).
+    """
+    setting = os.getenv("IMAGE_RENDER_PROCESSES", "0")
+    if setting == "auto":
+        server_workers = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+        return max(1, (os.cpu_count() or 1) // server_workers)
+    return max(0, int(setting))
+
+
+def _to_shared(data):
+    """Copy bytes into a new shared memory block (the caller closes and unlinks it)"""
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block
+
+
+def _take_shared(name, size):
+    """Read bytes out of a shared memory block and release it"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _render_job(name, size, results, blur_settings, view, obscure, method, image_format):
+    """
+    Pool process entry point: decode, render and encode an image
+
+    The encoded input is read from, and the encoded output written to, shared
+    memory, so neither is pickled through the pool's pipes.
+
+    Returns:
+        tuple: (name of the shared memory block holding the output, output size)
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(block.buf[:size])
+    finally:
+        block.close()
+
+    output = image_rendering.render_encoded(
+        data, results, blur_settings, view=view, obscure=obscure, method=method, image_format=image_format
+    )
+    block = _to_shared(output)
+    block.close()
+    return block.name, len(output)
+
+
+class RenderPool:
+    """
+    Process pool for the CPU-bound image stages (decode, blur, draw, compose, encode)
+
+    Renders run outside the server process so they neither hold its GIL nor
+    block text requests. Jobs in flight are bounded at twice the number of
+    processes; further callers wait for a slot.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers * 2)
+
+    def _get_executor(self):
+        # Created on first use so that forking server workers don't inherit it
+        with self._lock:
+            if self._executor is None:
+                start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                context = multiprocessing.get_context(start_method)
+                if start_method == "forkserver":
+                    context.set_forkserver_preload(["image_rendering"])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                logger.info(f"Started render pool with {self.workers} {start_method} processes")
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, data, results, blur_settings, view="processed", obscure="auto", method=image_rendering.DEFAULT_BLUR_METHOD, image_format="jpeg"):
+        """
+        Render an encoded image in a pool process (see image_rendering.render_encoded)
+
+        Raises:
+            concurrent.futures.process.BrokenProcessPool: A pool process died;
+                the pool is restarted on the next call
+        """
+        with self._slots:
+            executor = self._get_executor()
+            block = _to_shared(data)
+            try:
+                future = executor.submit(
+                    _render_job, block.name, len(data), results, blur_settings, view, obscure, method, image_format
+                )
+                name, size = future.result()
+            except BrokenProcessPool:
+                self._reset(executor)
+                raise
+            finally:
+                block.close()
+                block.unlink()
+        return _take_shared(name, size)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown()
+
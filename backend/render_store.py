@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Bump when rendering changes so stored renders from older code are not served
+RENDER_VERSION = "1"
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+STORE_LOOKUPS = registry.counter(
+    "render_store_lookups_total",
+    "Render store lookups by result (hit or miss)",
+    ("result",)
+)
+
+
+def render_key(data, policy, view, obscure, image_format, method, blur_settings):
+    """
+    Content address of a render
+
+    Args:
+        data (bytes): The encoded input image
+        policy (CompiledImagePolicy): Policy the image is evaluated with
+        view, obscure, image_format, method, blur_settings: Render settings
+
+    Returns:
+        str: 64 character hex key
+    """
+    material = json.dumps({
+        "input": hashlib.sha256(data).hexdigest(),
+        "policy": [policy.name, policy.version],
+        "view": view,
+        "obscure": obscure,
+        "format": image_format,
+        "method": method,
+        "blur": blur_settings,
+        "render_version": RENDER_VERSION
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def is_render_key(key):
+    return bool(_KEY_PATTERN.match(key))
+
+
+class StoredRender:
+    """A render held by the store"""
+
+    def __init__(self, key, path, meta):
+        self.key = key
+        self.path = path
+        # Verdict and mimetype of the render
+        self.meta = meta
+
+
+class RenderStore:
+    """
+    Content-addressed, size-bounded disk store for rendered images
+
+    Renders are written once under their key (see render_key) with a JSON
+    sidecar holding the verdict, and evicted least recently used first when
+    the store grows past max_bytes. Recency survives restarts through file
+    modification times. Several server processes can share a directory;
+    each one bounds the store with its own view of it.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._entries = OrderedDict()
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_env(cls):
+        """Store configured by RENDER_STORE_DIR / RENDER_STORE_MAX_BYTES, or None when disabled"""
+        max_bytes = int(os.getenv("RENDER_STORE_MAX_BYTES", 512 * 1024 * 1024))
+        if max_bytes <= 0:
+            return None
+        directory = os.getenv("RENDER_STORE_DIR", os.path.join(tempfile.gettempdir(), "socio_renders"))
+        return cls(directory, max_bytes)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key[:2], key)
+        return base + ".bin", base + ".json"
+
+    def _load(self):
+        """Index the renders already on disk, oldest first"""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                key, extension = os.path.splitext(name)
+                if extension != ".bin" or not is_render_key(key):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        if found:
+            logger.info(f"Render store {self.directory}: {len(found)} renders, {self._total} bytes")
+
+    def get(self, key):
+        """
+        Returns:
+            StoredRender: The render, or None if it is not stored
+        """
+        if not is_render_key(key):
+            return None
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            # Touch the render so its recency survives restarts
+            os.utime(data_path)
+        except (OSError, ValueError):
+            STORE_LOOKUPS.inc(result="miss")
+            return None
+        STORE_LOOKUPS.inc(result="hit")
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # Written by another process sharing the directory
+                size = os.path.getsize(data_path)
+                self._entries[key] = size
+                self._total += size
+        return StoredRender(key, data_path, meta)
+
+    def put(self, key, data, meta):
+        """
+        Store a render (atomically, so readers never see a partial file)
+
+        Args:
+            key (str): Key from render_key
+            data (bytes): Encoded render
+            meta (dict): JSON serializable metadata served with it
+
+        Returns:
+            StoredRender: The stored render
+        """
+        data_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        for path, payload in ((data_path, data), (meta_path, json.dumps(meta).encode())):
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(payload)
+            os.replace(temp_path, path)
+
+        with self._lock:
+            self._total += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = []
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._total -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            for path in self._paths(old_key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        if evicted:
+            logger.info(f"Render store evicted {len(evicted)} renders")
+        return StoredRender(key, data_path, meta)
@@ -0,0 +1,142 @@
+import os
+import re
+import hmac
+import time
+import cProfile
+import tempfile
+import threading
+import itertools
+
+from metrics import stage_log
+
+# Shared secret callers send in X-Profile-Token; profiling is disabled when unset
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+
+_DUMP_NAME = re.compile(r"^[0-9]+-[0-9]+-[0-9]+-[a-z_.]+\.pstats$")
+
+
+def profiling_authorized(token):
+    """Whether a request's X-Profile-Token grants profiling"""
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+class ProfileRing:
+    """
+    Bounded directory of cProfile dumps, the oldest removed first
+
+    Dumps are standard pstats files: inspect them with
+    `python -m pstats <file>` or any pstats viewer.
+    """
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Ring configured by PROFILE_DIR / PROFILE_RING_SIZE"""
+        directory = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "socio_profiles"))
+        return cls(directory, max(1, int(os.getenv("PROFILE_RING_SIZE", 20))))
+
+    def save(self, profiler, label):
+        """
+        Write a profile to the ring
+
+        Args:
+            profiler (cProfile.Profile): Stopped profiler
+            label (str): Endpoint the profile was taken on
+
+        Returns:
+            str: Name of the dump, for path()
+        """
+        name = f"{time.time_ns()}-{os.getpid()}-{next(self._counter)}-{label}.pstats"
+        profiler.dump_stats(os.path.join(self.directory, name))
+        with self._lock:
+            dumps = sorted(
+                (entry for entry in os.scandir(self.directory) if _DUMP_NAME.match(entry.name)),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            for entry in dumps[:-self.size]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        return name
+
+    def path(self, name):
+        """Path of a dump, or None if there is no such dump"""
+        if not _DUMP_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+
+_profile_ring = None
+
+
+def profile_ring():
+    """The process's ProfileRing, created when the first dump is written"""
+    global _profile_ring
+    if _profile_ring is None:
+        _profile_ring = ProfileRing.from_env()
+    return _profile_ring
+
+
+class RequestProfile:
+    """
+    Timing breakdown, and optionally a cProfile dump, of one request
+
+    Stages timed with metrics.stage_timer while the profile is active are
+    collected through a context variable, so concurrent requests do not see
+    each other's stages.
+    """
+
+    def __init__(self, capture=False):
+        """
+        Args:
+            capture (bool): Also run cProfile over the request
+        """
+        self.stages = []
+        self.profiler = cProfile.Profile() if capture else None
+        self._token = None
+        self._start = None
+        self.total = None
+
+    def start(self):
+        self._token = stage_log.set(self.stages)
+        self._start = time.perf_counter()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self):
+        """Stop collecting (safe to call more than once)"""
+        if self._token is None:
+            return
+        if self.profiler:
+            self.profiler.disable()
+        self.total = time.perf_counter() - self._start
+        stage_log.reset(self._token)
+        self._token = None
+
+    def breakdown(self):
+        """
+        Returns:
+            list: (stage, total seconds, calls) in order of first occurrence
+        """
+        totals = {}
+        for stage, elapsed in self.stages:
+            seconds, calls = totals.get(stage, (0.0, 0))
+            totals[stage] = (seconds + elapsed, calls + 1)
+        return [(stage, seconds, calls) for stage, (seconds, calls) in totals.items()]
+
+    def server_timing(self):
+        """The breakdown as a Server-Timing header value (milliseconds)"""
+        entries = [
+            f'{stage};dur={seconds * 1000:.2f}' + (f';desc="{calls} calls"' if calls > 1 else "")
+            for stage, seconds, calls in self.breakdown()
+        ]
+        entries.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(entries)
@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+
+# Deepest stack recorded; deeper frames are cut at the root end
+MAX_DEPTH = 128
+
+
+class StackSampler:
+    """
+    Always-on statistical profiler of the server process
+
+    A daemon thread snapshots the stack of every other thread at a fixed
+    interval and aggregates them per second into collapsed stacks
+    ("thread;file:function;... count"), the input format of flamegraph.pl,
+    speedscope and similar tools. The interval stretches whenever sampling
+    would use more than max_overhead of one core.
+    """
+
+    def __init__(self, interval, max_overhead, retention):
+        """
+        Args:
+            interval (float): Seconds between samples
+            max_overhead (float): Largest fraction of a core spent sampling
+            retention (int): Seconds of samples kept
+        """
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.retention = retention
+        self._lock = threading.Lock()
+        # (unix second, Counter of collapsed stacks), oldest first
+        self._buckets = deque()
+        self._labels = {}
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """Sampler configured by SAMPLER_*, or None when SAMPLING_PROFILER=0"""
+        if os.getenv("SAMPLING_PROFILER", "1") == "0":
+            return None
+        return cls(
+            interval=float(os.getenv("SAMPLER_INTERVAL_MS", 20)) / 1000,
+            max_overhead=float(os.getenv("SAMPLER_MAX_OVERHEAD", 0.01)),
+            retention=int(os.getenv("SAMPLER_RETENTION_SECONDS", 600))
+        )
+
+    def ensure_started(self):
+        """Start sampling in this process (threads do not survive a fork, so once per worker)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._buckets.clear()
+            threading.Thread(target=self._run, name="stack-sampler", daemon=True).start()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while True:
+            start = time.perf_counter()
+            self._sample(own_ident)
+            cost = time.perf_counter() - start
+            time.sleep(max(self.interval, cost / self.max_overhead - cost))
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def _sample(self, own_ident):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks.append(";".join(reversed(labels)))
+        del frame
+
+        second = int(time.time())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append((second, Counter()))
+            self._buckets[-1][1].update(stacks)
+            while self._buckets[0][0] < second - self.retention:
+                self._buckets.popleft()
+
+    def collapsed(self, seconds, match=None):
+        """
+        Stacks sampled over the last seconds, in collapsed format
+
+        Args:
+            seconds (int): Window, at most the retention
+            match (str): Only keep stacks containing this text (e.g. "detect_content")
+
+        Returns:
+            str: One "frame;frame;... count" line per distinct stack
+        """
+        since = int(time.time()) - seconds
+        totals = Counter()
+        with self._lock:
+            for second, stacks in self._buckets:
+                if second >= since:
+                    totals.update(stacks)
+        lines = [f"{stack} {count}" for stack, count in sorted(totals.items()) if match is None or match in stack]
+        return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,70 @@
+import re
+
+# Letter ranges of the scripts routed on, by name
+SCRIPT_RANGES = {
+    # Includes Latin Extended and fullwidth Latin, which NFKC folds to ASCII
+    "latin": r"A-Za-z\u00C0-\u024F\u1E00-\u1EFF\uFF21-\uFF3A\uFF41-\uFF5A",
+    "cyrillic": r"\u0400-\u04FF",
+    "greek": r"\u0370-\u03FF",
+    "devanagari": r"\u0900-\u097F\uA8E0-\uA8FF",
+    "bengali": r"\u0980-\u09FF",
+    "gurmukhi": r"\u0A00-\u0A7F",
+    "gujarati": r"\u0A80-\u0AFF",
+    "tamil": r"\u0B80-\u0BFF",
+    "telugu": r"\u0C00-\u0C7F",
+    "kannada": r"\u0C80-\u0CFF",
+    "malayalam": r"\u0D00-\u0D7F",
+    "arabic": r"\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFC",
+}
+
+# Scripts whose letters normalization folds into Latin (look-alike letters
+# and fullwidth forms), so Latin lexicons apply to them
+LATIN_LIKE = frozenset({"latin", "cyrillic", "greek"})
+
+# Spaces, digits and ASCII punctuation, which continue a run of any script
+_NEUTRAL = r"\s\d!-/:-@\[-`{-~"
+
+# Runs of each script: one match per stretch of text in a script, so a
+# paragraph costs one step of the scan rather than one per word
+_SCRIPT_RUNS = re.compile("|".join(
+    f"(?P<{name}>[{ranges}][{ranges}{_NEUTRAL}]*)" for name, ranges in SCRIPT_RANGES.items()
+))
+
+
+class ScriptProfile:
+    """Characters per script found in a text"""
+
+    def __init__(self, characters):
+        # script -> characters in runs of that script (including the spaces
+        # and punctuation inside the runs)
+        self.characters = characters
+
+    @property
+    def scripts(self):
+        return set(self.characters)
+
+    def has_script(self, *scripts):
+        return any(script in self.characters for script in scripts)
+
+    @property
+    def latin_like(self):
+        """Whether Latin lexicons and patterns can match (see LATIN_LIKE)"""
+        return self.has_script(*LATIN_LIKE)
+
+    def can_match(self, script):
+        """Whether a lexicon written in this script can match the text"""
+        return self.latin_like if script == "latin" else self.has_script(script)
+
+
+def profile_text(text):
+    """
+    Classify a text by script in one scan over it
+
+    Returns:
+        ScriptProfile: Characters per script
+    """
+    characters = {}
+    for run in _SCRIPT_RUNS.finditer(text):
+        script = run.lastgroup
+        characters[script] = characters.get(script, 0) + run.end() - run.start()
+    return ScriptProfile(characters)
@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a subsystem whose initialization failed
+RETRY_INTERVAL = float(os.getenv("SUBSYSTEM_RETRY_SECONDS", 30))
+
+
+def enabled_subsystems():
+    """Subsystems this server process serves, from FILTER_SUBSYSTEMS (default: all)"""
+    setting = os.getenv("FILTER_SUBSYSTEMS", "text,image")
+    return {name.strip() for name in setting.split(",") if name.strip()}
+
+
+class SubsystemUnavailable(Exception):
+    """A subsystem is disabled on this server or failed to initialize"""
+
+    def __init__(self, name, reason):
+        super().__init__(f"The {name} filter is unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class Subsystem:
+    """
+    A part of the server (text or image filtering) initialized on first use
+
+    Each subsystem starts independently: missing credentials for one of them
+    only make that one unavailable. A failed initialization is retried after
+    RETRY_INTERVAL seconds.
+    """
+
+    def __init__(self, name, factory):
+        """
+        Args:
+            name (str): Subsystem name, as listed in FILTER_SUBSYSTEMS
+            factory (callable): Builds the subsystem's service object
+        """
+        self.name = name
+        self.enabled = name in enabled_subsystems()
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._instance = None
+        self._error = None
+        self._failed_at = None
+
+    def get(self):
+        """
+        Return the service object, initializing it on first use
+
+        Raises:
+            SubsystemUnavailable: The subsystem is disabled or failed to initialize
+        """
+        if self._instance is not None:
+            return self._instance
+        if not self.enabled:
+            raise SubsystemUnavailable(self.name, "disabled on this server (FILTER_SUBSYSTEMS)")
+
+        with self._lock:
+            if self._instance is None:
+                if self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_INTERVAL:
+                    raise SubsystemUnavailable(self.name, self._error)
+                start = time.perf_counter()
+                try:
+                    self._instance = self._factory()
+                except Exception as e:
+                    self._error = str(e)
+                    self._failed_at = time.monotonic()
+                    logger.error(f"Failed to initialize the {self.name} subsystem: {str(e)}")
+                    raise SubsystemUnavailable(self.name, self._error)
+                self._error = None
+                self._failed_at = None
+                logger.info(f"Initialized the {self.name} subsystem in {time.perf_counter() - start:.2f}s")
+        return self._instance
+
+    def status(self):
+        """Readiness of the subsystem for /health"""
+        if not self.enabled:
+            state = "disabled"
+        elif self._instance is not None:
+            state = "ready"
+        elif self._error is not None:
+            state = "failed"
+        else:
+            # Initialized by the first request that needs it
+            state = "not_started"
+        status = {"state": state}
+        if state == "failed":
+            status["error"] = self._error
+        return status
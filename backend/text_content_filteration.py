@@ -3,11 +3,21 @@ load_dotenv()  # MUST be first import
 
 import re
 import json
+from bisect import bisect_right
 from datetime import datetime
 from cryptography.fernet import Fernet
 import os
 import sys
 from typing import Dict, List, Set, Tuple, Any
+from metrics import FALLBACKS, TEXT_SCRIPTS, stage_timer
+from hate_speech import PhraseMatcher
+from text_segmentation import sentence_spans
+from text_normalization import Lexicon, load_word_lists, normalize
+from script_profile import profile_text
+from pii_prefilter import possible_categories
+from fuzzy_lexicon import FuzzyLexicon
+from detection_tables import DetectionTables, TablesSource
+from envelope_encryption import open_spans, seal_spans
 
 # Type alias for clarity
 SensitiveMatches = Dict[str, List[str]]
@@ -16,27 +26,22 @@ SensitiveMatches = Dict[str, List[str]]
 # 1. Content Detection Module - Using Google Vertex AI
 # =================================================================
 
-# Import Google Vertex AI components
-try:
-    from google.cloud import aiplatform
-    from google.cloud.aiplatform.gapic.schema import predict
-    from langchain.prompts import PromptTemplate
-    print("Successfully imported Google Vertex AI components")
-except ImportError:
-    print("ERROR: Required libraries not found. Install with: pip install google-cloud-aiplatform langchain")
-    
-    # Define a simple fallback PromptTemplate class if needed
-    class PromptTemplate:
-        def __init__(self, template, input_variables):
-            self.template = template
-            self.input_variables = input_variables
-            
-        def format(self, **kwargs):
-            result = self.template
-            for var in self.input_variables:
-                if var in kwargs:
-                    result = result.replace(f"{{{var}}}", str(kwargs[var]))
-            return result
+# Google Vertex AI (google-cloud-aiplatform) and langchain are heavy imports
+# only needed once text is actually sent to Vertex AI, so they are imported
+# on first use rather than when the module loads.
+
+# Simple fallback PromptTemplate used when langchain is not installed
+class _FallbackPromptTemplate:
+    def __init__(self, template, input_variables):
+        self.template = template
+        self.input_variables = input_variables
+        
+    def format(self, **kwargs):
+        result = self.template
+        for var in self.input_variables:
+            if var in kwargs:
+                result = result.replace(f"{{{var}}}", str(kwargs[var]))
+        return result
 
 # Global variable to store Vertex AI client instance
 vertex_ai_client = None
@@ -72,45 +77,108 @@ TEXT: {text}
 Respond with ONLY the JSON object. No other text, no explanations.
 """
 
-detection_prompt = PromptTemplate(
-    template=content_detection_template,
-    input_variables=["text"]
-)
+# Built on first use by get_detection_prompt()
+detection_prompt = None
 
-# Define patterns for hate speech and profanity detection
-HATE_SPEECH_KEYWORDS = [
-    # Violence and elimination keywords
-    r'\b(?:kill|eliminate|destroy|murder|slaughter|genocide)\s+(?:all|every|each)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
-    r'\b(?:death|die|eliminate|exterminate)\s+to\s+(?:all|every)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
-    
-    # Dehumanization patterns
-    r'\b(?:all|every|those)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\s+(?:are|is)\s+(?:animals|vermin|cockroaches|rats|trash|garbage)\b',
-    
-    # Violent action patterns
-    r'\b(?:we|they|people|everyone)\s+should\s+(?:kill|eliminate|eradicate|remove|cleanse)\s+(?:all|every|the|those)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
-    
-    # General hate patterns
-    r'\b(?:hate|despise|loathe)\s+(?:all|every|those|these)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\b',
-    
-    # Explicit discriminatory statements
-    r'\b(?:all|every|each)\s+(?:\w+\s+)*(?:people|group|community|race|ethnicity)\s+(?:should|must|need to)\s+(?:be|get)\s+(?:banned|deported|removed|eliminated|killed)\b',
-]
+def get_detection_prompt():
+    """Return the detection prompt template, importing langchain on first use"""
+    global detection_prompt
+    if detection_prompt is None:
+        try:
+            from langchain.prompts import PromptTemplate
+        except ImportError:
+            print("langchain not found, using the built-in prompt template. Install with: pip install langchain")
+            PromptTemplate = _FallbackPromptTemplate
+        detection_prompt = PromptTemplate(
+            template=content_detection_template,
+            input_variables=["text"]
+        )
+    return detection_prompt
 
-# Common profanity and slurs (abbreviated/masked to avoid explicit content)
-PROFANITY_PATTERNS = [
-    # Common general profanity (abbreviated)
-    r'\ba[s$][s$]\b', r'\bb[i!]t?ch\b', r'\bf[u\][c\]k\b', r'\bs[h\][i\]t\b', 
-    r'\bd[a\]mn\b', r'\bh[e\]ll\b', r'\bcr[a\]p\b', r'\bd[i\]ck\b',
+# Common profanity and slurs beyond profanity_words.json, by language.
+# Obfuscated spellings (masked, leetspeak, repeated letters, look-alike
+# characters) are matched through normalization (see text_normalization.py),
+# so only plain words are listed.
+PROFANITY_WORDS = {
+    # Common general profanity and slurs
+    "english": ["ass", "bitch", "fuck", "shit", "damn", "hell", "crap", "dick", "nigger", "fag", "cunt"],
     
     # Hindi/Urdu profanity
-    r'\bg[a\][a\]nd\b', r'\bch[u\]t[i\]ya\b', r'\bb[e\][h\][e\]n ?ch[o\]d\b',
-    
-    # Various slurs (intentionally abbreviated)
-    r'\bn[i\]gg[e\]r\b', r'\bf[a\]g\b', r'\bc[u\]nt\b',
+    "hindi": ["gaand", "chutiya", "chutya", "behenchod", "behen chod"],
+}
+
+# Categories of profanity_words.json flagged as profanity. violence_crime is
+# left out: words like "kill" or "shoot" alone are too common, and violent
+# phrases are covered by the hate speech matcher.
+PROFANITY_CATEGORIES = ["sexual_vulgar", "abusive_insults", "obfuscated_variants"]
+
+# Words of the lists above that are also names or ordinary words ("summa cum
+# laude", "pussy willow", "Randi", "Dick", "Lund", "sala" in Spanish, "chut"
+# in French). Whole-token matching has no context to tell them apart, so
+# they are not flagged on their own; Vertex AI still sees them in context.
+AMBIGUOUS_WORDS = {"cum", "cumming", "pussy", "tits", "dick", "randi", "lund", "sala", "gand", "chut"}
+
+# Ordinary words that read as stretched spellings of lexicon words
+LEXICON_EXCEPTIONS = {"looser"}
+
+# Common words and proper nouns within FUZZY_MAX_EDITS of a lexicon word
+# ("China" and "chinal", "Niger" and the slur, "haram" and "harami", Hindi
+# "kamna" and "kamina", "chudail" and "chudai")
+FUZZY_EXCEPTIONS = {"china", "niger", "haram", "kamna", "chudail"}
+
+# Script each language of profanity_words.json is written in (the Hindi list
+# is romanized). Lexicons are compiled per script, so every language written
+# in a script shares one pass over the texts containing that script, and
+# texts without it never pay for them (see script_profile.py).
+PROFANITY_LANGUAGE_SCRIPTS = {"english": "latin", "hindi": "latin"}
+
+def _build_profanity_lexicons():
+    word_lists = load_word_lists(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "profanity_words.json"),
+        PROFANITY_CATEGORIES
+    )
+    for language, words in PROFANITY_WORDS.items():
+        word_lists.setdefault(language, []).extend(words)
+    word_lists = {
+        language: [word for word in words if word.strip().lower() not in AMBIGUOUS_WORDS]
+        for language, words in word_lists.items()
+    }
     
-    # Common substitutions
-    r'\bf\\*k\b', r'\bs\\t\b', r'\ba\\\b', r'\bb\\*\*h\b',
-]
+    by_script = {}
+    fuzzy_words = {}
+    for language, words in word_lists.items():
+        # Lists without a language (obfuscated_variants) are romanized
+        script = PROFANITY_LANGUAGE_SCRIPTS.get(language, "latin")
+        by_script.setdefault(script, []).extend(words)
+        if language is not None:
+            # Obfuscated variants are already misspellings
+            fuzzy_words.setdefault(script, []).extend(words)
+    
+    # Misspellings of the longer words ("bastrad", "fukcing"), within
+    # FUZZY_MAX_EDITS (see fuzzy_lexicon.py), in one deletion index per script
+    # like the exact lexicons: code-mixed text ("you are a chutya") rarely
+    # has enough words of its other language to be recognized by them
+    fuzzy = {}
+    for script, words in fuzzy_words.items():
+        fuzzy_lexicon = FuzzyLexicon.from_env(Lexicon(words).words, LEXICON_EXCEPTIONS | FUZZY_EXCEPTIONS)
+        if fuzzy_lexicon:
+            fuzzy[script] = fuzzy_lexicon
+    return {script: Lexicon(words, LEXICON_EXCEPTIONS) for script, words in by_script.items()}, fuzzy
+
+def build_detection_tables():
+    """
+    Compile the hate speech phrases (matched over tokens in linear time, see
+    hate_speech.py), the profanity lexicons and the PII patterns
+
+    Returns:
+        DetectionTables: The tables (see detection_tables.py)
+    """
+    profanity_lexicons, fuzzy_profanity = _build_profanity_lexicons()
+    pii_regexes = {
+        category: [re.compile(pattern) for pattern in pattern_list]
+        for category, pattern_list in PII_PATTERNS.items()
+    }
+    return DetectionTables(PhraseMatcher(), profanity_lexicons, fuzzy_profanity, pii_regexes)
 
 def setup_vertex_ai(project=None, loc=None, model=None):
     """Setup Google Vertex AI connection"""
@@ -142,7 +210,7 @@ def setup_vertex_ai(project=None, loc=None, model=None):
         return None
         
     try:
-        # Import the aiplatform module
+        # Import the aiplatform module (deferred until Vertex AI is configured)
         from google.cloud import aiplatform
         
         # Initialize Vertex AI client
@@ -173,55 +241,74 @@ def setup_vertex_ai(project=None, loc=None, model=None):
 
 
 # Function to detect hate speech and profanity
-def detect_hate_speech_profanity(text):
-    """Detect hate speech and profanity using regex patterns"""
+def detect_hate_speech_profanity(text, profile=None):
+    """
+    Detect hate speech and profanity locally
+
+    The text is normalized once (see text_normalization.py) and its
+    canonical form scanned by the matchers for the scripts it contains: the
+    (English) hate speech phrase matcher, and the exact and fuzzy profanity
+    lexicons of each script. Matches are then mapped back to the original
+    text and to their sentences, which are reported with their offsets in
+    flagged_sentence_spans.
+
+    Args:
+        text (str): Text to check
+        profile (ScriptProfile): Scripts of the text, if already profiled
+    """
     results = {
         "hate_speech": False,
         "profanity": False,
         "flagged_words": [],
-        "flagged_sentences": []
+        "flagged_sentences": [],
+        "flagged_sentence_spans": []
     }
     
-    # Improved sentence splitting - handle multiple punctuation and line breaks
-    # This regex splits on sentence-ending punctuation followed by whitespace or end of string
-    sentences = []
-    # First split by newlines to preserve paragraph structure
-    paragraphs = text.split('\n')
-    for paragraph in paragraphs:
-        # Then split each paragraph into sentences
-        paragraph_sentences = re.split(r'(?<=[.!?])\s+|(?<=[.!?])$', paragraph)
-        # Filter out empty strings
-        paragraph_sentences = [s.strip() for s in paragraph_sentences if s.strip()]
-        sentences.extend(paragraph_sentences)
-    
-    # Check each sentence for hate speech patterns
-    for sentence in sentences:
-        has_hate_speech = False
-        has_profanity = False
-        profanity_words = []
-        
-        # Check for hate speech
-        for pattern in HATE_SPEECH_KEYWORDS:
-            if re.search(pattern, sentence.lower()):
-                has_hate_speech = True
-                results["hate_speech"] = True
-                break
-        
-        # Check for profanity
-        for pattern in PROFANITY_PATTERNS:
-            matches = re.finditer(pattern, sentence.lower())
-            for match in matches:
-                has_profanity = True
-                results["profanity"] = True
-                flagged_word = match.group(0)
-                if flagged_word not in results["flagged_words"]:
-                    results["flagged_words"].append(flagged_word)
-                profanity_words.append(flagged_word)
-        
-        # Add sentence to flagged sentences if it contains hate speech or profanity
-        if has_hate_speech or has_profanity:
-            if sentence not in results["flagged_sentences"]:
-                results["flagged_sentences"].append(sentence)
+    # Offsets of the matches, mapped to sentences below
+    flagged_offsets = []
+    
+    if profile is None:
+        profile = profile_text(text)
+    tables = detection_tables.get()
+    lexicons = [lexicon for script, lexicon in tables.profanity_lexicons.items() if profile.can_match(script)]
+    fuzzy_lexicons = [lexicon for script, lexicon in tables.fuzzy_profanity.items() if profile.can_match(script)]
+    if not lexicons and not profile.latin_like:
+        # Nothing can match: skip normalization
+        return results
+    
+    normalized = normalize(text)
+    
+    if profile.latin_like:
+        for _, start, _ in tables.hate_speech_matcher.finditer(normalized.canonical):
+            results["hate_speech"] = True
+            flagged_offsets.append(normalized.offsets[start])
+    
+    # dict keeps the first-seen order while deduplicating
+    flagged_words = {}
+    exact_spans = set()
+    for lexicon in lexicons:
+        exact_spans.update(lexicon.finditer(normalized))
+    fuzzy_spans = set()
+    for fuzzy_lexicon in fuzzy_lexicons:
+        fuzzy_spans.update((start, end) for _, start, end in fuzzy_lexicon.finditer(normalized, exclude=exact_spans))
+    for start, end in sorted(exact_spans | fuzzy_spans):
+        results["profanity"] = True
+        # As written in the text, so that process_text can replace it
+        flagged_words[text[start:end]] = True
+        flagged_offsets.append(start)
+    results["flagged_words"] = list(flagged_words)
+    
+    if flagged_offsets:
+        spans = list(sentence_spans(text))
+        starts = [start for start, _ in spans]
+        flagged_spans = set()
+        for offset in flagged_offsets:
+            index = bisect_right(starts, offset) - 1
+            if index >= 0 and offset < spans[index][1]:
+                flagged_spans.add(spans[index])
+        for start, end in sorted(flagged_spans):
+            results["flagged_sentences"].append(text[start:end])
+            results["flagged_sentence_spans"].append([start, end])
     
     return results
 
@@ -516,81 +603,93 @@ def is_valid_nhs_number(match: str, text: str) -> bool:
 import re
 import json
 
-def regex_pattern_detection(text):
+# Categories whose patterns need Latin letters, skipped for texts without any
+LATIN_CATEGORIES = frozenset({"emails", "pan", "ifsc_codes", "swift_codes", "passport_numbers"})
+
+# Sensitive information patterns by category; pii_prefilter.CATEGORY_REQUIREMENTS
+# lists the characters each category needs and must follow them
+PII_PATTERNS = {
+    "phone_numbers": [
+        # Indian mobile numbers (10 digits starting with 6, 7, 8, or 9)
+        r'\b[6-9]\d{9}\b',
+        
+        # Indian mobile with country code formats
+        r'\+91[6-9]\d{9}\b',
+        r'0091[6-9]\d{9}\b',
+        
+        # Indian mobile with common separators
+        r'\b[6-9]\d{4}[\s.-]?\d{5}\b',
+        r'\+91[\s.-]?[6-9]\d{9}\b',
+        
+        # International format with country code (allowing for different country codes)
+        r'\+\d{1,4}[\s.-]?\d{6,14}'
+    ],
+    "emails": [
+        # Standard email format
+        r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+    ],
+    "aadhaar": [
+        # Standard 12-digit Aadhaar number format with optional spaces
+        r'\b\d{4}[\s.-]?\d{4}[\s.-]?\d{4}\b',
+        
+        # Masked Aadhaar number format (X's for first 8 digits)
+        r'\bXXXX[\s.-]?XXXX[\s.-]?\d{4}\b'
+    ],
+    "pan": [
+        # PAN format: 5 uppercase letters + 4 digits + 1 uppercase letter
+        r'\b[A-Z]{5}[0-9]{4}[A-Z]{1}\b'
+    ],
+    "account_numbers": [
+        # Common Indian bank account numbers (typically 11-18 digits)
+        # Avoiding overlap with phone numbers by requiring more than 10 digits
+        r'\b\d{11,18}\b'
+    ],
+    "ifsc_codes": [
+        # IFSC format: 4 uppercase letters + 0 + 6 alphanumeric characters
+        r'\b[A-Z]{4}0[A-Z0-9]{6}\b'
+    ],
+    "swift_codes": [
+        # SWIFT/BIC code format: 8 or 11 alphanumeric characters
+        r'\b[A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?\b'
+    ],
+    "credit_cards": [
+        # Major credit card formats with separators
+        r'\b(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|3(?:0[0-5]|[68][0-9])[0-9]{11}|6(?:011|5[0-9]{2})[0-9]{12}|(?:2131|1800|35\d{3})\d{11})\b',
+        
+        # Credit card numbers with separators
+        r'\b(?:4[0-9]{3}|5[1-5][0-9]{2}|3[47][0-9]{2}|3(?:0[0-5]|[68][0-9])|6(?:011|5[0-9]{2}))[\s.-]?(?:[0-9]{4}[\s.-]?){2}[0-9]{4}\b'
+    ],
+    "passport_numbers": [
+        # Indian passport format: 1 letter followed by 7 digits
+        r'\b[A-Z][0-9]{7}\b'
+    ],
+    "ssn": [
+        # US SSN format: XXX-XX-XXXX
+        r'\b\d{3}-\d{2}-\d{4}\b',
+        r'\b\d{3}\s\d{2}\s\d{4}\b'
+    ],
+    "gps_coordinates": [
+        # GPS coordinate formats
+        r'\b-?\d{1,3}\.\d+,\s*-?\d{1,3}\.\d+\b'
+    ],
+    "nhs_numbers": [
+        # UK NHS number format: XXX XXX XXXX with strict spacing and checksum validation
+        r'\b\d{3}[\s-]?\d{3}[\s-]?\d{4}\b'
+    ]
+}
+
+# Loaded from the DETECTION_ARTIFACT built by `python detection_tables.py
+# build` (and reloaded when a new one replaces it), or built here
+detection_tables = TablesSource.from_env(build_detection_tables)
+
+def regex_pattern_detection(text, profile=None):
     """
     Detect sensitive information using improved regex patterns.
     Returns a dictionary with categorized matches of sensitive information.
+    Only the categories the characters of the text allow are scanned (see
+    pii_prefilter.py), and patterns that need Latin letters only run when
+    the text has some.
     """
-    patterns = {
-        "phone_numbers": [
-            # Indian mobile numbers (10 digits starting with 6, 7, 8, or 9)
-            r'\b[6-9]\d{9}\b',
-            
-            # Indian mobile with country code formats
-            r'\+91[6-9]\d{9}\b',
-            r'0091[6-9]\d{9}\b',
-            
-            # Indian mobile with common separators
-            r'\b[6-9]\d{4}[\s.-]?\d{5}\b',
-            r'\+91[\s.-]?[6-9]\d{9}\b',
-            
-            # International format with country code (allowing for different country codes)
-            r'\+\d{1,4}[\s.-]?\d{6,14}'
-        ],
-        "emails": [
-            # Standard email format
-            r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        ],
-        "aadhaar": [
-            # Standard 12-digit Aadhaar number format with optional spaces
-            r'\b\d{4}[\s.-]?\d{4}[\s.-]?\d{4}\b',
-            
-            # Masked Aadhaar number format (X's for first 8 digits)
-            r'\bXXXX[\s.-]?XXXX[\s.-]?\d{4}\b'
-        ],
-        "pan": [
-            # PAN format: 5 uppercase letters + 4 digits + 1 uppercase letter
-            r'\b[A-Z]{5}[0-9]{4}[A-Z]{1}\b'
-        ],
-        "account_numbers": [
-            # Common Indian bank account numbers (typically 11-18 digits)
-            # Avoiding overlap with phone numbers by requiring more than 10 digits
-            r'\b\d{11,18}\b'
-        ],
-        "ifsc_codes": [
-            # IFSC format: 4 uppercase letters + 0 + 6 alphanumeric characters
-            r'\b[A-Z]{4}0[A-Z0-9]{6}\b'
-        ],
-        "swift_codes": [
-            # SWIFT/BIC code format: 8 or 11 alphanumeric characters
-            r'\b[A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?\b'
-        ],
-        "credit_cards": [
-            # Major credit card formats with separators
-            r'\b(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|3(?:0[0-5]|[68][0-9])[0-9]{11}|6(?:011|5[0-9]{2})[0-9]{12}|(?:2131|1800|35\d{3})\d{11})\b',
-            
-            # Credit card numbers with separators
-            r'\b(?:4[0-9]{3}|5[1-5][0-9]{2}|3[47][0-9]{2}|3(?:0[0-5]|[68][0-9])|6(?:011|5[0-9]{2}))[\s.-]?(?:[0-9]{4}[\s.-]?){2}[0-9]{4}\b'
-        ],
-        "passport_numbers": [
-            # Indian passport format: 1 letter followed by 7 digits
-            r'\b[A-Z][0-9]{7}\b'
-        ],
-        "ssn": [
-            # US SSN format: XXX-XX-XXXX
-            r'\b\d{3}-\d{2}-\d{4}\b',
-            r'\b\d{3}\s\d{2}\s\d{4}\b'
-        ],
-        "gps_coordinates": [
-            # GPS coordinate formats
-            r'\b-?\d{1,3}\.\d+,\s*-?\d{1,3}\.\d+\b'
-        ],
-        "nhs_numbers": [
-            # UK NHS number format: XXX XXX XXXX with strict spacing and checksum validation
-            r'\b\d{3}[\s-]?\d{3}[\s-]?\d{4}\b'
-        ]
-    }
-    
     sensitive_info = {}
     already_matched = set()  # Track all matched strings to avoid duplicates
     
@@ -601,14 +700,22 @@ def regex_pattern_detection(text):
         "account_numbers"
     ]
     
+    if profile is None:
+        profile = profile_text(text)
+    candidates = possible_categories(text)
+    pii_regexes = detection_tables.get().pii_regexes
+    
     # First pass: process according to priority order
     for category in category_order:
-        pattern_list = patterns[category]
         matches = []
         
-        for pattern in pattern_list:
+        if category not in candidates or (category in LATIN_CATEGORIES and not profile.has_script("latin")):
+            sensitive_info[category] = []
+            continue
+        
+        for regex in pii_regexes[category]:
             # Find all matches for this pattern
-            for match in re.finditer(pattern, text):
+            for match in regex.finditer(text):
                 matched_text = match.group(0)
                 
                 # Skip if already matched in a higher priority category
@@ -674,6 +781,7 @@ def regex_pattern_detection(text):
         "profanity": False,    # Placeholder
         "flagged_words": [],   # Placeholder
         "flagged_sentences": [],
+        "flagged_sentence_spans": [],
         "sensitive_info": sensitive_info
     }
 
@@ -770,7 +878,7 @@ def detect_with_vertex_ai(text):
         aiplatform.init(project=project_id, location=location)
         
         # Format the prompt using the template
-        formatted_prompt = detection_prompt.format(text=text)
+        formatted_prompt = get_detection_prompt().format(text=text)
         
         # Use PredictionService for text generation
         # This is the updated way to call Vertex AI models
@@ -783,15 +891,16 @@ def detect_with_vertex_ai(text):
         print("Sending text to Google Vertex AI for analysis...")
         
         # Make the prediction
-        response = model.predict(
-            instances=[{"content": formatted_prompt}],
-            parameters={
-                "temperature": 0.1,
-                "maxOutputTokens": 1024,
-                "topK": 40,
-                "topP": 0.8,
-            }
-        )
+        with stage_timer("vertex"):
+            response = model.predict(
+                instances=[{"content": formatted_prompt}],
+                parameters={
+                    "temperature": 0.1,
+                    "maxOutputTokens": 1024,
+                    "topK": 40,
+                    "topP": 0.8,
+                }
+            )
         
         # Get the prediction result
         result = response.predictions[0]
@@ -802,29 +911,31 @@ def detect_with_vertex_ai(text):
         print(f"Raw Vertex AI response preview: {result[:100]}..." if len(result) > 100 else f"Raw Vertex AI response: {result}")
         
         # Extract JSON from the response (handle both clean and messy responses)
-        try:
-            # First attempt: try parsing the entire response as JSON
-            parsed_json = json.loads(result)
-            return parsed_json
-        except json.JSONDecodeError:
-            # Second attempt: extract JSON block from response
-            json_match = re.search(r'(\{.*\})', result, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                # Clean up JSON string (fix common issues)
-                json_str = re.sub(r',\s*}', '}', json_str)  # Fix trailing commas
-                json_str = re.sub(r',\s*]', ']', json_str)  # Fix trailing commas in arrays
+        with stage_timer("json_repair"):
+            try:
+                # First attempt: try parsing the entire response as JSON
+                parsed_json = json.loads(result)
+                return parsed_json
+            except json.JSONDecodeError:
+                FALLBACKS.inc(kind="json_repair")
+                # Second attempt: extract JSON block from response
+                json_match = re.search(r'(\{.*\})', result, re.DOTALL)
+                if json_match:
+                    json_str = json_match.group(1)
+                    # Clean up JSON string (fix common issues)
+                    json_str = re.sub(r',\s*}', '}', json_str)  # Fix trailing commas
+                    json_str = re.sub(r',\s*]', ']', json_str)  # Fix trailing commas in arrays
                 
-                try:
-                    parsed_json = json.loads(json_str)
-                    return parsed_json
-                except json.JSONDecodeError as e:
-                    print(f"JSON parsing error: {e}")
-                    print(f"Problematic JSON: {json_str[:200]}...")
+                    try:
+                        parsed_json = json.loads(json_str)
+                        return parsed_json
+                    except json.JSONDecodeError as e:
+                        print(f"JSON parsing error: {e}")
+                        print(f"Problematic JSON: {json_str[:200]}...")
+                        return None
+                else:
+                    print("No JSON found in Vertex AI response")
                     return None
-            else:
-                print("No JSON found in Vertex AI response")
-                return None
     except Exception as e:
         print(f"Google Vertex AI detection error: {str(e)}")
         return None
@@ -849,7 +960,7 @@ def detect_with_vertex_ai_gemini(text):
         vertexai.init(project=project_id, location=location)
         
         # Format the prompt using the template
-        formatted_prompt = detection_prompt.format(text=text)
+        formatted_prompt = get_detection_prompt().format(text=text)
         
         print("Sending text to Google Vertex AI Gemini for analysis...")
         
@@ -857,7 +968,8 @@ def detect_with_vertex_ai_gemini(text):
         model = GenerativeModel(model_name)
         
         # Generate content
-        response = model.generate_content(formatted_prompt)
+        with stage_timer("vertex"):
+            response = model.generate_content(formatted_prompt)
         
         # Extract the text from the response
         result = response.text
@@ -866,25 +978,27 @@ def detect_with_vertex_ai_gemini(text):
         print(f"Raw Gemini response preview: {result[:100]}..." if len(result) > 100 else f"Raw Gemini response: {result}")
         
         # Process JSON response - same as before
-        try:
-            parsed_json = json.loads(result)
-            return parsed_json
-        except json.JSONDecodeError:
-            json_match = re.search(r'(\{.*\})', result, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                json_str = re.sub(r',\s*}', '}', json_str) 
-                json_str = re.sub(r',\s*]', ']', json_str)
+        with stage_timer("json_repair"):
+            try:
+                parsed_json = json.loads(result)
+                return parsed_json
+            except json.JSONDecodeError:
+                FALLBACKS.inc(kind="json_repair")
+                json_match = re.search(r'(\{.*\})', result, re.DOTALL)
+                if json_match:
+                    json_str = json_match.group(1)
+                    json_str = re.sub(r',\s*}', '}', json_str) 
+                    json_str = re.sub(r',\s*]', ']', json_str)
                 
-                try:
-                    parsed_json = json.loads(json_str)
-                    return parsed_json
-                except json.JSONDecodeError as e:
-                    print(f"JSON parsing error: {e}")
+                    try:
+                        parsed_json = json.loads(json_str)
+                        return parsed_json
+                    except json.JSONDecodeError as e:
+                        print(f"JSON parsing error: {e}")
+                        return None
+                else:
+                    print("No JSON found in Gemini response")
                     return None
-            else:
-                print("No JSON found in Gemini response")
-                return None
     except Exception as e:
         print(f"Google Vertex AI Gemini detection error: {str(e)}")
         return None
@@ -895,8 +1009,19 @@ def detect_content(text, project_id=None, location=None, model_name=None):
     """Combined detection using both Vertex AI and regex with fallbacks"""
     print("Analyzing content...")
     
+    # The scripts in the text decide which patterns and lexicons run
+    with stage_timer("script_profile"):
+        profile = profile_text(text)
+    for script in profile.scripts:
+        TEXT_SCRIPTS.inc(script=script)
+    
     # Always use regex detection for sensitive information as baseline
-    regex_results = regex_pattern_detection(text)
+    with stage_timer("regex"):
+        regex_results = regex_pattern_detection(text, profile)
+    
+    # Local hate speech and profanity detection fills in the regex placeholders
+    with stage_timer("lexicon"):
+        regex_results.update(detect_hate_speech_profanity(text, profile))
     
     # Set up or get Vertex AI instance
     setup_vertex_ai(project_id, location, model_name)
@@ -912,6 +1037,7 @@ def detect_content(text, project_id=None, location=None, model_name=None):
         
     # If Vertex AI detection failed completely, use regex results
     if not vertex_ai_results:
+        FALLBACKS.inc(kind="vertex_to_regex")
         print("Using regex-based detection results (Vertex AI unavailable or failed)")
         return regex_results
     
@@ -937,10 +1063,16 @@ def detect_content(text, project_id=None, location=None, model_name=None):
             # Remove duplicates
             vertex_ai_results["sensitive_info"][category] = list(set(vertex_ai_results["sensitive_info"][category]))
     
-    # Ensure other required fields exist in the results
-    for field in ["hate_speech", "profanity", "flagged_words", "flagged_sentences"]:
-        if field not in vertex_ai_results:
-            vertex_ai_results[field] = regex_results[field]
+    # Ensure other required fields exist in the results, keeping local findings
+    for field in ["hate_speech", "profanity"]:
+        vertex_ai_results[field] = bool(vertex_ai_results.get(field)) or regex_results[field]
+    for field in ["flagged_words", "flagged_sentences"]:
+        if not isinstance(vertex_ai_results.get(field), list):
+            vertex_ai_results[field] = []
+        seen = set(vertex_ai_results[field])
+        vertex_ai_results[field].extend(item for item in regex_results[field] if item not in seen)
+    # Offsets of the locally flagged sentences, used by process_text
+    vertex_ai_results["flagged_sentence_spans"] = regex_results["flagged_sentence_spans"]
     
     return vertex_ai_results
 
@@ -985,6 +1117,7 @@ if KEY is None:
 
 cipher_suite = Fernet(KEY)
 
+@stage_timer("encryption")
 def encrypt_data(data):
     """Encrypt a string of data"""
     if not isinstance(data, str):
@@ -1003,12 +1136,49 @@ def decrypt_data(encrypted_data):
         print(f"Decryption error: {e}")
         return f"[DECRYPTION_ERROR: {str(e)}]"
 
+# "item" encrypts every span into its own Fernet token, logged next to the
+# original; "envelope" encrypts all the spans of a request together (see
+# envelope_encryption.py) and logs no plaintext
+ENCRYPTION_MODE = os.getenv("ENCRYPTION_MODE", "item")
+
+class _SpanEncryptor:
+    """Encryption log fields for the spans of one process_text call"""
+    
+    def __init__(self, envelope):
+        self.envelope = envelope
+        self.spans = []
+    
+    def fields(self, value):
+        if not self.envelope:
+            return {'original': value, 'encrypted': encrypt_data(value)}
+        self.spans.append(value)
+        return {'span': len(self.spans) - 1}
+    
+    def seal(self, encryption_log):
+        """Put the envelope of the collected spans first in the log"""
+        if self.spans:
+            with stage_timer("encryption"):
+                envelope = seal_spans(self.spans, cipher_suite)
+            encryption_log.insert(0, {'type': 'envelope', **envelope})
+        return encryption_log
+
 # =================================================================
 # 3. Text Processing Module
 # =================================================================
 
-def process_text(text, detection_results, action="keep"):
-    """Process text based on detection results with enhanced tracking"""
+@stage_timer("process_text")
+def process_text(text, detection_results, action="keep", confirm_full_removal=None, envelope=None):
+    """
+    Process text based on detection results with enhanced tracking
+
+    confirm_full_removal is asked (with no arguments) whether to remove the
+    entire text when hate speech is found and action is "remove"; without
+    it (as in the server) only the flagged parts are removed.
+
+    With envelope (ENCRYPTION_MODE=envelope by default) the encrypted spans
+    are sealed together in one envelope, the first entry of the encryption
+    log, and the other entries refer to their span in it.
+    """
     if action == "keep":
         return text, []  # No changes needed
     
@@ -1018,8 +1188,41 @@ def process_text(text, detection_results, action="keep"):
         
     processed_text = text
     encryption_log = []
-    
-    # Process sensitive information first, starting with the longest items
+    encryptor = _SpanEncryptor(ENCRYPTION_MODE == "envelope" if envelope is None else envelope)
+    
+    # Flagged sentences with known offsets are replaced in place first, in
+    # one pass over the original text
+    replaced_sentences = set()
+    flagged_spans = detection_results.get("flagged_sentence_spans") or []
+    if action in ("remove", "encrypt") and flagged_spans:
+        hate_speech = detection_results.get('hate_speech', False)
+        pieces = []
+        length = 0
+        last = 0
+        for start, end in sorted(flagged_spans):
+            if start < last or end > len(text):
+                continue
+            sentence = text[start:end]
+            pieces.append(text[last:start])
+            length += start - last
+            if action == "remove":
+                replacement = "[SENTENCE REMOVED DUE TO POLICY VIOLATION]"
+            else:
+                replacement = "[ENCRYPTED SENTENCE]"
+                encryption_log.append({
+                    'type': 'flagged_sentence',
+                    'category': 'hate_speech' if hate_speech else 'profanity',
+                    **encryptor.fields(sentence),
+                    'position': length
+                })
+            pieces.append(replacement)
+            length += len(replacement)
+            last = end
+            replaced_sentences.add(sentence)
+        pieces.append(text[last:])
+        processed_text = "".join(pieces)
+    
+    # Then sensitive information, starting with the longest items
     sensitive_info = detection_results.get("sensitive_info", {})
     
     # Collect all sensitive items with their categories
@@ -1036,17 +1239,19 @@ def process_text(text, detection_results, action="keep"):
     
     # Process each sensitive item
     for category, item in all_sensitive_items:
+        # Gone with a replaced sentence
+        if item not in processed_text:
+            continue
         if action == "remove":
             processed_text = processed_text.replace(item, f"[REDACTED {category.upper()}]")
         elif action == "encrypt":
-            encrypted = encrypt_data(item)
+            fields = encryptor.fields(item)
             replacement = f"[ENCRYPTED {category.upper()}]"
             processed_text = processed_text.replace(item, replacement)
             encryption_log.append({
                 'type': 'sensitive',
                 'category': category,
-                'original': item,
-                'encrypted': encrypted,
+                **fields,
                 'position': processed_text.find(replacement)
             })
     
@@ -1057,20 +1262,19 @@ def process_text(text, detection_results, action="keep"):
         flagged_words.sort(key=len, reverse=True)
         
         for word in flagged_words:
-            if not word or not isinstance(word, str) or not word.strip():
+            if not word or not isinstance(word, str) or not word.strip() or word not in processed_text:
                 continue
                 
             if action == "remove":
                 processed_text = processed_text.replace(word, "*" * len(word))
             elif action == "encrypt":
-                encrypted = encrypt_data(word)
+                fields = encryptor.fields(word)
                 replacement = f"[ENCRYPTED WORD]"
                 processed_text = processed_text.replace(word, replacement)
                 encryption_log.append({
                     'type': 'flagged_word',
                     'category': 'profanity',
-                    'original': word,
-                    'encrypted': encrypted,
+                    **fields,
                     'position': processed_text.find(replacement)
                 })
     
@@ -1081,31 +1285,30 @@ def process_text(text, detection_results, action="keep"):
         flagged_sentences.sort(key=len, reverse=True)
         
         for sentence in flagged_sentences:
-            if not sentence or not isinstance(sentence, str) or not sentence.strip():
+            if not sentence or not isinstance(sentence, str) or not sentence.strip() or sentence in replaced_sentences:
                 continue
                 
             if action == "remove":
                 processed_text = processed_text.replace(sentence, "[SENTENCE REMOVED DUE TO POLICY VIOLATION]")
             elif action == "encrypt":
-                encrypted = encrypt_data(sentence)
+                fields = encryptor.fields(sentence)
                 replacement = f"[ENCRYPTED SENTENCE]"
                 processed_text = processed_text.replace(sentence, replacement)
                 encryption_log.append({
                     'type': 'flagged_sentence',
                     'category': 'hate_speech' if detection_results.get('hate_speech', False) else 'profanity',
-                    'original': sentence,
-                    'encrypted': encrypted,
+                    **fields,
                     'position': processed_text.find(replacement)
                 })
     
     # If hate speech is detected and removal is requested, consider complete removal
     if detection_results.get("hate_speech", False) and action == "remove":
-        if input("\nHate speech detected. Remove entire text? (y/n): ").lower() == 'y':
+        if confirm_full_removal is not None and confirm_full_removal():
             processed_text = "[ENTIRE TEXT REMOVED DUE TO HATE SPEECH POLICY VIOLATION]"
             # Clear encryption log since entire text is removed
             encryption_log = []
     
-    return processed_text, encryption_log
+    return processed_text, encryptor.seal(encryption_log)
 
 # =================================================================
 # 4. Logging and Tracking Module
@@ -1164,6 +1367,14 @@ def recover_encrypted_text(processed_text, encryption_log):
         
     recovered_text = processed_text
     
+    # Envelope entries decrypt their spans from the envelope logged first
+    envelope_spans = {}
+    if encryption_log[0].get('type') == 'envelope':
+        try:
+            envelope_spans = open_spans(encryption_log[0], cipher_suite)
+        except Exception as e:
+            print(f"Error opening encryption envelope: {e}")
+    
     # Sort the encryption log by position in reverse order
     # This prevents issues with position shifting during replacement
     try:
@@ -1171,7 +1382,7 @@ def recover_encrypted_text(processed_text, encryption_log):
         
         for entry in sorted_log:
             encrypted_data = entry.get('encrypted')
-            if not encrypted_data:
+            if not encrypted_data and entry.get('span') not in envelope_spans:
                 continue
                 
             replacement = None
@@ -1183,10 +1394,13 @@ def recover_encrypted_text(processed_text, encryption_log):
             elif entry['type'] == 'flagged_sentence':
                 replacement = "[ENCRYPTED SENTENCE]"
                 
-            if replacement and replacement in recovered_text:
+            # Entries are taken from the last position back, so each one is
+            # the last remaining occurrence of its placeholder
+            index = recovered_text.rfind(replacement) if replacement else -1
+            if index != -1:
                 try:
-                    original = decrypt_data(encrypted_data)
-                    recovered_text = recovered_text.replace(replacement, original, 1)
+                    original = decrypt_data(encrypted_data) if encrypted_data else envelope_spans[entry['span']]
+                    recovered_text = recovered_text[:index] + original + recovered_text[index + len(replacement):]
                 except Exception as e:
                     print(f"Error decrypting entry: {e}")
                     continue
@@ -1312,7 +1526,10 @@ def main():
         action = "encrypt"
     
     # Process text
-    processed_text, encryption_log = process_text(text, detection_results, action)
+    processed_text, encryption_log = process_text(
+        text, detection_results, action,
+        confirm_full_removal=lambda: input("\nHate speech detected. Remove entire text? (y/n): ").lower() == 'y'
+    )
     
     # Save results
     print("\n===== Saving Results =====")
@@ -1348,5 +1565,5 @@ def main():
             except Exception as e:
                 print(f"Error saving recovered text: {e}")
 
-if _name_ == "_main_":
+if __name__ == "__main__":
     main()
\ No newline at end of file
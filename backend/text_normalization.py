@@ -0,0 +1,225 @@
+import re
+import json
+import unicodedata
+from itertools import groupby
+
+# Look-alike letters from other scripts and accented letters, mapped to
+# the plain letter (applied after lowercasing)
+_FOLD_TABLE = str.maketrans({
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p",
+    "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s",
+    # Greek
+    "α": "a", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t",
+    "υ": "u", "χ": "x",
+    # Latin with diacritics
+    **{char: "a" for char in "àáâãäåā"},
+    **{char: "e" for char in "èéêëē"},
+    **{char: "i" for char in "ìíîïī"},
+    **{char: "o" for char in "òóôõöøō"},
+    **{char: "u" for char in "ùúûüū"},
+    "ç": "c", "ñ": "n", "ý": "y", "ÿ": "y",
+    # Invisible characters used to split words
+    "­": None, "​": None, "‌": None, "‍": None, "⁠": None, "﻿": None,
+})
+
+# Leetspeak digits, only read as letters inside words that are mostly
+# letters ("sh1t", "a55hole", but not "455", "a55" or "4455")
+_DIGIT_TABLE = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b"})
+_DIGIT_WORD = re.compile(r"\w*\d\w*")
+
+# Symbols standing for letters inside a word ("b!tch", "a$$", "chutiy@")
+_SYMBOL_TABLE = str.maketrans({"@": "a", "$": "s", "!": "i", "|": "i", "+": "t"})
+_SYMBOL = re.compile(r"[@$!|+]")
+_WORD_CHAR = re.compile(r"[\w@$!|+]")
+_WORD_CHARS = re.compile(r"[\w@$!|+]*")
+
+# Runs of three or more of the same character
+_REPEAT = re.compile(r"(.)\1{2,}", re.DOTALL)
+
+
+class NormalizedText:
+    """Canonical form of a text, with the offset of every canonical character in the original"""
+
+    __slots__ = ("text", "canonical", "offsets")
+
+    def __init__(self, text, canonical, offsets):
+        self.text = text
+        self.canonical = canonical
+        # offsets[i] is where canonical[i] comes from; offsets[-1] == len(text)
+        self.offsets = offsets
+
+    def original_span(self, start, end):
+        """Span of the original text a canonical span was made from"""
+        return self.offsets[start], self.offsets[end]
+
+
+def _replace_digit(word):
+    word = word.group()
+    letters = sum(char.isalpha() for char in word)
+    if letters and letters >= sum(char.isdigit() for char in word):
+        return word.translate(_DIGIT_TABLE)
+    return word
+
+
+def _replace_digits(text):
+    """
+    Read the digits of words with at least as many letters as digits as
+    letters; the length of the text is unchanged
+    """
+    return _DIGIT_WORD.sub(_replace_digit, text)
+
+
+def _replace_symbols(text):
+    """
+    Read the symbols inside words as letters, except trailing ones that are
+    more likely punctuation ("ass!!"); the length of the text is unchanged
+
+    Only words containing a symbol are looked at, each one once.
+    """
+    pieces = []
+    last = 0
+    for symbol in _SYMBOL.finditer(text):
+        if symbol.start() < last:
+            continue
+        start = symbol.start()
+        while start > last and _WORD_CHAR.match(text, start - 1):
+            start -= 1
+        end = _WORD_CHARS.match(text, symbol.start()).end()
+        word = text[start:end]
+        if any(char.isalpha() for char in word):
+            tail = len(word.rstrip("!|+"))
+            word = word[:tail].translate(_SYMBOL_TABLE) + word[tail:]
+        pieces.append(text[last:start])
+        pieces.append(word)
+        last = end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+
+def normalize(text):
+    """
+    Map text to the canonical form lexicons are matched against
+
+    Unicode NFKC, lowercasing, homoglyph folding through a precomputed
+    translation table, leetspeak digits in words that are mostly letters and
+    symbols inside words read as letters, and runs of three or more
+    identical characters squashed to two ("fuuuuck" -> "fuuck"). Text that folds character for character (all
+    ASCII text, and NFKC text without invisible characters) is mapped with
+    whole-string operations; the rest one character at a time.
+
+    Returns:
+        NormalizedText: The canonical text and its offset map
+    """
+    folded = None
+    if text.isascii() or unicodedata.is_normalized("NFKC", text):
+        folded = text.lower().translate(_FOLD_TABLE)
+        if len(folded) == len(text):
+            offsets = range(len(text))
+        else:
+            folded = None
+    if folded is None:
+        pieces = []
+        offsets = []
+        for index, char in enumerate(text):
+            piece = unicodedata.normalize("NFKC", char).lower().translate(_FOLD_TABLE)
+            pieces.append(piece)
+            offsets.extend([index] * len(piece))
+        folded = "".join(pieces)
+
+    # Same length, so the offsets still hold
+    folded = _replace_symbols(_replace_digits(folded))
+
+    pieces = []
+    squashed_offsets = []
+    last = 0
+    for run in _REPEAT.finditer(folded):
+        keep = run.start() + 2
+        pieces.append(folded[last:keep])
+        squashed_offsets.extend(offsets[last:keep])
+        last = run.end()
+    pieces.append(folded[last:])
+    squashed_offsets.extend(offsets[last:])
+    squashed_offsets.append(len(text))
+    return NormalizedText(text, "".join(pieces), squashed_offsets)
+
+
+def load_word_lists(path, categories):
+    """
+    Words of a word list file such as profanity_words.json, by language
+
+    Args:
+        path (str): JSON file of {category: {language: [words]}} or {category: [words]}
+        categories (iterable): Categories to include
+
+    Returns:
+        dict: language -> list of words; lists without a language are under None
+    """
+    with open(path, encoding="utf-8") as word_file:
+        data = json.load(word_file)
+    words = {}
+    for category in categories:
+        entries = data.get(category, [])
+        if isinstance(entries, dict):
+            for language, language_words in entries.items():
+                words.setdefault(language, []).extend(language_words)
+        else:
+            words.setdefault(None, []).extend(entries)
+    return words
+
+
+def _word_pattern(word):
+    """
+    Pattern of a canonical lexicon word: every run of a letter may be one or
+    two long (squashed text keeps at most two), and letters after the first
+    may be masked with "*"
+    """
+    parts = []
+    for position, (char, run) in enumerate(groupby(word)):
+        count = len(list(run))
+        if char.isspace():
+            parts.append(r"\s+")
+        elif position == 0:
+            parts.append(f"{re.escape(char)}{{{count},2}}")
+        else:
+            parts.append(f"(?:{re.escape(char)}|\\*){{{count},2}}")
+    return "".join(parts)
+
+
+class Lexicon:
+    """
+    Word list matched in one pass over normalized text
+
+    Obfuscated spellings ("f*ck", "sh1t", "b!tch", "fuuuck", Cyrillic look-
+    alikes) match their plain word through normalization, so the lexicon
+    only lists plain words and the cost per text does not grow with the
+    number of variants.
+    """
+
+    def __init__(self, words, exceptions=()):
+        """
+        Args:
+            words (iterable): Plain words or short phrases
+            exceptions (iterable): Ordinary words that a stretched spelling of
+                a lexicon word would match ("looser" for "loser")
+        """
+        self.exceptions = frozenset(normalize(word).canonical for word in exceptions)
+        canonical = {normalize(word.strip()).canonical for word in words if word.strip()}
+        self.words = sorted(canonical, key=lambda word: (-len(word), word))
+        alternation = "|".join(_word_pattern(word) for word in self.words)
+        self._regex = re.compile(f"(?<![\\w*])(?:{alternation})(?![\\w*])")
+
+    def finditer(self, normalized):
+        """
+        Yield the lexicon matches in a normalized text
+
+        Args:
+            normalized (NormalizedText): Result of normalize()
+
+        Yields:
+            tuple: (start, end) of each match in the original text
+        """
+        for match in self._regex.finditer(normalized.canonical):
+            if match.group(0) in self.exceptions:
+                continue
+            yield normalized.original_span(match.start(), match.end())
@@ -0,0 +1,62 @@
+import re
+
+# Lowercased words that end with a period without ending the sentence
+ABBREVIATIONS = frozenset({
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "no", "nos",
+    "fig", "approx", "dept", "govt", "inc", "ltd", "co", "corp", "rs", "shri", "smt",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "e.g", "i.e", "a.m", "p.m", "u.s", "u.k",
+})
+
+# Sentence-ending punctuation (with any closing quotes or brackets) followed by
+# whitespace or the end of the text, Devanagari danda and double danda, and
+# line breaks
+_BOUNDARY = re.compile(r"[.!?]+[\"')\]”’]*(?=\s|$)|[।॥]+|\n")
+
+# The word just before a period (looked up in a bounded window)
+_LAST_WORD = re.compile(r"[\w.]+$")
+
+
+def _is_abbreviation(text, period):
+    """Whether the period at this offset ends an abbreviation or an initial"""
+    word = _LAST_WORD.search(text, max(0, period - 16), period)
+    if word is None:
+        return False
+    word = word.group(0).lower()
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+def _strip(text, start, end):
+    """Narrow a span to exclude surrounding whitespace; None if nothing is left"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if end > start else None
+
+
+def sentence_spans(text):
+    """
+    Split text into sentences in a single pass
+
+    Sentences end at line breaks, at danda, and at ".", "!" or "?" followed
+    by whitespace, except after common abbreviations ("Dr.", "e.g.") and
+    initials. Sentence-ending punctuation stays with its sentence.
+
+    Yields:
+        tuple: (start, end) offsets of each non-empty sentence, without its
+            surrounding whitespace
+    """
+    start = 0
+    for boundary in _BOUNDARY.finditer(text):
+        mark = boundary.group(0)
+        if mark == "." and _is_abbreviation(text, boundary.start()):
+            continue
+        span = _strip(text, start, boundary.start() if mark == "\n" else boundary.end())
+        if span:
+            yield span
+        start = boundary.end()
+
+    span = _strip(text, start, len(text))
+    if span:
+        yield span